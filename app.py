@@ -3,19 +3,46 @@ from pymongo import MongoClient
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
 from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from pymongo.errors import PyMongoError
 
+from article_model import SITE_TIMEZONE
+from mongo_indexes import ensure_indexes
 
 
+# A stored date as the ISO 8601 string it was scraped as, in the site's timezone
+def site_isoformat(value):
+    return (value.astimezone(SITE_TIMEZONE) if value.tzinfo else value).isoformat()
+
+
+# Dates are returned as ISO 8601 strings (Flask's default is the HTTP date format)
+class IsoDateJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return site_isoformat(o)
+        return DefaultJSONProvider.default(o)
+
 
 app = Flask(__name__)  # Initialize a Flask application
+app.json = IsoDateJSONProvider(app)
 CORS(app)
 
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")  # Establish connection with MongoDB server running locally
+client = MongoClient("mongodb://localhost:27017/", tz_aware=True)  # Establish connection with MongoDB server running locally
 db = client["almayadeen"]  # Access 'almayadeen' database
 collection = db["articles"]  # Access 'articles' collection within 'almayadeen' database
 
+# Create the indexes the endpoints below rely on (mongo_indexes.INDEXES); existing ones are left alone
+try:
+    ensure_indexes(collection)
+    # The endpoints query typed fields (real dates, int word_count, keyword lists, category/coverage)
+    if collection.find_one({"publication_date": {"$type": "string"}}, {"_id": 1}):
+        app.logger.warning("The articles collection holds untyped articles, run python schema_migration.py")
+except PyMongoError as e:
+    app.logger.warning("Could not apply the index manifest: %s", e)
+
 # Error handling function to return a standardized error response
 def handle_error(message, status_code=400):
     response = jsonify({"error": message})
@@ -29,9 +56,7 @@ def handle_error(message, status_code=400):
 def top_keywords():
     # Pipeline to unwind keywords array, group by keyword, count occurrences, sort by frequency, and limit to top 10
     pipeline = [
-        {"$unwind": "$keywords"},  # Unwind the 'keywords' array
-        {"$addFields": {"keywords": {"$split": ["$keywords", ","]}}},  # Split the keywords by comma
-        {"$unwind": "$keywords"},  # Unwind the newly split array of individual keywords
+        {"$unwind": "$keywords"},  # Unwind the 'keywords' array, one document per keyword
         {"$group": {"_id": "$keywords", "count": {"$sum": 1}}},
         # Group by each individual keyword and count occurrences
         {"$sort": {"count": -1}},  # Sort by count in descending order
@@ -69,6 +94,9 @@ def top_authors_page():
 def top_authors():
     # Pipeline to group articles by author, count the number of articles per author, sort and limit results
     pipeline = [
+        # Walk the author index and read only the author, from the index instead of the documents
+        {"$sort": {"author": 1}},
+        {"$project": {"author": 1, "_id": 0}},
         {"$group": {"_id": "$author", "count": {"$sum": 1}}},  # Groups by author, counting articles
         {"$sort": {"count": -1}},  # Sort by count of articles in descending order
         {"$limit": 10}  # Return top 10 authors
@@ -85,19 +113,14 @@ def top_authors():
 #a. Serve the Data: You also need another route to serve the data used for the chart
 @app.route('/api/articles_by_date', methods=['GET'])
 def articles_by_date():
-    # Pipeline to convert string date field into date object, group by date, and count articles per date
+    # Pipeline to group articles by publication day and count articles per date
     pipeline = [
-        {"$addFields": {
-            "publication_date": {
-                "$cond": {
-                    "if": {"$and": [{"$ne": ["$publication_date", None]}, {"$ne": ["$publication_date", ""]}]},
-                    "then": {"$dateFromString": {"dateString": "$publication_date"}},  # Converts string date to date object
-                    "else": None
-                }
-            }
-        }},
-        {"$match": {"publication_date": {"$ne": None}}},  # Filter out documents with null or invalid dates
-        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$publication_date"}},
+        {"$match": {"publication_date": {"$type": "date"}}},  # Only articles with a publication date
+        # Walk the publication_date index and read only the date, from the index instead of the documents
+        {"$sort": {"publication_date": 1}},
+        {"$project": {"publication_date": 1, "_id": 0}},
+        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$publication_date",
+                                              "timezone": "+03:00"}},  # The site's days
                     "count": {"$sum": 1}}},  # Group by date and count articles
         {"$sort": {"_id": 1}}  # Sort by date in ascending order
     ]
@@ -119,40 +142,17 @@ def articles_by_date_page():
 
 @app.route('/api/articles_by_word_count', methods=['GET'])
 def articles_by_word_count():
-    # Pipeline to clean, group articles by word count, and count occurrences
+    # Pipeline to group articles by word count, and count occurrences
     pipeline = [
         {
-            "$addFields": {
-                # Extract numeric value from word_count string and convert it to an integer, handle errors gracefully
-                "word_count_int": {
-                    "$cond": {
-                        "if": {"$and": [
-                            {"$ne": ["$word_count", None]},  # Check word_count is not None
-                            {"$ne": [{"$trim": {"input": "$word_count"}}, ""]},  # Check word_count is not empty
-                            {"$regexMatch": {"input": "$word_count", "regex": "^[0-9]+"}}  # Ensure word_count starts with a number
-                        ]},
-                        "then": {
-                            "$toInt": {
-                                "$arrayElemAt": [
-                                    {"$split": [
-                                        {"$trim": {"input": "$word_count"}},  # Remove spaces
-                                        " "
-                                    ]},
-                                    0  # Extract the first element, which is the number
-                                ]
-                            }
-                        },
-                        "else": None  # Handle invalid word counts
-                    }
-                }
-            }
+            "$match": {"word_count": {"$type": "number"}}  # Only articles with a word count
         },
         {
-            "$match": {"word_count_int": {"$ne": None}}  # Filter out documents with invalid word counts
+            "$project": {"word_count": 1, "_id": 0}  # Read only the word count, from the word_count index
         },
         {
             "$group": {
-                "_id": "$word_count_int",  # Group by the integer word count
+                "_id": "$word_count",  # Group by the word count
                 "article_count": {"$sum": 1}  # Count occurrences of each word count
             }
         },
@@ -209,19 +209,17 @@ def articles_by_language_page():
 
 @app.route('/api/articles_by_classes', methods=['GET'])
 def articles_by_classes():
-    # Pipeline to extract and count categories from the 'classes' array field
+    # Pipeline to count the articles of each category (the value of the 'category' class)
     pipeline = [
         {
-            "$unwind": "$classes"  # Unwind the 'classes' array to get each class element
+            "$match": {"category": {"$type": "string"}}  # Only articles with a category
         },
         {
-            "$match": {
-                "classes.mapping": "category"  # Only include documents where 'mapping' is 'category'
-            }
+            "$project": {"category": 1, "_id": 0}  # Read only the category, from the category index
         },
         {
             "$group": {
-                "_id": "$classes.value",  # Group by the 'value' field of 'classes'
+                "_id": "$category",  # Group by category
                 "count": {"$sum": 1}  # Count the number of articles in each category
             }
         },
@@ -247,28 +245,20 @@ def recent_articles():
     # Pipeline to sort by the publication date and limit to the 10 most recent articles
     pipeline = [
         {
-            # Add field to convert 'publication_date' to an ISODate format
-            "$addFields": {
-                "parsed_publication_date": {
-                    "$dateFromString": {
-                        "dateString": "$publication_date",
-                        "onError": None,  # Handle any parsing errors by setting the date to None
-                        "onNull": None  # Handle missing dates by setting the date to None
-                    }
-                }
-            }
+            # Only articles with a publication date
+            "$match": {"publication_date": {"$type": "date"}}
         },
         {
-            # Filter out documents where the publication date could not be parsed
-            "$match": {"parsed_publication_date": {"$ne": None}}
-        },
-        {
-            # Sort articles by 'parsed_publication_date' in descending order (most recent first)
-            "$sort": {"parsed_publication_date": -1}
+            # Sort articles by 'publication_date' in descending order (most recent first), along the index
+            "$sort": {"publication_date": -1}
         },
         {
             # Limit to the 10 most recent articles
             "$limit": 10
+        },
+        {
+            # The field the recent articles page reads
+            "$addFields": {"parsed_publication_date": "$publication_date"}
         }
     ]
 
@@ -305,7 +295,7 @@ def articles_by_keyword(keyword):
     # Define the query to search for articles containing the specific keyword
     query = {
         "keywords": {
-            "$regex": keyword,  # Use regex to search for the keyword in the keywords field
+            "$regex": keyword,  # Use regex to search for the keyword in the keywords list (scans the keywords index)
             "$options": "i"  # Case-insensitive search
         }
     }
@@ -465,7 +455,9 @@ def article_details_page(postid):
         if not article:
             return render_template('error.html', message=f"No article found with postid: {postid}")
 
-        # Render the article details template and pass the article data
+        # Render the article details template and pass the article data, with its dates as they were scraped
+        article = {key: site_isoformat(value) if isinstance(value, datetime) else value
+                   for key, value in article.items()}
         return render_template('article_details.html', article=article)
     except Exception as e:
         return handle_error(f"Error rendering article details: {str(e)}")
@@ -534,14 +526,14 @@ def articles_by_year(year):
     Returns the count of articles for the given year.
     """
     # Define the start and end dates for the year
-    start_date = f"{year}-01-01T00:00:00Z"
-    end_date = f"{year}-12-31T23:59:59Z"
+    start_date = datetime(year, 1, 1, tzinfo=SITE_TIMEZONE)
+    end_date = datetime(year + 1, 1, 1, tzinfo=SITE_TIMEZONE)
 
-    # Define the query to search for articles within the specified year
+    # Define the query to search for articles within the specified year (a range of the publication_date index)
     query = {
         "publication_date": {
             "$gte": start_date,
-            "$lte": end_date
+            "$lt": end_date
         }
     }
 
@@ -571,9 +563,16 @@ def articles_by_year_page():
     try:
         # Define the aggregation pipeline to extract distinct years from the articles' publication_date
         pipeline = [
+            {
+                "$match": {"publication_date": {"$type": "date"}}  # Only articles with a publication date
+            },
+            {
+                "$project": {"publication_date": 1, "_id": 0}  # Read only the date, from the index
+            },
             {
                 "$group": {
-                    "_id": {"$year": {"$dateFromString": {"dateString": "$publication_date"}}}  # Extract the year from publication_date
+                    # Extract the year from publication_date, in the site's timezone
+                    "_id": {"$year": {"date": "$publication_date", "timezone": "+03:00"}}
                 }
             },
             {
@@ -617,12 +616,10 @@ def longest_articles():
     # Define the aggregation pipeline
     pipeline = [
         {
-            "$addFields": {
-                "word_count_int": {"$toInt": "$word_count"}  # Convert word_count to integer for proper sorting
-            }
+            "$match": {"word_count": {"$type": "number"}}  # Only articles with a word count
         },
         {
-            "$sort": {"word_count_int": -1}  # Sort by word count in descending order
+            "$sort": {"word_count": -1}  # Sort by word count in descending order, along the word_count index
         },
         {
             "$limit": 10  # Limit to the top 10 longest articles
@@ -630,7 +627,7 @@ def longest_articles():
         {
             "$project": {
                 "title": 1,  # Include only the title in the result
-                "word_count_int": 1,  # Include the word count in the result
+                "word_count_int": "$word_count",  # Include the word count in the result
                 "_id": 0  # Exclude the MongoDB ObjectId from the result
             }
         }
@@ -662,12 +659,10 @@ def shortest_articles():
     # Define the aggregation pipeline
     pipeline = [
         {
-            "$addFields": {
-                "word_count_int": {"$toInt": "$word_count"}  # Convert word_count to integer for proper sorting
-            }
+            "$match": {"word_count": {"$type": "number"}}  # Only articles with a word count
         },
         {
-            "$sort": {"word_count_int": 1}  # Sort by word count in ascending order
+            "$sort": {"word_count": 1}  # Sort by word count in ascending order, along the word_count index
         },
         {
             "$limit": 10  # Limit to the top 10 shortest articles
@@ -675,7 +670,7 @@ def shortest_articles():
         {
             "$project": {
                 "title": 1,  # Include only the title in the result
-                "word_count_int": 1,  # Include the word count in the result
+                "word_count_int": "$word_count",  # Include the word count in the result
                 "_id": 0  # Exclude the MongoDB ObjectId from the result
             }
         }
@@ -707,19 +702,8 @@ def articles_by_keyword_count():
     # Define the aggregation pipeline
     pipeline = [
         {
-            "$addFields": {
-                "keywords_array": {
-                    "$cond": {
-                        "if": {"$isArray": "$keywords"},  # Check if 'keywords' is already an array
-                        "then": "$keywords",  # If true, use 'keywords' as is
-                        "else": {"$split": [{"$ifNull": ["$keywords", ""]}, ","]}  # Convert to array if it is a string
-                    }
-                }
-            }
-        },
-        {
-            "$addFields": {
-                "keyword_count": {"$size": "$keywords_array"}  # Count the number of keywords in each article
+            "$project": {
+                "keyword_count": {"$size": {"$ifNull": ["$keywords", []]}}  # Count the number of keywords in each article
             }
         },
         {
@@ -787,7 +771,8 @@ def total_articles_count():
     Returns the total count in JSON format.
     """
     try:
-        total_count = collection.count_documents({})  # Count all documents
+        # From the collection metadata: counting the documents would read all of them
+        total_count = collection.estimated_document_count()
         return jsonify({"count": total_count})
     except Exception as e:
         return handle_error(f"Error fetching total articles count: {str(e)}")
@@ -813,18 +798,10 @@ def articles_updated_after_publication():
     """
     # Define the aggregation pipeline
     pipeline = [
-        {
-            "$addFields": {
-                "publication_date": {
-                    "$dateFromString": {"dateString": "$publication_date"}  # Convert publication_date to a date object
-                },
-                "last_updated_date": {
-                    "$dateFromString": {"dateString": "$last_updated_date"}  # Convert last_updated_date to a date object
-                }
-            }
-        },
         {
             "$match": {
+                "publication_date": {"$type": "date"},  # Only articles with both dates
+                "last_updated_date": {"$type": "date"},
                 "$expr": {
                     "$gt": ["$last_updated_date", "$publication_date"]  # Match documents where last_updated_date > publication_date
                 }
@@ -863,13 +840,7 @@ def articles_by_coverage(coverage):
     # Define the aggregation pipeline
     pipeline = [
         {
-            "$unwind": "$classes"  # Deconstruct the 'classes' array field
-        },
-        {
-            "$match": {
-                "classes.mapping": "coverage",  # Match documents where the 'mapping' is 'coverage'
-                "classes.value": coverage  # Match documents where the 'value' is the specified coverage
-            }
+            "$match": {"coverage": coverage}  # Articles with this coverage, looked up in the coverage index
         },
         {
             "$project": {
@@ -906,31 +877,22 @@ def popular_keywords_last_X_days(days):
         # Calculate the date X days ago from today
         start_date = datetime.utcnow() - timedelta(days=days)
 
-        # Convert start_date to ISO 8601 string for MongoDB query
-        start_date_str = start_date.isoformat()
-
         # Define the aggregation pipeline
         pipeline = [
-            # Match articles published in the last X days
+            # Match articles published in the last X days (a range of the publication_date index)
             {
                 "$match": {
-                    "publication_date": {"$gte": start_date_str}
-                }
-            },
-            # Split the comma-separated keywords into an array
-            {
-                "$addFields": {
-                    "keywords_array": {"$split": ["$keywords", ","]}
+                    "publication_date": {"$gte": start_date}
                 }
             },
-            # Unwind the keywords array to process each keyword individually
+            # Unwind the keywords list to process each keyword individually
             {
-                "$unwind": "$keywords_array"
+                "$unwind": "$keywords"
             },
             # Group by each keyword and count occurrences
             {
                 "$group": {
-                    "_id": "$keywords_array",
+                    "_id": "$keywords",
                     "count": {"$sum": 1}
                 }
             },
@@ -971,16 +933,17 @@ def articles_by_month(year, month):
     Returns a JSON object with the count of articles.
     """
     # Define the start and end dates for the given month
-    start_date = datetime(year, month, 1)
-    end_date = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+    start_date = datetime(year, month, 1, tzinfo=SITE_TIMEZONE)
+    end_date = datetime(year, month + 1, 1, tzinfo=SITE_TIMEZONE) if month < 12 else \
+        datetime(year + 1, 1, 1, tzinfo=SITE_TIMEZONE)
 
     # Define the aggregation pipeline
     pipeline = [
         {
             "$match": {
                 "publication_date": {
-                    "$gte": start_date.isoformat(),
-                    "$lt": end_date.isoformat()
+                    "$gte": start_date,
+                    "$lt": end_date
                 }
             }
         },
@@ -1017,14 +980,9 @@ def articles_by_word_count_range(min_word_count, max_word_count):
     """
     # Define the aggregation pipeline
     pipeline = [
-        {
-            "$addFields": {
-                "word_count_int": {"$toInt": "$word_count"}  # Ensure word_count is an integer
-            }
-        },
         {
             "$match": {
-                "word_count_int": {
+                "word_count": {  # A range of the word_count index
                     "$gte": min_word_count,
                     "$lte": max_word_count
                 }
@@ -1059,7 +1017,8 @@ def articles_by_word_count_range_page():
 def longest_article_word_count():
     try:
         # Find the article with the maximum word count
-        longest_article = collection.find_one({}, sort=[("word_count", -1)], projection={"word_count": 1})
+        longest_article = collection.find_one({"word_count": {"$type": "number"}}, sort=[("word_count", -1)],
+                                              projection={"word_count": 1})
         return jsonify({"longest_word_count": int(longest_article['word_count'])})
     except Exception as e:
         return jsonify({"error": f"Error fetching longest article word count: {str(e)}"})
@@ -1143,29 +1102,7 @@ def articles_with_specific_keyword_count(count):
     pipeline = [
         {
             "$match": {
-                "keywords": {"$ne": None}  # Ensure the 'keywords' field is not null or missing
-            }
-        },
-        {
-            "$addFields": {
-                "keywords_array": {
-                    "$filter": {
-                        "input": {"$split": ["$keywords", ","]},  # Split the keywords string into an array
-                        "as": "keyword",
-                        "cond": {"$ne": [{"$trim": {"input": "$$keyword"}}, ""]}
-                        # Remove empty keywords and trim spaces
-                    }
-                }
-            }
-        },
-        {
-            "$addFields": {
-                "keyword_count": {"$size": "$keywords_array"}  # Count the number of keywords in the array
-            }
-        },
-        {
-            "$match": {
-                "keyword_count": count  # Match documents where the keyword count is exactly as specified
+                "keywords": {"$size": count}  # Match documents whose keyword list has exactly count keywords
             }
         },
         {
@@ -1196,16 +1133,13 @@ def articles_by_specific_date(date):
     """
     try:
         # Check if the input date is in correct format
-        target_date = datetime.strptime(date, '%Y-%m-%d')
-
-        # MongoDB query to match the date part of publication_date (ignoring the time)
-        # Check if the input date is in correct format
-        target_date = datetime.strptime(date, '%Y-%m-%d')
+        target_date = datetime.strptime(date, '%Y-%m-%d').replace(tzinfo=SITE_TIMEZONE)
 
-        # MongoDB query to match the date part of publication_date (ignoring the time)
+        # MongoDB query to match the day of publication_date (a range of the publication_date index)
         query = {
             "publication_date": {
-                "$regex": f"^{date}"  # Match the date as a string (e.g., "2024-09-04")
+                "$gte": target_date,
+                "$lt": target_date + timedelta(days=1)
             }
         }
 
@@ -1282,33 +1216,14 @@ def articles_with_more_than(word_count):
         pipeline = [
             {
                 "$match": {
-                    "word_count": {
-                        "$exists": True,  # Ensure the word_count field exists
-                        "$ne": None  # Ensure the word_count is not null
-                    }
-                }
-            },
-            {
-                "$addFields": {
-                    "word_count_int": {
-                        "$cond": {
-                            "if": {"$isNumber": "$word_count"},
-                            "then": "$word_count",
-                            "else": {"$toInt": "$word_count"}
-                        }
-                    }
-                }
-            },
-            {
-                "$match": {
-                    "word_count_int": {"$gt": word_count}
-                    # Filter articles where the converted word_count is greater than the specified value
+                    "word_count": {"$gt": word_count}
+                    # Filter articles where the word_count is greater than the specified value (uses the index)
                 }
             },
             {
                 "$project": {
                     "title": 1,
-                    "word_count_int": 1,
+                    "word_count_int": "$word_count",
                     "_id": 0
                 }
             }
@@ -1343,9 +1258,9 @@ def articles_grouped_by_coverage():
     try:
         # Aggregation pipeline to group articles by coverage and count them
         pipeline = [
-            {"$unwind": "$classes"},  # Deconstructs the classes array
-            {"$match": {"classes.mapping": "coverage"}},  # Filter for coverage mapping
-            {"$group": {"_id": "$classes.value", "count": {"$sum": 1}}},  # Group by coverage value and count
+            {"$match": {"coverage": {"$type": "string"}}},  # Only articles with a coverage
+            {"$project": {"coverage": 1, "_id": 0}},  # Read only the coverage, from the coverage index
+            {"$group": {"_id": "$coverage", "count": {"$sum": 1}}},  # Group by coverage value and count
             {"$sort": {"count": -1}}  # Sort by count in descending order
         ]
 
@@ -1370,12 +1285,9 @@ def articles_last_X_hours(hours):
     # Calculate the timestamp for X hours ago from now
     start_time = datetime.utcnow() - timedelta(hours=hours)
 
-    # Convert the timestamp to ISO 8601 string format
-    start_time_str = start_time.isoformat() + 'Z'
-
-    # Define the query to filter articles published after the start_time
+    # Define the query to filter articles published after the start_time (a range of the publication_date index)
     query = {
-        "publication_date": {"$gte": start_time_str}
+        "publication_date": {"$gte": start_time}
     }
 
     try:
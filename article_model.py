@@ -0,0 +1,188 @@
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Optional
+
+
+# The TypedArticle class is the Article normalized once, when it is scraped or ingested, instead of on
+# every API request:
+#
+#   keywords          'a, b,c' (comma-joined string)       -> ['a', 'b', 'c']
+#   word_count        '169' / '169 words'                  -> 169
+#   publication_date,
+#   last_updated_date '2024-09-09T00:58:00+03:00'          -> datetime (timezone aware, UTC in MongoDB)
+#   category,
+#   coverage          the values of the classes whose mapping is 'category' / 'coverage'
+#
+# The other fields are kept as they are (classes too, for the endpoints that count every class value).
+# It uses __slots__, so a million articles in memory don't each carry a __dict__.
+#
+#   to_document() / to_bson()  MongoDB document with real dates (bson ships with pymongo)
+#   to_json() / from_json()    one JSONL line, dates as ISO 8601 strings
+#   from_document()            accepts raw scraped dicts (the JSON dumps, old documents) and typed ones
+
+_WORD_COUNT_PATTERN = re.compile(r'\s*(\d+)')
+
+DATE_FIELDS = ('publication_date', 'last_updated_date')
+
+# The site publishes its dates at +03:00: the API counts days, months and years in that timezone
+SITE_TIMEZONE = timezone(timedelta(hours=3))
+
+
+def parse_keywords(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    keywords = []
+    for keyword in value:
+        keyword = keyword.strip() if isinstance(keyword, str) else keyword
+        if keyword:
+            keywords.append(keyword)
+    return keywords
+
+
+def parse_word_count(value) -> Optional[int]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    match = _WORD_COUNT_PATTERN.match(str(value))
+    return int(match.group(1)) if match else None
+
+
+def parse_date(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        # fromisoformat() of Python < 3.11 does not accept a trailing Z
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def class_value(classes, mapping: str) -> Optional[str]:
+    for entry in classes or []:
+        if isinstance(entry, dict) and entry.get('mapping') == mapping:
+            return entry.get('value')
+    return None
+
+
+class TypedArticle:
+    __slots__ = ('url', 'post_id', 'title', 'keywords', 'thumbnail', 'publication_date', 'last_updated_date',
+                 'author', 'full_article_text', 'video_duration', 'word_count', 'lang', 'description',
+                 'classes', 'category', 'coverage')
+
+    def __init__(self,
+                 url: str,
+                 post_id: Optional[str] = None,
+                 title: Optional[str] = None,
+                 keywords: Optional[List[str]] = None,
+                 thumbnail: Optional[str] = None,
+                 publication_date: Optional[datetime] = None,
+                 last_updated_date: Optional[datetime] = None,
+                 author: Optional[str] = None,
+                 full_article_text: str = '',
+                 video_duration: Optional[str] = None,
+                 word_count: Optional[int] = None,
+                 lang: Optional[str] = None,
+                 description: Optional[str] = None,
+                 classes: Optional[list] = None,
+                 category: Optional[str] = None,
+                 coverage: Optional[str] = None):
+        self.url = url
+        self.post_id = post_id
+        self.title = title
+        self.keywords = keywords if keywords is not None else []
+        self.thumbnail = thumbnail
+        self.publication_date = publication_date
+        self.last_updated_date = last_updated_date
+        self.author = author
+        self.full_article_text = full_article_text
+        self.video_duration = video_duration
+        self.word_count = word_count
+        self.lang = lang
+        self.description = description
+        self.classes = classes if classes is not None else []
+        self.category = category
+        self.coverage = coverage
+
+    # Normalizes a scraped Article (web_scraper.Article)
+    @classmethod
+    def from_article(cls, article) -> 'TypedArticle':
+        return cls.from_document(article.__dict__)
+
+    # Normalizes a dict with the Article fields, raw (strings) or already typed
+    @classmethod
+    def from_document(cls, document: dict) -> 'TypedArticle':
+        classes = document.get('classes') or []
+        post_id = document.get('post_id')
+        return cls(
+            url=document.get('url'),
+            post_id=str(post_id) if post_id is not None else None,
+            title=document.get('title'),
+            keywords=parse_keywords(document.get('keywords')),
+            thumbnail=document.get('thumbnail'),
+            publication_date=parse_date(document.get('publication_date')),
+            last_updated_date=parse_date(document.get('last_updated_date')),
+            author=document.get('author'),
+            full_article_text=document.get('full_article_text') or '',
+            video_duration=document.get('video_duration'),
+            word_count=parse_word_count(document.get('word_count')),
+            lang=document.get('lang'),
+            description=document.get('description'),
+            classes=classes,
+            category=document.get('category') or class_value(classes, 'category'),
+            coverage=document.get('coverage') or class_value(classes, 'coverage'),
+        )
+
+    # MongoDB document; dates stay datetime objects (stored as BSON dates)
+    def to_document(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_bson(self) -> bytes:
+        import bson
+        return bson.encode(self.to_document())
+
+    @classmethod
+    def from_bson(cls, data: bytes) -> 'TypedArticle':
+        import bson
+        from bson.codec_options import CodecOptions
+        return cls.from_document(bson.decode(data, CodecOptions(tz_aware=True)))
+
+    def to_json(self) -> str:
+        document = self.to_document()
+        for name in DATE_FIELDS:
+            if document[name] is not None:
+                document[name] = document[name].isoformat()
+        return json.dumps(document, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, line: str) -> 'TypedArticle':
+        return cls.from_document(json.loads(line))
+
+    def __eq__(self, other):
+        if not isinstance(other, TypedArticle):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f'TypedArticle(url={self.url!r}, post_id={self.post_id!r}, title={self.title!r})'
+
+
+# Writes articles as JSON lines to a text file object; returns the number written
+def write_jsonl(articles: Iterable[TypedArticle], f) -> int:
+    count = 0
+    for article in articles:
+        f.write(article.to_json() + '\n')
+        count += 1
+    return count
+
+
+def iter_jsonl(f) -> Iterator[TypedArticle]:
+    for line in f:
+        if line.strip():
+            yield TypedArticle.from_json(line)
@@ -0,0 +1,55 @@
+"""
+Articles/sec of web_scraper.main() against the local stub site at several concurrency levels.
+
+    python benchmarks/bench_async_crawl.py --articles 400 --latency 0.05 --levels 1 4 16 64
+
+With --parser-processes N the crawl runs as the fetch/parse/write pipeline (crawl_pipeline.py).
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_scraper
+from http_transport import HttpTransport
+from stub_site import StubSite, load_dump
+
+
+def run(levels, articles, latency, months, parser_processes=0):
+    dump = load_dump()[:articles]
+    results = []
+    with StubSite(dump, months=months, latency=latency) as site, tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)  # FileUtility writes into ./data
+        try:
+            for concurrency in levels:
+                transport = HttpTransport(pool_maxsize=max(10, concurrency))
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    start = time.perf_counter()
+                    scraped = web_scraper.main(site.index_url, max_articles=len(dump), concurrency=concurrency,
+                                               transport=transport, parser_processes=parser_processes)
+                    elapsed = time.perf_counter() - start
+                stats = transport.connection_stats()
+                transport.close()
+                results.append((concurrency, scraped, elapsed))
+                print(f"concurrency={concurrency:>4}  articles={scraped:>5}  "
+                      f"time={elapsed:8.2f}s  rate={scraped / elapsed:8.1f} articles/sec  "
+                      f"new_conn={stats['new_connections']}  reused_conn={stats['reused_connections']}")
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=400, help="Number of articles served by the stub site")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds of simulated round trip per request")
+    parser.add_argument('--months', type=int, default=4, help="Number of monthly sitemaps")
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 4, 16, 64], help="Concurrency levels to time")
+    parser.add_argument('--parser-processes', type=int, default=0, help="Parser processes of the pipeline mode")
+    args = parser.parse_args()
+    run(args.levels, args.articles, args.latency, args.months, args.parser_processes)
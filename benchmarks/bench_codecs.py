@@ -0,0 +1,89 @@
+"""
+Size against write and read speed of the corpus codecs (corpus_shards.py) on the shipped article dump,
+repeated --copies times to reach a realistic corpus size, with the indent=4 gzip JSON of
+FileUtility.save_articles_to_json as the baseline. Reads are timed with one reader and with --workers.
+
+    python benchmarks/bench_codecs.py --copies 10 --shard-size 8M --workers 4
+    python benchmarks/bench_codecs.py --codecs zstd:1 zstd:3 zstd:9 brotli:5 brotli:9
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus_shards import CODECS, ShardedCorpusWriter, iter_corpus, parse_size
+from stub_site import load_dump
+
+
+def corpus(articles, copies):
+    for copy in range(copies):
+        for article in articles:
+            yield dict(article, post_id=f"{article.get('post_id')}-{copy}") if copy else article
+
+
+def measure_baseline(articles, copies, directory):
+    path = os.path.join(directory, 'baseline.json.gz')
+    start = time.perf_counter()
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(list(corpus(articles, copies)), f, ensure_ascii=False, indent=4)
+    write_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        count = len(json.load(f))
+    read_seconds = time.perf_counter() - start
+    return os.path.getsize(path), write_seconds, read_seconds, count
+
+
+def measure_codec(articles, copies, directory, codec, level, shard_size, threads, workers):
+    target = os.path.join(directory, f'{codec}-{level}')
+    start = time.perf_counter()
+    with ShardedCorpusWriter(target, codec=codec, level=level, shard_size=shard_size, threads=threads) as writer:
+        writer.write_many(corpus(articles, copies))
+    write_seconds = time.perf_counter() - start
+    size = sum(shard['compressed_bytes'] for shard in writer.manifest['shards'])
+    read_seconds = {}
+    for readers in sorted({1, workers}):
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_corpus(target, workers=readers))
+        read_seconds[readers] = time.perf_counter() - start
+        assert count == writer.manifest['articles'], (count, writer.manifest['articles'])
+    return size, len(writer.manifest['shards']), write_seconds, read_seconds, writer.manifest['articles']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--copies', type=int, default=10, help="Times the 2K dump is repeated")
+    parser.add_argument('--codecs', nargs='+', default=['gzip', 'zstd', 'zstd:9', 'brotli', 'brotli:9'],
+                        help="codec or codec:level")
+    parser.add_argument('--shard-size', type=parse_size, default='8M')
+    parser.add_argument('--threads', type=int, default=-1, help="zstd compression threads")
+    parser.add_argument('--workers', type=int, default=4, help="Parallel shard readers")
+    args = parser.parse_args()
+
+    articles = load_dump()
+    with tempfile.TemporaryDirectory() as directory:
+        size, write_seconds, read_seconds, count = measure_baseline(articles, args.copies, directory)
+        print(f"{count} articles, {args.workers} readers, shards of {args.shard_size / 2 ** 20:.0f} MB")
+        print(f"{'codec':<12}{'MB':>8}{'shards':>8}{'write docs/s':>14}{'read docs/s':>13}"
+              f"{'parallel docs/s':>17}")
+        print(f"{'json indent':<12}{size / 2 ** 20:>8.1f}{1:>8}{count / write_seconds:>14,.0f}"
+              f"{count / read_seconds:>13,.0f}{'-':>17}")
+        for spec in args.codecs:
+            name, _, level = spec.partition(':')
+            codec = CODECS[name]
+            if not codec.available:
+                print(f"{spec:<12} skipped, {'zstandard' if name == 'zstd' else name} is not installed")
+                continue
+            level = int(level) if level else codec.default_level
+            size, shards, write_seconds, read_seconds, count = measure_codec(
+                articles, args.copies, directory, name, level, args.shard_size, args.threads, args.workers)
+            print(f"{name + ':' + str(level):<12}{size / 2 ** 20:>8.1f}{shards:>8}"
+                  f"{count / write_seconds:>14,.0f}{count / read_seconds[1]:>13,.0f}"
+                  f"{count / read_seconds[args.workers]:>17,.0f}")
@@ -0,0 +1,143 @@
+"""
+Golden-file equivalence check and throughput comparison of the two ArticleScraper engines.
+
+Every page is parsed with the reference 'soup' engine (full html.parser tree) and the 'fast'
+lxml engine; the script fails if any page yields a different Article. Pages come from the saved
+almayadeen.net pages of benchmarks/pages/ (*.html, the real site markup), the stub site renderer
+(built from the 2K dump) and a set of hand-written edge cases.
+
+--from-archive saves the article pages of an HTTP archive recorded from the real site
+(python web_scraper.py --record-archive ...) into the pages directory:
+
+    python benchmarks/bench_fast_extractor.py --from-archive data/http_archive.warc.gz --limit 20
+    python benchmarks/bench_fast_extractor.py --articles 300
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_archive import HttpArchive
+from web_scraper import ArticleScraper
+from stub_site import load_dump, render_article_page
+
+PAGES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+METADATA = ('{"type": "article", "postid": "1", "title": "T", "keywords": "a,b", "lang": "%s", '
+            '"word_count": "3", "classes": []}')
+
+# Pages exercising the corners of the extraction rules
+EDGE_CASES = {
+    'comment_and_script_in_paragraph': (
+        '<html><head><script type="text/tawsiyat">' + METADATA % 'en' + '</script></head><body>'
+        '<section class="read-section"><div class="p-content">'
+        '<p>one <!-- hidden --> two<script>var x = 1;</script> three</p>'
+        '<p>with <b>bold</b> and <a href="#">link</a> tail</p>'
+        '</div></section></body></html>'),
+    'unwanted_blocks_inside_content': (
+        '<html><head><script type="text/tawsiyat">' + METADATA % 'ar' + '</script></head><body>'
+        '<section class="read-section other"><div class="p-content extra">'
+        '<p>first</p><div class="post_disclaimer"><p>drop me</p></div>after disclaimer'
+        '<p class="lg_para summary">summary</p><p>second &amp; &nbsp;entities</p>'
+        '</div></section></body></html>'),
+    'section_inside_removed_column': (
+        '<html><head><script type="text/tawsiyat">' + METADATA % 'en' + '</script></head><body>'
+        '<div class="col-4"><section class="read-section"><div class="p-content"><p>gone</p></div></section></div>'
+        '</body></html>'),
+    'not_an_article': (
+        '<html><head><script type="text/tawsiyat">{"type": "video"}</script></head><body></body></html>'),
+    'missing_metadata': '<html><body><section class="read-section"></section></body></html>',
+    'broken_metadata': '<html><head><script type="text/tawsiyat">{not json</script></head></html>',
+    'empty_metadata': '<html><head><script type="text/tawsiyat"></script></head></html>',
+    'missing_content_div': (
+        '<html><head><script type="text/tawsiyat">' + METADATA % 'en' + '</script></head><body>'
+        '<section class="read-section"><div class="p-body"><p>x</p></div></section></body></html>'),
+    'windows_1256_page': (
+        '<html><head><meta charset="windows-1256"><script type="text/tawsiyat">' + METADATA % 'ar' +
+        '</script></head><body><section class="read-section"><div class="p-content"><p>سوريا</p>'
+        '</div></section></body></html>'),
+}
+
+
+def collect_pages(articles, pages_directory):
+    pages = [(f'stub-{i}', render_article_page(article)) for i, article in enumerate(articles)]
+    for name, markup in EDGE_CASES.items():
+        encoding = 'windows-1256' if 'windows_1256' in name else 'utf-8'
+        pages.append((name, markup.encode(encoding)))
+    if pages_directory:
+        for path in sorted(glob.glob(os.path.join(pages_directory, '*.html'))):
+            with open(path, 'rb') as f:
+                pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+# Saves up to limit article pages (HTML answered with 200) of the archive; returns the number saved
+def save_archived_pages(archive_path, pages_directory, limit):
+    os.makedirs(pages_directory, exist_ok=True)
+    archive = HttpArchive(archive_path)
+    saved = 0
+    try:
+        for url in sorted(archive.urls()):
+            if saved >= limit:
+                break
+            response = archive.get(url)
+            content_type = {name.lower(): value for name, value in response.headers.items()}.get('content-type', '')
+            if response.status != 200 or 'html' not in content_type:
+                continue
+            name = url.rstrip('/').rsplit('/', 1)[-1][:60] or 'index'
+            filename = f'{name}-{hashlib.sha256(url.encode("utf-8")).hexdigest()[:8]}.html'
+            with open(os.path.join(pages_directory, filename), 'wb') as f:
+                f.write(response.body)
+            saved += 1
+    finally:
+        archive.close()
+    return saved
+
+
+def parse_all(scraper, pages):
+    return [scraper.parse_article(f'https://example.test/{name}', content) for name, content in pages]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=300, help="Number of stub pages rendered from the dump")
+    parser.add_argument('--pages', default=PAGES_DIRECTORY, help="Directory with saved article pages (*.html)")
+    parser.add_argument('--from-archive', help="Save the article pages of this HTTP archive into --pages and exit")
+    parser.add_argument('--limit', type=int, default=20, help="Pages saved by --from-archive")
+    args = parser.parse_args()
+
+    if args.from_archive:
+        print(f"{save_archived_pages(args.from_archive, args.pages, args.limit)} pages saved to {args.pages}")
+        sys.exit(0)
+
+    saved_pages = glob.glob(os.path.join(args.pages, '*.html'))
+    if not saved_pages:
+        print(f"WARNING: no saved pages in {args.pages}, only the stub and edge case pages are compared "
+              f"(save real pages with --from-archive)")
+    pages = collect_pages(load_dump()[:args.articles], args.pages)
+    reference = ArticleScraper(engine='soup')
+    fast = ArticleScraper(engine='fast')
+
+    timings = {}
+    results = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, scraper in (('soup', reference), ('fast', fast)):
+            start = time.perf_counter()
+            results[name] = parse_all(scraper, pages)
+            timings[name] = time.perf_counter() - start
+
+    mismatches = [name for (name, _), expected, actual in zip(pages, results['soup'], results['fast'])
+                  if expected != actual]
+    for name in mismatches:
+        print(f"MISMATCH: {name}")
+    print(f"{len(pages)} pages ({len(saved_pages)} saved), {len(pages) - len(mismatches)} identical")
+    for name, elapsed in timings.items():
+        print(f"{name:>5} engine: {elapsed:6.2f}s  {len(pages) / elapsed:8.1f} pages/sec")
+    print(f"speedup {timings['soup'] / timings['fast']:.1f}x")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,78 @@
+"""
+Memory per million URLs of the URL frontier (url_frontier.py) against a plain Python set of the URLs,
+the measured false-positive rate of its Bloom filter, and the claim throughput of the shared SQLite index.
+
+    python benchmarks/bench_frontier.py --urls 1000000 --error-rates 0.01 0.001 --claim-urls 200000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from url_frontier import BloomFilter, UrlFrontier
+
+
+def article_url(index):
+    # Shaped like the real article URLs (quoted Arabic slug)
+    return (f'https://www.almayadeen.net/news/politics/{index}/%D8%A7%D9%84%D8%B1%D8%A6%D9%8A%D8%B3-'
+            f'%D9%8A%D9%84%D8%AA%D9%82%D9%8A-{index * 7919 % 100003}')
+
+
+def measure_set(count):
+    tracemalloc.start()
+    urls = {article_url(index) for index in range(count)}
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del urls
+    return size
+
+
+def measure_bloom(count, error_rate):
+    bloom = BloomFilter(count, error_rate)
+    start = time.perf_counter()
+    for index in range(count):
+        bloom.add(article_url(index))
+    add_seconds = time.perf_counter() - start
+    probes = min(count, 100000)
+    false_positives = sum(article_url(count + index) in bloom for index in range(probes))
+    return bloom, add_seconds, false_positives / probes
+
+
+def measure_claims(count, error_rate):
+    with tempfile.TemporaryDirectory() as directory:
+        frontier = UrlFrontier(os.path.join(directory, 'frontier.sqlite3'), capacity=count, error_rate=error_rate)
+        urls = [article_url(index) for index in range(count)]
+        start = time.perf_counter()
+        for position in range(0, count, 1000):
+            frontier.claim(urls[position:position + 1000], 'first')
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for position in range(0, count, 1000):
+            frontier.claim(urls[position:position + 1000], 'second')
+        again = time.perf_counter() - start
+        frontier.close()
+    return count / first, count / again
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--urls', type=int, default=1000000)
+    parser.add_argument('--error-rates', type=float, nargs='+', default=[0.01, 0.001])
+    parser.add_argument('--claim-urls', type=int, default=200000, help="URLs claimed through the SQLite index")
+    args = parser.parse_args()
+
+    per_million = 1e6 / args.urls
+    set_bytes = measure_set(args.urls)
+    print(f"python set : {set_bytes * per_million / 2 ** 20:8.1f} MB per million URLs")
+    for error_rate in args.error_rates:
+        bloom, add_seconds, measured = measure_bloom(args.urls, error_rate)
+        print(f"bloom {error_rate:<6}: {bloom.nbytes * per_million / 2 ** 20:8.2f} MB per million URLs, "
+              f"{bloom.num_hashes} hashes, measured false positives {measured:.4%}, "
+              f"{args.urls / add_seconds:,.0f} adds/sec")
+    new_rate, known_rate = measure_claims(args.claim_urls, args.error_rates[0])
+    print(f"frontier   : {new_rate:,.0f} new URLs claimed/sec, {known_rate:,.0f} known URLs checked/sec")
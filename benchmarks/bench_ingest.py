@@ -0,0 +1,61 @@
+"""
+Ingest throughput of data_storage.parallel_load against a running MongoDB: the shipped article dump,
+repeated --copies times with distinct post_ids, is written as a gzip corpus (corpus_shards.py) and loaded
+with each number of --workers processes into a scratch collection that is dropped before every run.
+
+    python benchmarks/bench_ingest.py --copies 25 --workers 1 2 4 8 --writers 2 --batch-size 1000
+    python benchmarks/bench_ingest.py --mongo-uri mongodb://db-host:27017/ --raw-articles
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pymongo
+from pymongo.errors import ServerSelectionTimeoutError
+
+from bench_codecs import corpus
+from corpus_shards import ShardedCorpusWriter, parse_size
+from data_storage import parallel_load
+from stub_site import load_dump
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--copies', type=int, default=25)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="Process counts to compare")
+    parser.add_argument('--writers', type=int, default=2, help="Concurrent insert_many calls per process")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--shard-size', type=parse_size, default='8M')
+    parser.add_argument('--raw-articles', action='store_true', help="Load the scraped strings, not typed articles")
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--mongo-database', default='almayadeen_bench')
+    parser.add_argument('--mongo-collection', default='ingest')
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(args.mongo_uri, serverSelectionTimeoutMS=3000)
+    try:
+        client.admin.command('ping')
+    except ServerSelectionTimeoutError as e:
+        sys.exit(f"MongoDB is not reachable at {args.mongo_uri}: {e}")
+    collection = client[args.mongo_database][args.mongo_collection]
+
+    with tempfile.TemporaryDirectory() as directory:
+        with ShardedCorpusWriter(directory, codec='gzip', shard_size=args.shard_size) as writer:
+            count = writer.write_many(corpus(load_dump(), args.copies))
+        print(f"{count} articles in {len(writer.manifest['shards'])} shards, "
+              f"writers={args.writers} batch_size={args.batch_size}")
+        print(f"{'workers':>8} {'inserted':>9} {'failed':>7} {'seconds':>8} {'docs/sec':>9} {'speedup':>8}")
+        baseline = None
+        for workers in args.workers:
+            collection.drop()
+            stats = parallel_load(directory, workers, args.writers, args.mongo_uri, args.mongo_database,
+                                  args.mongo_collection, args.batch_size, not args.raw_articles)
+            baseline = baseline or stats['docs_per_sec']
+            print(f"{workers:>8} {stats['inserted']:>9} {stats['failed']:>7} {stats['seconds']:>8.2f} "
+                  f"{stats['docs_per_sec']:>9.0f} {stats['docs_per_sec'] / baseline:>7.2f}x")
+    collection.drop()
+    client.close()
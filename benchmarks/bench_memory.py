@@ -0,0 +1,112 @@
+"""
+Memory check of a long crawl: the stub site is recorded into an HTTP archive once, then web_scraper.main()
+replays it --passes times in this process while a thread samples tracemalloc and the RSS.
+Exits with status 1 when the traced memory of the last quarter of the crawl is more than --max-growth-mb
+above the second quarter (after the warm-up), i.e. when something keeps pages, trees or articles alive.
+
+    python benchmarks/bench_memory.py --articles 1000 --passes 3 --concurrency 8 --max-growth-mb 5
+    python benchmarks/bench_memory.py --memory-budget 0      # without the in-flight byte budget
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_scraper
+from bench_replay_crawl import record
+from crawl_metrics import CrawlMetrics
+from http_archive import HttpArchive, ReplayTransport
+from stub_site import load_dump
+
+
+def rss_bytes():
+    # Linux only; None elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class Sampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []  # (traced bytes, rss bytes)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.samples.append((tracemalloc.get_traced_memory()[0], rss_bytes()))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def quarter_mean(samples, quarter, index):
+    size = max(1, len(samples) // 4)
+    values = [sample[index] for sample in samples[quarter * size:(quarter + 1) * size] if sample[index] is not None]
+    return statistics.mean(values) if values else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--passes', type=int, default=3, help="Times the archive is crawled")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--engine', choices=web_scraper.ArticleScraper.ENGINES, default='soup')
+    parser.add_argument('--memory-budget', type=int, default=64, help="MB, 0 for no in-flight byte budget")
+    parser.add_argument('--interval', type=float, default=0.2, help="Seconds between samples")
+    parser.add_argument('--max-growth-mb', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stub.warc.gz')
+        index_url, recorded = record(load_dump()[:args.articles], path)
+        print(f"recorded {recorded} articles, archive {os.path.getsize(path)} bytes")
+
+        metrics = CrawlMetrics()
+        tracemalloc.start()
+        sampler = Sampler(args.interval)
+        sampler.start()
+        start = time.perf_counter()
+        cwd = os.getcwd()
+        try:
+            for run in range(args.passes):
+                with tempfile.TemporaryDirectory() as workdir:
+                    os.chdir(workdir)
+                    transport = ReplayTransport(HttpArchive(path))
+                    try:
+                        web_scraper.main(index_url, max_articles=args.articles, concurrency=args.concurrency,
+                                         transport=transport, engine=args.engine, metrics=metrics,
+                                         memory_budget=args.memory_budget * 2 ** 20)
+                    finally:
+                        os.chdir(cwd)
+                        transport.close()
+        finally:
+            sampler.stop()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    samples = sampler.samples
+    if len(samples) < 8:
+        sys.exit(f"only {len(samples)} samples, lower --interval or raise --articles/--passes")
+    traced = [quarter_mean(samples, quarter, 0) for quarter in range(4)]
+    rss = [quarter_mean(samples, quarter, 1) for quarter in range(4)]
+    growth = (traced[3] - traced[1]) / 2 ** 20
+    print(f"{metrics.pages} pages in {elapsed:.1f}s, {len(samples)} samples, traced peak {peak / 2 ** 20:.1f} MB")
+    print("traced MB by quarter: " + '  '.join(f'{value / 2 ** 20:.1f}' for value in traced))
+    if any(rss):
+        print("RSS MB by quarter:    " + '  '.join(f'{value / 2 ** 20:.1f}' for value in rss))
+    print(f"growth from the 2nd to the 4th quarter: {growth:+.2f} MB (limit {args.max_growth_mb} MB)")
+    if growth > args.max_growth_mb:
+        sys.exit(1)
@@ -0,0 +1,198 @@
+"""
+Throughput, per-stage time and peak memory of the ArticleScraper extraction engines, over a corpus
+of Arabic and English article pages. Results are written as JSON so parser changes can be compared
+run over run (--compare a previous result file).
+
+Stages (seconds per page, see ArticleScraper.parse_page):
+    parse           building the tree (BeautifulSoup html.parser, or UnicodeDammit + lxml)
+    decompose       removing the UNWANTED_SELECTORS blocks
+    select          finding the metadata script and the read-section paragraphs
+    metadata_json   json.loads of the text/tawsiyat metadata
+    paragraph_join  ordering and joining the paragraphs into the Article
+
+The corpus is, in this order of preference, saved pages (--pages DIR of *.html), the HTML responses
+of an HTTP archive (--archive, see http_archive.py), or pages rendered from the 2K dump: every dump
+article as an Arabic page plus an English page with the same structure and word counts.
+
+    python benchmarks/bench_parser.py --articles 300 --engines soup fast
+    python benchmarks/bench_parser.py --archive data/http_archive.warc.gz --compare benchmarks/results/old.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_scraper
+from http_archive import HttpArchive
+from web_scraper import ArticleScraper
+from stub_site import load_dump, render_article_page
+
+STAGES = ('parse', 'decompose', 'select', 'metadata_json', 'paragraph_join')
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+ENGLISH_WORDS = ('the', 'government', 'said', 'on', 'minister', 'forces', 'report', 'people', 'city', 'after',
+                 'talks', 'with', 'and', 'new', 'region', 'security', 'economic', 'week', 'officials', 'border')
+
+
+def english_variant(article, rng):
+    # Same page structure and word counts as the Arabic article, in English
+    def words(text):
+        return ' '.join(rng.choice(ENGLISH_WORDS) for _ in (text or '').split())
+
+    variant = dict(article)
+    variant.update(lang='en', title=words(article.get('title')), description=words(article.get('description')),
+                   full_article_text=words(article.get('full_article_text')))
+    return variant
+
+
+def collect_pages(args):
+    # (name, content) of every page of the corpus and where it came from
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+            with open(path, 'rb') as f:
+                pages.append((os.path.basename(path), f.read()))
+        return pages, f'pages:{args.pages}'
+    if args.archive:
+        archive = HttpArchive(args.archive)
+        pages = []
+        for url in archive.urls():
+            response = archive.get(url)
+            if response.status == 200 and 'html' in response.headers.get('Content-Type', 'text/html'):
+                pages.append((url, response.body))
+        return pages, f'archive:{args.archive}'
+    rng = random.Random(0)
+    articles = load_dump()[:args.articles]
+    pages = [(f'stub-ar-{i}', render_article_page(article)) for i, article in enumerate(articles)]
+    pages += [(f'stub-en-{i}', render_article_page(english_variant(article, rng)))
+              for i, article in enumerate(articles)]
+    return pages, 'stub'
+
+
+def page_url(name):
+    return name if name.startswith('http') else f'https://example.test/{name}'
+
+
+def measure(engine, pages, repeat):
+    # One record per page: language, size, outcome, seconds per stage and in total, peak traced memory
+    records = []
+    for name, content in pages:
+        timings = {}
+        start = time.perf_counter()
+        for _ in range(repeat):
+            article, outcome = ArticleScraper.parse_page(engine, page_url(name), content, timings)
+        elapsed = (time.perf_counter() - start) / repeat
+        records.append({
+            'lang': (article.lang if article else None) or 'unknown',
+            'bytes': len(content),
+            'outcome': outcome,
+            'seconds': elapsed,
+            'stages': {stage: timings.get(stage, 0.0) / repeat for stage in STAGES},
+        })
+
+    # Memory is traced in a separate pass, tracemalloc slows allocations down
+    tracemalloc.start()
+    try:
+        for record, (name, content) in zip(records, pages):
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            ArticleScraper.parse_page(engine, page_url(name), content)
+            record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return records
+
+
+def summarize(records):
+    seconds = sum(record['seconds'] for record in records)
+    total_bytes = sum(record['bytes'] for record in records)
+    peaks = sorted(record['peak_bytes'] for record in records)
+    outcomes = {}
+    for record in records:
+        outcomes[record['outcome']] = outcomes.get(record['outcome'], 0) + 1
+    return {
+        'pages': len(records),
+        'bytes': total_bytes,
+        'pages_per_sec': round(len(records) / seconds, 2) if seconds else None,
+        'mb_per_sec': round(total_bytes / seconds / 1e6, 3) if seconds else None,
+        'ms_per_page': round(seconds / len(records) * 1000, 3),
+        'stage_ms_per_page': {stage: round(sum(record['stages'][stage] for record in records) / len(records) * 1000, 3)
+                              for stage in STAGES},
+        'peak_memory_kb': {
+            'mean': round(statistics.mean(peaks) / 1024, 1),
+            'p95': round(peaks[min(len(peaks) - 1, int(len(peaks) * 0.95))] / 1024, 1),
+            'max': round(peaks[-1] / 1024, 1),
+        },
+        'outcomes': outcomes,
+    }
+
+
+def run(engine, pages, repeat):
+    records = measure(engine, pages, repeat)
+    groups = {'all': summarize(records)}
+    for lang in sorted({record['lang'] for record in records}):
+        groups[lang] = summarize([record for record in records if record['lang'] == lang])
+    return groups
+
+
+def print_report(results, previous=None):
+    for engine, groups in results['engines'].items():
+        for group, summary in groups.items():
+            line = (f"{engine:>5} {group:>7}: {summary['pages']:5d} pages {summary['pages_per_sec']:8.1f} pages/sec "
+                    f"{summary['ms_per_page']:7.2f} ms/page  peak {summary['peak_memory_kb']['mean']:8.1f} KB/page")
+            before = (previous or {}).get('engines', {}).get(engine, {}).get(group)
+            if before and before.get('pages_per_sec'):
+                line += f"  ({summary['pages_per_sec'] / before['pages_per_sec'] - 1:+.1%} pages/sec)"
+            print(line)
+            stages = '  '.join(f"{stage} {ms:.3f}" for stage, ms in summary['stage_ms_per_page'].items())
+            print(f"{'':>15}ms/page: {stages}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--articles', type=int, default=300, help="Dump articles rendered (x2: Arabic and English)")
+    parser.add_argument('--pages', help="Directory with saved article pages (*.html)")
+    parser.add_argument('--archive', help="HTTP archive whose HTML responses form the corpus")
+    parser.add_argument('--engines', nargs='+', choices=ArticleScraper.ENGINES, default=list(ArticleScraper.ENGINES))
+    parser.add_argument('--repeat', type=int, default=1, help="Times every page is parsed in the timing pass")
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/bench_parser_<timestamp>.json)")
+    parser.add_argument('--compare', help="Previous result file to compare pages/sec with")
+    args = parser.parse_args()
+
+    pages, source = collect_pages(args)
+    if not pages:
+        sys.exit(f"No pages found in {source}")
+    engines = [engine for engine in args.engines if engine != 'fast' or web_scraper.lxml is not None]
+
+    results = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'source': source, 'pages': len(pages), 'bytes': sum(len(content) for _, content in pages)},
+        'repeat': args.repeat,
+        'engines': {engine: run(engine, pages, args.repeat) for engine in engines},
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_report(results, previous)
+
+    output = args.output or os.path.join(
+        RESULTS_DIRECTORY, f"bench_parser_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4)
+    print(f"results written to {output}")
@@ -0,0 +1,59 @@
+"""
+Crawl a stub site that throttles above --site-limit requests/sec, with and without the adaptive
+rate limiter (rate_limiter.RateLimitedTransport). Reports articles kept, 429s served and the rate
+the limiter settled on.
+
+    python benchmarks/bench_rate_limiter.py --articles 300 --site-limit 40 --concurrency 32
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_scraper
+from http_transport import HttpTransport
+from rate_limiter import AdaptiveHostLimiter, RateLimitedTransport
+from stub_site import StubSite, load_dump
+
+
+def crawl(dump, site_limit, concurrency, latency, limited):
+    with StubSite(dump, months=2, latency=latency, rate_limit=site_limit) as site, \
+            tempfile.TemporaryDirectory() as workdir:
+        transport = HttpTransport(pool_maxsize=concurrency)
+        if limited:
+            transport = RateLimitedTransport(transport, AdaptiveHostLimiter(initial_rate=5.0, max_rate=500.0))
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                scraped = web_scraper.main(site.index_url, max_articles=len(dump), concurrency=concurrency,
+                                           transport=transport)
+                elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+        stats = transport.rate_limit_stats() if limited else {}
+        return scraped, elapsed, site.throttled_count, stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=300)
+    parser.add_argument('--site-limit', type=int, default=40, help="Requests/sec the stub site accepts")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    dump = load_dump()[:args.articles]
+    for limited in (False, True):
+        scraped, elapsed, throttled, stats = crawl(dump, args.site_limit, args.concurrency, args.latency, limited)
+        label = 'adaptive limiter' if limited else 'no limiter'
+        print(f"{label:>16}: {scraped}/{len(dump)} articles in {elapsed:6.2f}s "
+              f"({scraped / elapsed:6.1f}/sec), {throttled} responses throttled by the site")
+        if stats:
+            print(f"{'':>16}  retries={stats['retries']} final rates={stats['rates']}")
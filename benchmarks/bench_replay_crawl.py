@@ -0,0 +1,86 @@
+"""
+Offline, reproducible timing of full web_scraper.main() runs from an HTTP archive (http_archive.py).
+
+Without --archive the stub site (built from the 2K dump) is crawled once through a RecordingTransport,
+then every run replays that archive through a ReplayTransport at the given latency and bandwidth.
+With --archive an existing recording is replayed instead, e.g. one made against almayadeen.net with
+
+    python web_scraper.py --max-articles 500 --record-archive data/http_archive.warc.gz
+
+    python benchmarks/bench_replay_crawl.py --articles 300 --latency 0.02 --bandwidth 2000000 --runs 3
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_scraper
+from http_archive import HttpArchive, RecordingTransport, ReplayTransport
+from http_transport import HttpTransport
+from stub_site import StubSite, load_dump
+
+
+def record(dump, path):
+    with StubSite(dump, months=2) as site, tempfile.TemporaryDirectory() as workdir:
+        archive = HttpArchive(path)
+        transport = RecordingTransport(HttpTransport(), archive)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            scraped = web_scraper.main(site.index_url, max_articles=len(dump), transport=transport)
+        finally:
+            os.chdir(cwd)
+            transport.close()
+        return site.index_url, scraped
+
+
+def replay(path, index_url, max_articles, concurrency, latency, bandwidth):
+    transport = ReplayTransport(HttpArchive(path), latency, bandwidth)
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            start = time.perf_counter()
+            scraped = web_scraper.main(index_url, max_articles=max_articles, concurrency=concurrency,
+                                       transport=transport)
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+            transport.close()
+    return scraped, elapsed, transport.replay_stats()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--archive', default=None, help="Replay this archive instead of recording the stub site")
+    parser.add_argument('--sitemap-index', default='https://www.almayadeen.net/sitemaps/all.xml',
+                        help="Sitemap index URL of the --archive recording")
+    parser.add_argument('--articles', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every replayed request")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Bytes/sec of the replayed bodies")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as archive_directory:
+        if args.archive:
+            path, index_url = args.archive, args.sitemap_index
+        else:
+            path = os.path.join(archive_directory, 'stub.warc.gz')
+            index_url, recorded = record(load_dump()[:args.articles], path)
+            print(f"recorded {recorded} articles, archive {os.path.getsize(path)} bytes")
+
+        timings = []
+        for run in range(args.runs):
+            scraped, elapsed, stats = replay(path, index_url, args.articles, args.concurrency,
+                                             args.latency, args.bandwidth)
+            timings.append(elapsed)
+            print(f"run {run + 1}: {scraped} articles in {elapsed:6.2f}s ({scraped / elapsed:6.1f}/sec), "
+                  f"{stats['requests']} requests, {stats['misses']} not archived")
+        if len(timings) > 1:
+            print(f"mean {statistics.mean(timings):.2f}s, stdev {statistics.stdev(timings):.3f}s")
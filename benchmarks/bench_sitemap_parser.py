@@ -0,0 +1,69 @@
+"""
+Streaming sitemap reader (web_scraper.iter_sitemap_entries) against the BeautifulSoup 'xml'
+tree + find_all('loc') approach on a large synthetic monthly sitemap.
+Reports wall time and peak traced Python memory for both.
+
+    python benchmarks/bench_sitemap_parser.py --entries 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from web_scraper import iter_sitemap_entries
+from stub_site import render_urlset
+
+
+def synthetic_sitemap(entries):
+    return render_urlset(
+        (f'https://www.almayadeen.net/news/politics/article-{i}', '2024-09-09T11:31:07+03:00')
+        for i in range(entries))
+
+
+def with_soup(body):
+    soup = BeautifulSoup(body, 'xml')
+    return [loc.text for loc in soup.find_all('loc')]
+
+
+def with_stream(body, chunk_size=64 * 1024):
+    chunks = (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+    # Count instead of collecting, the point of the generator is not to hold the list
+    count = 0
+    for _ in iter_sitemap_entries(chunks):
+        count += 1
+    return count
+
+
+def measure(function, body):
+    # Timed without tracing (tracemalloc slows allocation-heavy code down a lot), then traced for the peak
+    start = time.perf_counter()
+    result = function(body)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=100000, help="Number of <url> entries in the sitemap")
+    args = parser.parse_args()
+
+    body = synthetic_sitemap(args.entries)
+    print(f"sitemap: {args.entries} entries, {len(body) / 1e6:.1f} MB")
+
+    urls, soup_time, soup_peak = measure(with_soup, body)
+    count, stream_time, stream_peak = measure(with_stream, body)
+    assert count == len(urls), (count, len(urls))
+
+    print(f"BeautifulSoup xml : {soup_time:7.2f}s  peak {soup_peak / 1e6:8.1f} MB")
+    print(f"streaming reader  : {stream_time:7.2f}s  peak {stream_peak / 1e6:8.1f} MB")
+    print(f"speedup {soup_time / stream_time:.1f}x, memory {soup_peak / max(stream_peak, 1):.0f}x lower")
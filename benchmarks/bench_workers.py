@@ -0,0 +1,50 @@
+"""
+Scaling of the sharded crawl (crawl_queue.py): the stub site is crawled through a SQLite lease queue by
+1, 2, 4, ... worker processes, each fetching pages one at a time. Reports articles/sec per worker count.
+
+    python benchmarks/bench_workers.py --articles 400 --latency 0.05 --levels 1 2 4 8 --batch-size 25
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawl_queue import LeaseQueue, enqueue_sitemaps, run_workers
+from http_transport import HttpTransport
+from stub_site import StubSite, load_dump
+
+
+def crawl(site, workers, batch_size, workdir):
+    queue_path = os.path.join(workdir, f'queue_{workers}.sqlite3')
+    with LeaseQueue(queue_path) as queue:
+        enqueue_sitemaps(queue, site.index_url, HttpTransport(), batch_size=batch_size)
+    start = time.perf_counter()
+    report = run_workers(queue_path, workers,
+                         {'checkpoint': os.path.join(workdir, f'checkpoint_{workers}.sqlite3'),
+                          'output_directory': os.path.join(workdir, f'out_{workers}'),
+                          'log_level': 'WARNING', 'transport': {'http_cache': None, 'rate_limit': False}})
+    return report['articles'], time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--months', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=None, help="Queue URL batches instead of sitemaps")
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with StubSite(load_dump()[:args.articles], months=args.months, latency=args.latency) as site, \
+            tempfile.TemporaryDirectory() as workdir:
+        baseline = None
+        for workers in args.levels:
+            scraped, elapsed = crawl(site, workers, args.batch_size, workdir)
+            rate = scraped / elapsed
+            baseline = baseline or rate / workers
+            print(f"{workers:3d} workers: {scraped} articles in {elapsed:6.2f}s  {rate:7.1f} articles/sec  "
+                  f"scaling efficiency {rate / (baseline * workers):.0%}")
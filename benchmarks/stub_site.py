@@ -0,0 +1,218 @@
+# Local stand-in for almayadeen.net used by the benchmarks.
+# It renders a sitemap index, monthly sitemaps and article pages out of the shipped
+# data/all_articles_original_2K.json.gz dump, so crawls can be timed without the network.
+
+import gzip
+import hashlib
+import html
+import json
+import os
+import collections
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DUMP_PATH = os.path.join(REPO_ROOT, 'data', 'all_articles_original_2K.json.gz')
+
+# Footer/summary blocks that ArticleScraper strips before extracting the text
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="{lang}">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script type="text/tawsiyat">{metadata}</script>
+</head>
+<body>
+<header><nav class="footer_top_menu"><a href="/">Home</a></nav></header>
+<main>
+<div class="post-type post-metas type-wrap article-details-metas"><span>{author}</span></div>
+<section class="read-section">
+<p class="lg_para summary">{description}</p>
+<div class="p-content">
+{paragraphs}
+<div class="post_disclaimer"><p>Disclaimer</p></div>
+</div>
+</section>
+<aside class="col-4"><p>Related</p></aside>
+</main>
+<footer>
+<div class="footer_middle_menu"><p>Sections</p></div>
+<div class="footer_btm_row"><p>Links</p></div>
+<p class="footer-bottom-text">All rights reserved</p>
+</footer>
+</body>
+</html>
+"""
+
+
+def load_dump():
+    with gzip.open(DUMP_PATH, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _split_paragraphs(text, words_per_paragraph=40):
+    words = text.split()
+    return [' '.join(words[i:i + words_per_paragraph]) for i in range(0, len(words), words_per_paragraph)] or ['']
+
+
+def render_article_page(article):
+    # Rebuild the tawsiyat metadata block the way the site publishes it
+    metadata = {
+        'type': 'article',
+        'postid': article.get('post_id'),
+        'title': article.get('title'),
+        'keywords': article.get('keywords'),
+        'thumbnail': article.get('thumbnail'),
+        'published_time': article.get('publication_date'),
+        'last_updated': article.get('last_updated_date'),
+        'author': article.get('author'),
+        'video_duration': article.get('video_duration'),
+        'word_count': article.get('word_count'),
+        'lang': article.get('lang'),
+        'description': article.get('description'),
+        'classes': article.get('classes', []),
+    }
+    paragraphs = _split_paragraphs(article.get('full_article_text') or '')
+    if article.get('lang') == 'ar':
+        # The scraper reverses Arabic paragraphs, so publish them reversed
+        paragraphs.reverse()
+    return PAGE_TEMPLATE.format(
+        lang=article.get('lang') or 'en',
+        title=html.escape(article.get('title') or ''),
+        metadata=json.dumps(metadata, ensure_ascii=False).replace('</', '<\\/'),
+        author=html.escape(article.get('author') or ''),
+        description=html.escape(article.get('description') or ''),
+        paragraphs='\n'.join(f'<p>{html.escape(p)}</p>' for p in paragraphs),
+    ).encode('utf-8')
+
+
+def render_sitemap_index(base_url, months):
+    entries = ''.join(
+        f'<sitemap><loc>{base_url}/sitemaps/{name}</loc><lastmod>{lastmod}</lastmod></sitemap>'
+        for name, lastmod in months
+    )
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f'{entries}</sitemapindex>').encode('utf-8')
+
+
+def render_urlset(entries):
+    body = ''.join(f'<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>' for loc, lastmod in entries)
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f'{body}</urlset>').encode('utf-8')
+
+
+class StubSite:
+    """
+    Serves a synthetic copy of the site on 127.0.0.1.
+    Articles from the dump are spread across `months` monthly sitemaps named like the
+    real ones (sitemap-YYYY-MM-1.xml) so main() can extract the year and month.
+    `latency` seconds are slept before every response to emulate the round trip.
+    With `rate_limit` set, requests beyond that many per second are answered with
+    429 Too Many Requests and `Retry-After: retry_after`, like a throttling origin.
+    """
+
+    def __init__(self, articles=None, months=4, latency=0.0, port=0, rate_limit=None, retry_after=1):
+        self.articles = articles if articles is not None else load_dump()
+        self.months = months
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.throttled_count = 0
+        self._recent = collections.deque()
+        self._rate_lock = threading.Lock()
+        self.pages = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.index_url = f'{self.base_url}/sitemaps/all.xml'
+        self._thread = None
+        self.request_count = 0
+        self._build()
+
+    def _build(self):
+        per_month = max(1, -(-len(self.articles) // self.months))
+        month_names = []
+        for m in range(self.months):
+            chunk = self.articles[m * per_month:(m + 1) * per_month]
+            name = f'sitemap-2024-{(m % 12) + 1:02d}-1.xml'
+            entries = []
+            for i, article in enumerate(chunk):
+                path = f'/news/article-{m}-{i}'
+                self.pages[path] = render_article_page(article)
+                entries.append((self.base_url + path, article.get('last_updated_date') or ''))
+            self.pages[f'/sitemaps/{name}'] = render_urlset(entries)
+            month_names.append((name, f'2024-{(m % 12) + 1:02d}-28T00:00:00+03:00'))
+        self.pages['/sitemaps/all.xml'] = render_sitemap_index(self.base_url, month_names)
+
+    def _over_limit(self):
+        if not self.rate_limit:
+            return False
+        with self._rate_lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit:
+                self.throttled_count += 1
+                return True
+            self._recent.append(now)
+            return False
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                site.request_count += 1
+                if site._over_limit():
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(site.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if site.latency:
+                    time.sleep(site.latency)
+                body = site.pages.get(self.path.split('?')[0])
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                content_type = 'application/xml' if self.path.endswith('.xml') else 'text/html; charset=utf-8'
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+
+# The FingerprintStore class lets a re-crawl skip pages that did not change since they were scraped.
+# For every saved page it keeps a hash of the raw body and the last_updated value of its
+# text/tawsiyat metadata, keyed by URL (with the post_id alongside).
+#
+# check(url, content) runs right after the fetch, before any DOM parsing:
+#   - same body hash                                        -> unchanged
+#   - different body (ads, related links...) but the same
+#     non-empty last_updated in the metadata script         -> unchanged (the stored hash is refreshed)
+#   - anything else                                         -> changed, the page is parsed as usual
+# An unchanged page is neither parsed nor written again, so it costs one fetch and one hash.
+#
+# The fingerprint of a changed page is only staged by check(); commit() stores it once the page was
+# saved (ArticleStreamWriter on_flush for articles), so a crash never leaves a fingerprint for an
+# article that is not on disk.
+
+# The metadata script, found without building a DOM
+TAWSIYAT_PATTERN = re.compile(rb'<script[^>]*type=["\']text/tawsiyat["\'][^>]*>(.*?)</script>', re.S | re.I)
+
+
+def body_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+# last_updated of the page metadata, None when it can't be read without parsing the page
+def sniff_last_updated(content: bytes) -> Optional[str]:
+    match = TAWSIYAT_PATTERN.search(content)
+    if not match:
+        return None
+    try:
+        metadata = json.loads(match.group(1))
+    except ValueError:
+        return None
+    return metadata.get('last_updated') if isinstance(metadata, dict) else None
+
+
+class FingerprintStore:
+    def __init__(self, path: str = os.path.join('data', 'content_fingerprints.sqlite3')):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        # isolation_level=None: autocommit, each statement is its own durable transaction
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                url TEXT PRIMARY KEY,
+                post_id TEXT,
+                body_hash TEXT NOT NULL,
+                last_updated TEXT,
+                checked_at TEXT NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_post_id ON fingerprints (post_id)")
+        # url -> (body hash, last_updated) of changed pages that were not saved yet
+        self._staged = {}
+        self.unchanged = 0
+        self.changed = 0
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    # True when the page did not change since it was saved
+    def check(self, url: str, content: bytes) -> bool:
+        digest = body_hash(content)
+        with self._lock:
+            row = self.conn.execute("SELECT body_hash, last_updated FROM fingerprints WHERE url = ?",
+                                    (url,)).fetchone()
+        if row is not None and row[0] == digest:
+            with self._lock:
+                self.unchanged += 1
+            return True
+        last_updated = sniff_last_updated(content)
+        with self._lock:
+            if row is not None and last_updated and row[1] == last_updated:
+                self.conn.execute("UPDATE fingerprints SET body_hash = ?, checked_at = ? WHERE url = ?",
+                                  (digest, self._now(), url))
+                self.unchanged += 1
+                return True
+            self._staged[url] = (digest, last_updated)
+            self.changed += 1
+        return False
+
+    # records: (url, article) pairs that were saved (article None for pages that are not articles)
+    def commit(self, records):
+        with self._lock:
+            rows = []
+            for url, article in records:
+                staged = self._staged.pop(url, None)
+                if staged is not None:
+                    rows.append((url, article.post_id if article else None, staged[0], staged[1], self._now()))
+            if rows:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR REPLACE INTO fingerprints "
+                                      "(url, post_id, body_hash, last_updated, checked_at) VALUES (?, ?, ?, ?, ?)",
+                                      rows)
+                self.conn.execute("COMMIT")
+
+    # Forgets the staged fingerprints of pages that were checked but never saved (a scrape error, pages left
+    # over when max_articles stopped the crawl), so they don't pile up for the whole run
+    def discard(self, urls: Iterable[str]):
+        with self._lock:
+            for url in urls:
+                self._staged.pop(url, None)
+
+    def fingerprint_stats(self) -> dict:
+        with self._lock:
+            stored = self.conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+        return {'unchanged': self.unchanged, 'changed': self.changed, 'stored': stored}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,315 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# zstandard and brotli are only needed by the codecs of the same name
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+# Lines are handed to the compressor in chunks of this size, one call per line is much slower
+CHUNK_SIZE = 2 ** 20
+
+
+# A corpus directory holds the articles as JSON lines split into shards of about shard_size uncompressed
+# bytes (part-00000.jsonl.zst, part-00001.jsonl.zst, ...) and a manifest.json listing every complete
+# shard with its article count and sizes:
+#
+#   {"codec": "zstd", "level": 3, "articles": 20000, "shards": [
+#       {"file": "part-00000.jsonl.zst", "articles": 4112, "bytes": 33554890, "compressed_bytes": 5520123}, ...]}
+#
+# Each shard is one compressed stream that is decompressed on its own, so readers can decompress several
+# shards at the same time (zlib, zstandard and brotli release the GIL while they work) and a crashed write
+# only loses the shard it was writing: a shard is written to a .tmp file, renamed when complete, and the
+# manifest is rewritten (atomically) after every shard.
+#
+#   gzip    standard library, compatible with everything, slowest to read
+#   zstd    pip install zstandard; compresses on several threads (threads=-1: one per CPU), fastest to read
+#   brotli  pip install brotli; smallest files at high quality, slow to write there
+
+class Codec:
+    def __init__(self, name: str, extension: str, default_level: int):
+        self.name = name
+        self.extension = extension
+        self.default_level = default_level
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def compressor(self, level: int, threads: int):
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class GzipCodec(Codec):
+    def __init__(self):
+        super().__init__('gzip', '.gz', 6)
+
+    def compressor(self, level, threads):
+        # wbits=31: gzip header and trailer, so a shard is also a regular .gz file
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def decompress(self, data):
+        return gzip.decompress(data)
+
+
+class ZstdCodec(Codec):
+    def __init__(self):
+        super().__init__('zstd', '.zst', 3)
+
+    @property
+    def available(self):
+        return zstandard is not None
+
+    def compressor(self, level, threads):
+        return zstandard.ZstdCompressor(level=level, threads=threads).compressobj()
+
+    def decompress(self, data):
+        # Streamed frames don't record their size, decompressobj() doesn't need it
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+class _BrotliCompressor:
+    # Gives brotli.Compressor the compress()/flush() interface of the zlib and zstandard objects
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class BrotliCodec(Codec):
+    def __init__(self):
+        super().__init__('brotli', '.br', 5)
+
+    @property
+    def available(self):
+        return brotli is not None
+
+    def compressor(self, level, threads):
+        return _BrotliCompressor(level)
+
+    def decompress(self, data):
+        return brotli.decompress(data)
+
+
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (GzipCodec(), ZstdCodec(), BrotliCodec())}
+
+
+def get_codec(name: str) -> Codec:
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"Unknown codec {name!r}, expected one of {', '.join(CODECS)}")
+    if not codec.available:
+        raise ValueError(f"The {name} codec needs the {'zstandard' if name == 'zstd' else name} package")
+    return codec
+
+
+def read_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# The ShardedCorpusWriter class writes articles (dicts, or objects with a __dict__ like Article) into a
+# corpus directory. Lines are compressed as they are written, so only the compressor's window is in memory.
+# The directory must be empty or hold a corpus written with the same codec, which is then appended to.
+
+class ShardedCorpusWriter:
+    def __init__(self, directory: str, codec: str = 'gzip', shard_size: int = 32 * 2 ** 20,
+                 level: Optional[int] = None, threads: int = -1):
+        if shard_size < 1:
+            raise ValueError("shard_size must be positive")
+        self.directory = directory
+        self.codec = get_codec(codec)
+        self.level = self.codec.default_level if level is None else level
+        self.threads = threads
+        self.shard_size = shard_size
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if os.path.exists(os.path.join(directory, MANIFEST_FILENAME)):
+            self.manifest = read_manifest(directory)
+            if self.manifest['codec'] != self.codec.name:
+                raise ValueError(f"{directory} holds a {self.manifest['codec']} corpus, not {self.codec.name}")
+        else:
+            self.manifest = {'codec': self.codec.name, 'level': self.level, 'articles': 0, 'shards': []}
+        self._file = None
+        self._compressor = None
+        self._shard = None
+        self._buffer = []
+        self._buffered = 0
+
+    def _open_shard(self):
+        filename = f"part-{len(self.manifest['shards']):05d}.jsonl{self.codec.extension}"
+        self._shard = {'file': filename, 'articles': 0, 'bytes': 0, 'compressed_bytes': 0}
+        self._file = open(os.path.join(self.directory, filename + '.tmp'), 'wb')
+        self._compressor = self.codec.compressor(self.level, self.threads)
+
+    def write(self, article):
+        document = article if isinstance(article, dict) else article.__dict__
+        line = (json.dumps(document, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        if self._file is None:
+            self._open_shard()
+        self._buffer.append(line)
+        self._buffered += len(line)
+        self._shard['articles'] += 1
+        self._shard['bytes'] += len(line)
+        if self._shard['bytes'] >= self.shard_size:
+            self._close_shard()
+        elif self._buffered >= CHUNK_SIZE:
+            self._compress_buffer()
+
+    def _compress_buffer(self):
+        self._file.write(self._compressor.compress(b''.join(self._buffer)))
+        self._buffer = []
+        self._buffered = 0
+
+    def write_many(self, articles: Iterable) -> int:
+        count = 0
+        for article in articles:
+            self.write(article)
+            count += 1
+        return count
+
+    def _close_shard(self):
+        self._compress_buffer()
+        self._file.write(self._compressor.flush())
+        self._shard['compressed_bytes'] = self._file.tell()
+        self._file.close()
+        path = os.path.join(self.directory, self._shard['file'])
+        os.replace(path + '.tmp', path)
+        self.manifest['shards'].append(self._shard)
+        self.manifest['articles'] += self._shard['articles']
+        self._write_manifest()
+        self._file = self._compressor = self._shard = None
+
+    def _write_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILENAME)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        if self._file is not None:
+            self._close_shard()
+        elif not os.path.exists(os.path.join(self.directory, MANIFEST_FILENAME)):
+            self._write_manifest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Runs in the reader threads or processes: one shard, decompressed, as its list of lines (or of articles)
+def _load_shard(path: str, codec_name: str, parse: bool) -> list:
+    with open(path, 'rb') as f:
+        data = CODECS[codec_name].decompress(f.read())
+    # Not splitlines(): it also splits on the U+2028/U+0085 that ensure_ascii=False leaves inside strings
+    lines = data.decode('utf-8').split('\n')
+    if parse:
+        return [json.loads(line) for line in lines if line.strip()]
+    return lines
+
+
+# The articles of one shard, e.g. for a process that was handed that shard
+def iter_shard(directory: str, shard: dict, codec_name: str) -> Iterator[dict]:
+    for line in _load_shard(os.path.join(directory, shard['file']), codec_name, parse=False):
+        if line.strip():
+            yield json.loads(line)
+
+
+# iter_corpus yields the articles of a corpus directory in order, decompressing up to workers shards ahead
+# of the caller. With processes=True the workers are processes that also decode the JSON, which pays off
+# on several cores when the caller does little per article; threads only overlap the decompression.
+def iter_corpus(directory: str, workers: int = 4, processes: bool = False) -> Iterator[dict]:
+    manifest = read_manifest(directory)
+    codec = get_codec(manifest['codec'])
+    paths = [os.path.join(directory, shard['file']) for shard in manifest['shards']]
+    if workers <= 1:
+        for path in paths:
+            for line in _load_shard(path, codec.name, parse=False):
+                if line.strip():
+                    yield json.loads(line)
+        return
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        # At most workers shards are decompressed ahead of the one being consumed
+        futures = [executor.submit(_load_shard, path, codec.name, processes) for path in paths[:workers]]
+        following = workers
+        while futures:
+            records = futures.pop(0).result()
+            if following < len(paths):
+                futures.append(executor.submit(_load_shard, paths[following], codec.name, processes))
+                following += 1
+            if processes:
+                yield from records
+            else:
+                for line in records:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def parse_size(value: str) -> int:
+    units = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30}
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def main(argv: Optional[List[str]] = None):
+    # Lazy import: web_scraper is only needed to read the older dumps
+    from web_scraper import FileUtility
+
+    parser = argparse.ArgumentParser(description="Convert article dumps to sharded compressed corpora")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help="Write a dump (JSON array or JSON lines, .gz or plain, "
+                                                    "or another corpus directory) as a sharded corpus")
+    convert.add_argument('source')
+    convert.add_argument('directory')
+    convert.add_argument('--codec', choices=list(CODECS), default='zstd' if zstandard is not None else 'gzip')
+    convert.add_argument('--level', type=int, help="Compression level (default: 6 gzip, 3 zstd, 5 brotli)")
+    convert.add_argument('--threads', type=int, default=-1, help="zstd compression threads, -1 for one per CPU")
+    convert.add_argument('--shard-size', type=parse_size, default='32M',
+                         help="Uncompressed bytes per shard, e.g. 32M")
+    info = subparsers.add_parser('info', help="Print the manifest of a corpus directory")
+    info.add_argument('directory')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'convert':
+        with ShardedCorpusWriter(args.directory, codec=args.codec, shard_size=args.shard_size, level=args.level,
+                                 threads=args.threads) as writer:
+            count = writer.write_many(FileUtility.iter_articles(args.source))
+        logger.info("Wrote %d articles to %d %s shards in %s", count, len(writer.manifest['shards']),
+                    args.codec, args.directory)
+    else:
+        manifest = read_manifest(args.directory)
+        compressed = sum(shard['compressed_bytes'] for shard in manifest['shards'])
+        raw = sum(shard['bytes'] for shard in manifest['shards'])
+        print(f"{manifest['codec']} level {manifest['level']}: {manifest['articles']} articles in "
+              f"{len(manifest['shards'])} shards, {compressed / 2 ** 20:.1f} MB ({raw / max(compressed, 1):.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List
+
+
+# The CrawlCheckpoint class records crawl progress on disk so an interrupted run can resume.
+# It is a small SQLite database in WAL mode: every scraped URL is committed as soon as it is
+# recorded, so a killed process (even kill -9) loses at most the pages that were in flight.
+#
+#   sitemaps: monthly sitemap URLs whose articles were all scraped (past months only)
+#   articles: every URL that was fetched, with its post_id (NULL for pages that are not articles)
+#
+# The articles themselves are in the append-only files of ArticleStreamWriter, which records
+# a URL here only once its article is on disk.
+#
+# Looking up a URL is a primary-key lookup, so checking the frontier costs the same at 20K or 2M URLs.
+
+class CrawlCheckpoint:
+    def __init__(self, path: str = os.path.join('data', 'crawl_checkpoint.sqlite3')):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        # isolation_level=None: autocommit, each statement is its own durable transaction
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sitemaps (
+                url TEXT PRIMARY KEY,
+                completed_at TEXT NOT NULL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY,
+                post_id TEXT,
+                scraped_at TEXT NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS articles_post_id ON articles (post_id)")
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def is_sitemap_completed(self, sitemap_url: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM sitemaps WHERE url = ?", (sitemap_url,)).fetchone()
+        return row is not None
+
+    def mark_sitemap_completed(self, sitemap_url: str):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO sitemaps (url, completed_at) VALUES (?, ?)",
+                              (sitemap_url, self._now()))
+
+    def has_url(self, url: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM articles WHERE url = ?", (url,)).fetchone()
+        return row is not None
+
+    def has_post_id(self, post_id: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM articles WHERE post_id = ?", (post_id,)).fetchone()
+        return row is not None
+
+    # Returns the URLs that were never fetched, keeping their order
+    def pending_urls(self, urls: List[str]) -> List[str]:
+        return [url for url in urls if not self.has_url(url)]
+
+    # article is an Article (or None when the page was not an article, or was not parsed again);
+    # a URL recorded with its post_id keeps it
+    def record(self, url: str, article=None):
+        post_id = article.post_id if article else None
+        with self._lock:
+            self.conn.execute("INSERT INTO articles (url, post_id, scraped_at) VALUES (?, ?, ?) "
+                              "ON CONFLICT (url) DO UPDATE SET post_id = COALESCE(excluded.post_id, post_id), "
+                              "scraped_at = excluded.scraped_at", (url, post_id, self._now()))
+
+    def record_many(self, records):
+        # records: (url, article) pairs, committed in one transaction
+        rows = [(url, article.post_id if article else None, self._now()) for url, article in records]
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT INTO articles (url, post_id, scraped_at) VALUES (?, ?, ?) "
+                                  "ON CONFLICT (url) DO UPDATE SET post_id = COALESCE(excluded.post_id, post_id), "
+                                  "scraped_at = excluded.scraped_at", rows)
+            self.conn.execute("COMMIT")
+
+    # url -> scraped_at of the URLs that were fetched before
+    def scraped_times(self, urls: List[str]) -> Dict[str, str]:
+        times = {}
+        with self._lock:
+            for url in urls:
+                row = self.conn.execute("SELECT scraped_at FROM articles WHERE url = ?", (url,)).fetchone()
+                if row is not None:
+                    times[url] = row[0]
+        return times
+
+    def counts(self) -> dict:
+        with self._lock:
+            urls, articles = self.conn.execute("SELECT COUNT(*), COUNT(post_id) FROM articles").fetchone()
+            sitemaps = self.conn.execute("SELECT COUNT(*) FROM sitemaps").fetchone()[0]
+        return {'urls': urls, 'articles': articles, 'completed_sitemaps': sitemaps}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,156 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# The CrawlMetrics class collects what a crawl did and how fast, without printing in the hot loop:
+#   - pages fetched and bytes downloaded, pages/sec since the start of the run
+#   - fetch and parse latency histograms (seconds)
+#   - outcome counts per page (see OUTCOMES)
+# summary() returns everything as a JSON-ready dict, write_summary() saves it at the end of the run
+# and start_snapshots() appends a summary line to a JSONL file every interval seconds.
+# All methods are thread-safe.
+
+# Outcome of every article URL
+OUTCOMES = (
+    'article',            # an Article was extracted
+    'fetch_error',        # the request failed or returned an HTTP error
+    'no_metadata',        # no <script type="text/tawsiyat"> tag
+    'json_decode_error',  # the metadata script is not valid JSON
+    'metadata_error',     # the metadata script could not be read for another reason
+    'not_article',        # the metadata type is not 'article'
+    'missing_section',    # no <section class="read-section">
+    'missing_p_content',  # no <div class="p-content"> in the section
+    'parse_error',        # an unexpected exception while parsing
+    'unchanged',          # same content as when it was saved (FingerprintStore), not parsed again
+)
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Upper bound of the bucket holding the q-quantile (the max for the unbounded bucket)
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        labels = [f'le_{bound}' for bound in self.buckets] + ['le_inf']
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 6) if self.count else None,
+            'max': round(self.max, 6),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class CrawlMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.pages = 0
+        self.bytes_downloaded = 0
+        self.fetch_latency = LatencyHistogram()
+        self.parse_latency = LatencyHistogram()
+        self.outcomes = Counter()
+        self._snapshot_stop = None
+        self._snapshot_thread = None
+
+    def record_fetch(self, seconds: float, size: int):
+        with self._lock:
+            self.pages += 1
+            self.bytes_downloaded += size
+            self.fetch_latency.observe(seconds)
+
+    def record_parse(self, seconds: float):
+        with self._lock:
+            self.parse_latency.observe(seconds)
+
+    def record_outcome(self, outcome: str):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def summary(self) -> Dict[str, object]:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'started_at': self.started_at,
+                'elapsed_seconds': round(elapsed, 3),
+                'pages': self.pages,
+                'pages_per_sec': round(self.pages / elapsed, 2) if elapsed else 0.0,
+                'bytes_downloaded': self.bytes_downloaded,
+                'articles': self.outcomes['article'],
+                'outcomes': {outcome: self.outcomes[outcome] for outcome in OUTCOMES},
+                'fetch_latency': self.fetch_latency.to_dict(),
+                'parse_latency': self.parse_latency.to_dict(),
+            }
+
+    def write_summary(self, path: str, extra: Optional[dict] = None):
+        summary = self.summary()
+        if extra:
+            summary.update(extra)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        logger.info("Crawl metrics written to %s", path)
+
+    def _snapshot_loop(self, path: str, interval: float):
+        while not self._snapshot_stop.wait(interval):
+            self._write_snapshot(path)
+
+    def _write_snapshot(self, path: str):
+        summary = self.summary()
+        summary['snapshot_at'] = datetime.now(timezone.utc).isoformat()
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary) + '\n')
+        logger.info("%d pages (%.1f/sec), %d articles, %d bytes downloaded",
+                    summary['pages'], summary['pages_per_sec'], summary['articles'], summary['bytes_downloaded'])
+
+    def start_snapshots(self, path: str, interval: float = 30.0):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._snapshot_stop = threading.Event()
+        self._snapshot_thread = threading.Thread(target=self._snapshot_loop, args=(path, interval), daemon=True)
+        self._snapshot_thread.start()
+
+    def stop_snapshots(self):
+        if self._snapshot_thread is not None:
+            self._snapshot_stop.set()
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
@@ -0,0 +1,277 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from content_fingerprints import FingerprintStore
+from crawl_metrics import CrawlMetrics
+from http_transport import HttpTransport
+from memory_budget import ByteBudget
+from web_scraper import Article, ArticleScraper
+
+logger = logging.getLogger(__name__)
+
+
+# The CrawlPipeline class splits the crawl into three stages connected by bounded queues:
+#
+#   fetch  - fetch_workers threads download raw page bytes through the shared transport
+#   parse  - a ProcessPoolExecutor of parser_processes turns bytes into Article objects,
+#            so the CPU-bound HTML parsing is not limited to the one core that holds the GIL
+#   write  - the calling thread consumes the Articles in URL order (on_result callback)
+#
+# Each queue holds at most queue_size items, so a slow stage makes the earlier ones wait
+# instead of piling pages up in memory. Per-stage throughput and queue depths are kept in stats(),
+# and the fetch/parse timings and page outcomes also go to metrics (a CrawlMetrics) when given.
+# With fingerprints (a FingerprintStore) the fetch stage drops pages that did not change, before parsing.
+# With budget (a memory_budget.ByteBudget) a fetch waits until the bodies queued or being parsed fit in the
+# budget, whatever their number; each body is released once its page reached the write stage.
+
+_DONE = object()
+
+
+# Runs in the parser processes: returns the Article (or None), its outcome and the time spent parsing
+def _parse_page(engine: str, article_url: str, content: bytes):
+    start = time.perf_counter()
+    article, outcome = ArticleScraper.parse_page(engine, article_url, content)
+    return article, outcome, time.perf_counter() - start
+
+
+class _StageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds
+
+
+class _QueueDepth:
+    def __init__(self):
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def sample(self, depth: int):
+        self.samples += 1
+        self.total += depth
+        self.max = max(self.max, depth)
+
+
+class CrawlPipeline:
+    def __init__(self,
+                 transport: Optional[HttpTransport] = None,
+                 fetch_workers: int = 16,
+                 parser_processes: Optional[int] = None,
+                 engine: str = 'soup',
+                 queue_size: int = 64,
+                 metrics: Optional[CrawlMetrics] = None,
+                 fingerprints: Optional[FingerprintStore] = None,
+                 budget: Optional[ByteBudget] = None):
+        if fetch_workers < 1:
+            raise ValueError("fetch_workers must be at least 1")
+        if engine not in ArticleScraper.ENGINES:
+            raise ValueError(f"Unknown extraction engine {engine!r}, expected one of {ArticleScraper.ENGINES}")
+        self.transport = transport or HttpTransport(pool_maxsize=fetch_workers)
+        self.fetch_workers = fetch_workers
+        self.parser_processes = parser_processes or os.cpu_count() or 1
+        self.engine = engine
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.fingerprints = fingerprints
+        self.budget = budget
+        # URLs whose fetch failed, the same as ArticleScraper.failed_fetches
+        self.failed_fetches = set()
+        self.executor = ProcessPoolExecutor(max_workers=self.parser_processes)
+        self._stages = {'fetch': _StageStats(), 'parse': _StageStats(), 'write': _StageStats()}
+        self._queues = {'raw': _QueueDepth(), 'parsed': _QueueDepth()}
+        self._wall_seconds = 0.0
+
+    @staticmethod
+    def _put(target: queue.Queue, item, stop: threading.Event) -> bool:
+        # Blocking put that gives up once the pipeline is stopped, so producers never hang
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self, article_url: str) -> Optional[bytes]:
+        start = time.perf_counter()
+        try:
+            response = self.transport.get(article_url)
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            content = response.content
+            if self.metrics:
+                self.metrics.record_fetch(time.perf_counter() - start, len(content))
+            if self.fingerprints and self.fingerprints.check(article_url, content):
+                if self.metrics:
+                    self.metrics.record_outcome('unchanged')
+                return None
+            return content
+        except requests.RequestException as e:
+            logger.warning("Failed to fetch %s: %s", article_url, e)
+            if self.metrics:
+                self.metrics.record_outcome('fetch_error')
+            self.failed_fetches.add(article_url)
+            return None
+        finally:
+            self._stages['fetch'].add(time.perf_counter() - start)
+
+    def _fetch_worker(self, url_queue: queue.Queue, raw_queue: queue.Queue, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                article_url = url_queue.get_nowait()
+            except queue.Empty:
+                return
+            held = 0
+            if self.budget:
+                held = self.budget.reserve(stop=stop)
+                if held is None:
+                    return
+            content = self._fetch(article_url)
+            if self.budget:
+                # The tree is built in a parser process, only the body is held here
+                held = self.budget.adjust(held, len(content) if content else 0)
+            if not self._put(raw_queue, (article_url, content, held), stop):
+                self._release(held)
+                return
+
+    def _release(self, held: int):
+        if self.budget and held:
+            self.budget.release(held)
+
+    def _dispatch(self, raw_queue: queue.Queue, parsed_queue: queue.Queue, stop: threading.Event):
+        # Hands raw pages to the parser processes; parsed_queue holds the futures in arrival order
+        while not stop.is_set():
+            try:
+                item = raw_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                self._put(parsed_queue, _DONE, stop)
+                return
+            article_url, content, held = item
+            if content is None:
+                future = Future()
+                future.set_result((None, None, 0.0))
+            else:
+                future = self.executor.submit(_parse_page, self.engine, article_url, content)
+            if not self._put(parsed_queue, (article_url, future, held), stop):
+                self._release(held)
+                return
+
+    def scrape_articles(self, article_urls: List[str], max_articles: Optional[int] = None,
+                        on_result: Optional[Callable[[str, Optional[Article]], None]] = None,
+                        keep_articles: bool = True) -> List[Article]:
+        # Same contract as AsyncCrawler.scrape_articles: stops once max_articles articles were written
+        if max_articles is not None and max_articles <= 0:
+            return []
+        start = time.perf_counter()
+        url_queue = queue.Queue()
+        for article_url in article_urls:
+            url_queue.put(article_url)
+        raw_queue = queue.Queue(maxsize=self.queue_size)
+        parsed_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        fetchers = [threading.Thread(target=self._fetch_worker, args=(url_queue, raw_queue, stop), daemon=True)
+                    for _ in range(min(self.fetch_workers, max(len(article_urls), 1)))]
+        dispatcher = threading.Thread(target=self._dispatch, args=(raw_queue, parsed_queue, stop), daemon=True)
+        for thread in fetchers:
+            thread.start()
+        dispatcher.start()
+
+        def close_fetch_stage():
+            for thread in fetchers:
+                thread.join()
+            self._put(raw_queue, _DONE, stop)
+
+        closer = threading.Thread(target=close_fetch_stage, daemon=True)
+        closer.start()
+
+        articles = []
+        found = 0
+        try:
+            while True:
+                item = parsed_queue.get()
+                self._queues['raw'].sample(raw_queue.qsize())
+                self._queues['parsed'].sample(parsed_queue.qsize())
+                if item is _DONE:
+                    break
+                article_url, future, held = item
+                article, outcome, parse_seconds = future.result()
+                self._release(held)
+                if outcome is not None:
+                    self._stages['parse'].add(parse_seconds)
+                    if self.metrics:
+                        self.metrics.record_parse(parse_seconds)
+                        self.metrics.record_outcome(outcome)
+                write_start = time.perf_counter()
+                if on_result:
+                    on_result(article_url, article)
+                self._stages['write'].add(time.perf_counter() - write_start)
+                if article:
+                    found += 1
+                    if keep_articles:
+                        articles.append(article)
+                    if max_articles is not None and found >= max_articles:
+                        break
+        finally:
+            stop.set()
+            for thread in fetchers + [dispatcher, closer]:
+                thread.join()
+            # Pages still queued after an early stop are not needed any more
+            while not raw_queue.empty():
+                item = raw_queue.get_nowait()
+                if item is not _DONE:
+                    self._release(item[2])
+            while not parsed_queue.empty():
+                item = parsed_queue.get_nowait()
+                if item is not _DONE:
+                    item[1].cancel()
+                    self._release(item[2])
+            self._wall_seconds += time.perf_counter() - start
+        return articles
+
+    # Items handled, busy time and items/sec of every stage, and the depth of the queues between them
+    def stats(self) -> Dict[str, dict]:
+        wall = self._wall_seconds or 1e-9
+        report = {
+            name: {
+                'items': stage.items,
+                'busy_seconds': round(stage.busy_seconds, 3),
+                'items_per_sec': round(stage.items / wall, 2),
+            }
+            for name, stage in self._stages.items()
+        }
+        report['parse']['processes'] = self.parser_processes
+        report['fetch']['workers'] = self.fetch_workers
+        report['queues'] = {
+            name: {
+                'max_depth': depth.max,
+                'mean_depth': round(depth.total / depth.samples, 2) if depth.samples else 0.0,
+                'capacity': self.queue_size,
+            }
+            for name, depth in self._queues.items()
+        }
+        report['wall_seconds'] = round(self._wall_seconds, 3)
+        return report
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
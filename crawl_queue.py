@@ -0,0 +1,386 @@
+import argparse
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from content_fingerprints import FingerprintStore
+from crawl_checkpoint import CrawlCheckpoint
+from crawl_metrics import CrawlMetrics
+from memory_budget import ByteBudget
+from web_scraper import (ArticleScraper, ArticleStreamWriter, SitemapParser, build_transport, crawl_article_urls,
+                         make_crawler, report_crawl, saved_pages_callback, sitemap_year_month, _is_past_month)
+
+logger = logging.getLogger(__name__)
+
+
+# Sharded crawl: a coordinator splits the crawl into tasks in a durable SQLite lease queue and any number
+# of worker processes (on this machine, or on machines sharing the directory) claim and run them.
+#
+#   coordinator  enqueue_sitemaps() reads the sitemap index and adds one task per monthly sitemap,
+#                or, with batch_size, one task per batch of article URLs
+#   workers      CrawlWorker.run() claims a task, holds a lease on it while scraping (renewed by a
+#                heartbeat), then marks it done with its result (articles, pages, seconds)
+#
+# A worker that crashes or hangs stops renewing its lease; once the lease expires the task goes back to
+# the next worker that claims, up to max_attempts times. Tasks are keyed (sitemap URL or batch), so
+# enqueuing again never duplicates work, and the shared CrawlCheckpoint skips pages a crashed worker had
+# already saved. Every worker writes its own files (output_directory/worker_<id>/), so no two processes
+# append to the same gzip file.
+#
+# SQLite locking needs a local disk; for several machines put the queue on a filesystem with working locks.
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+class LeaseQueue:
+    def __init__(self, path: str = os.path.join('data', 'crawl_queue.sqlite3'), lease_seconds: float = 300.0,
+                 max_attempts: int = 3):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # isolation_level=None: autocommit, claims use explicit BEGIN IMMEDIATE transactions
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires)")
+
+    # Adds a task unless its key is already queued; requeue=True also puts a finished task back to pending
+    def enqueue(self, key: str, payload: dict, requeue: bool = False) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO tasks (key, payload, state, updated_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(payload), PENDING, time.time()))
+            if cursor.rowcount == 0 and requeue:
+                cursor = self.conn.execute(
+                    "UPDATE tasks SET payload = ?, state = ?, attempts = 0, error = NULL, updated_at = ? "
+                    "WHERE key = ? AND state IN (?, ?)",
+                    (json.dumps(payload), PENDING, time.time(), key, DONE, FAILED))
+        return cursor.rowcount > 0
+
+    # Leases the oldest pending (or expired) task to owner; returns (task id, payload) or None
+    def claim(self, owner: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases that used up their attempts are given up on
+                self.conn.execute(
+                    "UPDATE tasks SET state = ?, owner = NULL, error = COALESCE(error, 'lease expired'), "
+                    "updated_at = ? WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                    (FAILED, now, LEASED, now, self.max_attempts))
+                row = self.conn.execute(
+                    "SELECT id, payload FROM tasks WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1", (PENDING, LEASED, now)).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE tasks SET state = ?, owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                        "updated_at = ? WHERE id = ?", (LEASED, owner, now + self.lease_seconds, now, row[0]))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    # Extends the lease; False when owner lost it (it expired and another worker claimed the task)
+    def renew(self, task_id: int, owner: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ? AND owner = ? AND state = ?",
+                (time.time() + self.lease_seconds, time.time(), task_id, owner, LEASED))
+        return cursor.rowcount > 0
+
+    def complete(self, task_id: int, owner: str, result: dict) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, lease_expires = NULL, result = ?, error = NULL, "
+                "updated_at = ? WHERE id = ? AND owner = ? AND state = ?",
+                (DONE, json.dumps(result), time.time(), task_id, owner, LEASED))
+        return cursor.rowcount > 0
+
+    # Gives the task back after an error; it fails for good after max_attempts
+    def release(self, task_id: int, owner: str, error: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, owner = NULL, "
+                "lease_expires = NULL, error = ?, updated_at = ? WHERE id = ? AND owner = ? AND state = ?",
+                (self.max_attempts, FAILED, PENDING, error, time.time(), task_id, owner, LEASED))
+        return cursor.rowcount > 0
+
+    # True while some task can still be claimed now or once a lease expires
+    def has_work(self) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM tasks WHERE state IN (?, ?) LIMIT 1", (PENDING, LEASED)).fetchone()
+        return row is not None
+
+    # Articles scraped by the tasks finished since the given time.time() (all of them by default)
+    def articles_done(self, since: float = 0.0) -> int:
+        with self._lock:
+            row = self.conn.execute("SELECT COALESCE(SUM(json_extract(result, '$.articles')), 0) FROM tasks "
+                                    "WHERE state = ? AND updated_at >= ?", (DONE, since)).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def results(self) -> List[dict]:
+        with self._lock:
+            rows = self.conn.execute("SELECT key, result FROM tasks WHERE state = ? ORDER BY id", (DONE,)).fetchall()
+        return [dict(json.loads(result), key=key) for key, result in rows]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Coordinator: one task per monthly sitemap, or per batch_size article URLs (URLs already in the
+# checkpoint are left out). Sitemaps of the current month are queued again on every run, because new
+# articles keep being added to them. Returns the number of tasks added.
+def enqueue_sitemaps(queue: LeaseQueue, sitemap_index_url: str, transport=None,
+                     checkpoint: Optional[CrawlCheckpoint] = None, batch_size: Optional[int] = None) -> int:
+    sitemap_parser = SitemapParser(sitemap_index_url, transport)
+    added = 0
+    for monthly_url in sitemap_parser.get_monthly_sitemap_urls():
+        try:
+            year, month = sitemap_year_month(monthly_url)
+        except IndexError as e:
+            logger.error("Could not extract year and month from URL: %s. Error: %s", monthly_url, e)
+            continue
+        if checkpoint and checkpoint.is_sitemap_completed(monthly_url):
+            logger.info("Skipping completed sitemap %s", monthly_url)
+            continue
+        current_month = not _is_past_month(year, month)
+        if not batch_size:
+            added += queue.enqueue(monthly_url, {'sitemap': monthly_url}, requeue=current_month)
+            continue
+        article_urls = sitemap_parser.get_article_urls(monthly_url)
+        if checkpoint:
+            article_urls = checkpoint.pending_urls(article_urls)
+        for start in range(0, len(article_urls), batch_size):
+            batch = article_urls[start:start + batch_size]
+            added += queue.enqueue(f'{monthly_url}#{batch[0]}', {'sitemap': monthly_url, 'urls': batch})
+    logger.info("Queued %d crawl tasks, queue: %s", added, queue.counts())
+    return added
+
+
+class CrawlWorker:
+    # transport/checkpoint/engine/concurrency/parser_processes as in web_scraper.main();
+    # articles go to output_directory/worker_<worker_id>/
+    def __init__(self, queue: LeaseQueue, worker_id: Optional[str] = None, transport=None,
+                 checkpoint: Optional[CrawlCheckpoint] = None, engine: str = 'soup', concurrency: int = 1,
+                 parser_processes: int = 0, output_directory: str = 'data',
+                 metrics: Optional[CrawlMetrics] = None, sink=None, frontier=None, fingerprints=None,
+                 typed_articles: bool = False, memory_budget: Optional[int] = None):
+        self.queue = queue
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.transport = transport or build_transport(concurrency, http_cache=None)
+        self.checkpoint = checkpoint
+        self.sink = sink
+        self.frontier = frontier
+        self.metrics = metrics or CrawlMetrics()
+        self.article_scraper = ArticleScraper(self.transport, engine, self.metrics, fingerprints,
+                                              ByteBudget(memory_budget) if memory_budget else None)
+        self.sitemap_parser = SitemapParser(None, self.transport)
+        self.crawler = make_crawler(self.transport, self.article_scraper, concurrency, parser_processes, engine,
+                                    self.metrics)
+        self.writer = ArticleStreamWriter(os.path.join(output_directory, f'worker_{self.worker_id}'),
+                                          on_flush=saved_pages_callback(checkpoint, fingerprints),
+                                          typed=typed_articles)
+
+    def _heartbeat(self, task_id: int, done: threading.Event):
+        while not done.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(task_id, self.worker_id):
+                logger.warning("Worker %s lost the lease of task %d", self.worker_id, task_id)
+                return
+
+    def process(self, payload: dict, max_articles: Optional[int] = None) -> dict:
+        start = time.perf_counter()
+        monthly_url = payload['sitemap']
+        year, month = sitemap_year_month(monthly_url)
+        article_urls = payload.get('urls')
+        if article_urls is None:
+            article_urls = self.sitemap_parser.get_article_urls(monthly_url)
+        if self.frontier:
+            article_urls = self.frontier.claim(article_urls, monthly_url)
+        if self.checkpoint:
+            article_urls = self.checkpoint.pending_urls(article_urls)
+        # A whole sitemap of a past month is finished for good once its articles are on disk (unless a page
+        # failed or the article limit cut it short, see crawl_article_urls)
+        on_complete = None
+        if self.checkpoint and 'urls' not in payload and _is_past_month(year, month):
+            on_complete = functools.partial(self.checkpoint.mark_sitemap_completed, monthly_url)
+        articles = crawl_article_urls(article_urls, year, month, self.writer, self.crawler, self.article_scraper,
+                                      max_articles, sink=self.sink, on_complete=on_complete)
+        return {'articles': articles, 'pages': len(article_urls), 'seconds': round(time.perf_counter() - start, 3),
+                'worker': self.worker_id}
+
+    # Claims and runs tasks until the queue is drained (or all workers together scraped max_articles since
+    # the time.time() `since`); returns the number of articles this worker scraped
+    def run(self, max_articles: Optional[int] = None, since: Optional[float] = None, poll_interval: float = 1.0) -> int:
+        scraped = 0
+        since = time.time() if since is None else since
+        while True:
+            remaining = None if max_articles is None else max_articles - self.queue.articles_done(since)
+            if remaining is not None and remaining <= 0:
+                logger.info("Reached the limit of %d articles. Stopping.", max_articles)
+                break
+            task = self.queue.claim(self.worker_id)
+            if task is None:
+                if not self.queue.has_work():
+                    break
+                # Tasks are leased by other workers, one may come back if its worker died
+                time.sleep(poll_interval)
+                continue
+            task_id, payload = task
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(task_id, done), daemon=True)
+            heartbeat.start()
+            try:
+                result = self.process(payload, remaining)
+            except Exception as e:
+                logger.error("Task %d (%s) failed on worker %s: %s", task_id, payload['sitemap'], self.worker_id, e)
+                self.queue.release(task_id, self.worker_id, repr(e))
+                continue
+            finally:
+                done.set()
+                heartbeat.join()
+            scraped += result['articles']
+            if not self.queue.complete(task_id, self.worker_id, result):
+                logger.warning("Task %d finished after its lease expired, it may have been run twice", task_id)
+        self.writer.close()
+        if self.sink:
+            self.sink.flush()
+        return scraped
+
+    def close(self):
+        self.writer.close()
+        if hasattr(self.crawler, 'close'):
+            self.crawler.close()
+
+
+def _worker_main(worker_id: str, queue_path: str, lease_seconds: float, options: dict):
+    logging.basicConfig(level=options.get('log_level', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s')
+    queue = LeaseQueue(queue_path, lease_seconds)
+    checkpoint = CrawlCheckpoint(options['checkpoint']) if options.get('checkpoint') else None
+    transport = build_transport(options.get('concurrency', 1), **options.get('transport', {}))
+    metrics = CrawlMetrics()
+    sink = None
+    if options.get('sink'):
+        from mongo_sink import MongoArticleSink
+        sink = MongoArticleSink(**options['sink'])
+    frontier = None
+    if options.get('frontier'):
+        from url_frontier import UrlFrontier
+        frontier = UrlFrontier(**options['frontier'])
+    fingerprints = FingerprintStore(options['fingerprints']) if options.get('fingerprints') else None
+    worker = CrawlWorker(queue, worker_id, transport, checkpoint, options.get('engine', 'soup'),
+                         options.get('concurrency', 1), options.get('parser_processes', 0),
+                         options.get('output_directory', 'data'), metrics, sink, frontier, fingerprints,
+                         options.get('typed_articles', False), options.get('memory_budget'))
+    worker.run(options.get('max_articles'), options.get('since'))
+    metrics_path = options.get('metrics_path')
+    report_crawl(transport, worker.crawler, metrics,
+                 metrics_path and metrics_path.replace('.json', f'_worker_{worker_id}.json'), sink, frontier,
+                 fingerprints, budget=worker.article_scraper.budget)
+    if sink:
+        sink.close()
+    queue.close()
+
+
+# Runs `workers` local worker processes on the queue and waits for them; options configure every
+# worker (checkpoint path, engine, concurrency, parser_processes, output_directory, max_articles,
+# metrics_path, log_level, transport: keyword arguments of web_scraper.build_transport, and
+# sink: keyword arguments of mongo_sink.MongoArticleSink, frontier: of url_frontier.UrlFrontier,
+# fingerprints: path of the content_fingerprints.FingerprintStore, typed_articles, memory_budget: see main()).
+# The per-host request rate limits are shared out between the workers.
+def run_workers(queue_path: str, workers: int, options: dict, lease_seconds: float = 300.0) -> Dict[str, object]:
+    start = time.perf_counter()
+    transport_options = dict(options.get('transport', {}))
+    if transport_options.get('record_archive'):
+        raise ValueError("Recording an archive is not supported with several worker processes")
+    for name, default in (('initial_rate', 5.0), ('max_rate', 100.0)):
+        transport_options[name] = transport_options.get(name, default) / workers
+    options = dict(options, transport=transport_options, since=time.time())
+
+    processes = [multiprocessing.Process(target=_worker_main, name=f'worker-{index}',
+                                         args=(str(index), queue_path, lease_seconds, options))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    with LeaseQueue(queue_path, lease_seconds) as queue:
+        report = {'tasks': queue.counts(), 'articles': queue.articles_done(options['since']),
+                  'seconds': round(time.perf_counter() - start, 3), 'workers': workers}
+    logger.info("Workers finished: %d articles in %.1fs, tasks %s", report['articles'], report['seconds'],
+                report['tasks'])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded crawl through a SQLite lease queue")
+    parser.add_argument('command', choices=('enqueue', 'work', 'status'),
+                        help="enqueue: queue the sitemaps; work: run worker processes; status: show the queue")
+    parser.add_argument('--queue', default=os.path.join('data', 'crawl_queue.sqlite3'), help="Lease queue file")
+    parser.add_argument('--sitemap-index', default='https://www.almayadeen.net/sitemaps/all.xml')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="Queue batches of this many article URLs instead of whole monthly sitemaps")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes to start")
+    parser.add_argument('--lease', type=float, default=300.0, help="Seconds a task stays leased without heartbeat")
+    parser.add_argument('--max-articles', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=1, help="Fetch threads per worker")
+    parser.add_argument('--engine', choices=ArticleScraper.ENGINES, default='soup')
+    parser.add_argument('--checkpoint', default=os.path.join('data', 'crawl_checkpoint.sqlite3'))
+    parser.add_argument('--output-directory', default='data')
+    parser.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'enqueue':
+        with LeaseQueue(args.queue, args.lease) as crawl_queue, CrawlCheckpoint(args.checkpoint) as crawl_checkpoint:
+            enqueue_sitemaps(crawl_queue, args.sitemap_index, build_transport(), crawl_checkpoint, args.batch_size)
+    elif args.command == 'work':
+        run_workers(args.queue, args.workers,
+                    {'checkpoint': args.checkpoint, 'engine': args.engine, 'concurrency': args.concurrency,
+                     'output_directory': args.output_directory, 'max_articles': args.max_articles,
+                     'log_level': args.log_level},
+                    args.lease)
+    else:
+        with LeaseQueue(args.queue, args.lease) as crawl_queue:
+            print(json.dumps({'tasks': crawl_queue.counts(), 'articles': crawl_queue.articles_done()}, indent=4))
@@ -1,16 +1,311 @@
-import pymongo
+import argparse
+import collections
 import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from article_model import TypedArticle, parse_date
+from corpus_shards import iter_shard, read_manifest
+from mongo_indexes import ensure_indexes
+from web_scraper import FileUtility
+
+logger = logging.getLogger(__name__)
+
+
+COUNTS = ('inserted', 'updated', 'skipped', 'failed')
+
+
+def _updated_at(document: dict):
+    return parse_date(document.get('last_updated_date')) or parse_date(document.get('publication_date'))
+
+
+# True when document has to be written over the stored one: it was updated after it, or the stored one
+# has no date
+def _is_newer(document: dict, stored: dict) -> bool:
+    updated, stored_updated = _updated_at(document), _updated_at(stored)
+    return updated is not None and (stored_updated is None or updated > stored_updated)
+
+
+# Upserts one batch keyed on post_id (url for articles without one) and returns its inserted, updated,
+# skipped and failed counts. The stored last_updated_date of the batch's articles is read first, in one
+# query on the unique post_id index, and only the new and the newer articles are sent, as one unordered
+# bulk_write: loading the same dump again costs one read per batch and writes nothing. Of the copies of
+# an article within the batch only the newest is kept.
+# A lost connection is retried up to max_retries times with a growing pause.
+def upsert_batch(collection, documents: List[dict], max_retries: int = 3) -> Dict[str, int]:
+    counts = dict.fromkeys(COUNTS, 0)
+    latest: Dict[str, dict] = {}
+    keyless = []
+    for document in documents:
+        post_id = document.get('post_id')
+        if not post_id:
+            keyless.append(document)
+        elif post_id not in latest or _is_newer(document, latest[post_id]):
+            latest[post_id] = document
+    counts['skipped'] += len(documents) - len(keyless) - len(latest)
+
+    for attempt in range(max_retries + 1):
+        try:
+            stored = {existing['post_id']: existing for existing in collection.find(
+                {'post_id': {'$in': list(latest)}}, {'_id': 0, 'post_id': 1, 'last_updated_date': 1,
+                                                      'publication_date': 1})}
+            operations = [UpdateOne({'post_id': post_id}, {'$set': document}, upsert=True)
+                          for post_id, document in latest.items()
+                          if post_id not in stored or _is_newer(document, stored[post_id])]
+            operations += [UpdateOne({'url': document.get('url')}, {'$set': document}, upsert=True)
+                           for document in keyless]
+            skipped = len(latest) + len(keyless) - len(operations)
+            if not operations:
+                counts['skipped'] += skipped
+                return counts
+            try:
+                details = collection.bulk_write(operations, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                # Unordered: every operation without an error was applied
+                details = e.details
+                logger.error("%d of %d article upserts failed: %s", len(details['writeErrors']), len(operations),
+                             details['writeErrors'][0].get('errmsg'))
+                counts['failed'] += len(details['writeErrors'])
+            counts['skipped'] += skipped
+            counts['inserted'] += details.get('nUpserted', 0)
+            counts['updated'] += details.get('nMatched', 0)
+            return counts
+        except AutoReconnect as e:
+            if attempt == max_retries:
+                raise
+            logger.warning("MongoDB connection lost (%s), retrying the batch in %ds", e, 2 ** attempt)
+            time.sleep(2 ** attempt)
+
+
+# Deletes all but the newest copy (by last_updated_date) of every post_id, which the unique post_id index
+# needs on a collection filled by the insert-only loads of older versions; returns the number deleted
+def remove_duplicate_post_ids(collection) -> int:
+    removed = 0
+    groups = collection.aggregate([
+        {'$match': {'post_id': {'$type': 'string'}}},
+        {'$group': {'_id': '$post_id', 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ], allowDiskUse=True)
+    for group in groups:
+        copies = list(collection.find({'post_id': group['_id']}, {'last_updated_date': 1, 'publication_date': 1}))
+        copies.sort(key=lambda copy: (_updated_at(copy) is not None, _updated_at(copy) or 0, copy['_id']),
+                    reverse=True)
+        removed += collection.delete_many({'_id': {'$in': [copy['_id'] for copy in copies[1:]]}}).deleted_count
+    return removed
+
+
+# load_articles upserts a stream of articles into collection in batches of batch_size (upsert_batch), so
+# memory holds a few batches whatever the size of the dump (FileUtility.iter_articles reads JSON arrays,
+# JSON lines and corpus directories, gzip or plain, one article at a time). The collection should have the
+# unique post_id index (mongo_indexes.ensure_indexes, applied by main and parallel_load).
+#
+# With writers > 1 that many threads send batches at the same time (pymongo releases the GIL while it
+# waits for the server), so the next batches are parsed while the previous ones are written; at most
+# 2 * writers batches are waiting.
+# The articles are stored as article_model.TypedArticle documents, the fields the app.py endpoints query
+# (typed=False keeps the scraped strings).
+# Returns the inserted, updated, skipped, failed and total counts, the elapsed seconds and docs/sec.
+
+def load_articles(collection, articles: Iterable[dict], batch_size: int = 1000, typed: bool = True,
+                  max_retries: int = 3, progress_interval: float = 10.0, writers: int = 1) -> dict:
+    if batch_size < 1 or writers < 1:
+        raise ValueError("batch_size and writers must be at least 1")
+    stats = dict.fromkeys(COUNTS + ('batches',), 0)
+    start = last_report = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=writers) if writers > 1 else None
+    pending = collections.deque()
+
+    def count(counts):
+        for key in COUNTS:
+            stats[key] += counts[key]
+        stats['batches'] += 1
+
+    def submit(documents):
+        if executor is None:
+            count(upsert_batch(collection, documents, max_retries))
+            return
+        pending.append(executor.submit(upsert_batch, collection, documents, max_retries))
+        while len(pending) >= 2 * writers:
+            count(pending.popleft().result())
+
+    batch = []
+    try:
+        for article in articles:
+            batch.append(TypedArticle.from_document(article).to_document() if typed else article)
+            if len(batch) >= batch_size:
+                submit(batch)
+                batch = []
+                now = time.perf_counter()
+                if now - last_report >= progress_interval:
+                    last_report = now
+                    processed = sum(stats[key] for key in COUNTS)
+                    logger.info("%d articles loaded, %.0f docs/sec", processed, processed / (now - start))
+        if batch:
+            submit(batch)
+        while pending:
+            count(pending.popleft().result())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    stats['total'] = sum(stats[key] for key in COUNTS)
+    stats['seconds'] = round(elapsed, 3)
+    stats['docs_per_sec'] = round(stats['total'] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+# The parts a dump can be split into for parallel_load, each read by one process:
+#   ('shard', directory, shard, codec)  a shard of a corpus_shards.py directory
+#   ('range', path, start, end)         the lines starting in [start, end) of a plain JSON lines file
+#   ('file', path)                      a whole file: gzip streams and JSON arrays can't be split
+def split_dump(file_path: str, parts: int, min_range: int = 2 ** 20) -> List[tuple]:
+    if os.path.isdir(file_path):
+        manifest = read_manifest(file_path)
+        return [('shard', file_path, shard, manifest['codec']) for shard in manifest['shards']]
+    with open(file_path, 'rb') as f:
+        head = f.read(64 * 1024)
+    if head[:2] == b'\x1f\x8b' or head.lstrip().startswith(b'['):
+        logger.info("%s can only be read by one process, convert it with corpus_shards.py to split it", file_path)
+        return [('file', file_path)]
+    size = os.path.getsize(file_path)
+    step = max(min_range, -(-size // max(parts, 1)))
+    return [('range', file_path, start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def iter_part(part: tuple) -> Iterator[dict]:
+    kind = part[0]
+    if kind == 'shard':
+        yield from iter_shard(part[1], part[2], part[3])
+    elif kind == 'file':
+        yield from FileUtility.iter_articles(part[1])
+    else:
+        _, path, start, end = part
+        with open(path, 'rb') as f:
+            if start:
+                # Skip the rest of a line that started before this range (it belongs to the previous one)
+                f.seek(start - 1)
+                f.readline()
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield json.loads(line)
+
+
+# Per-process state of the parallel_load workers: each process has its own client and connection pool
+_worker = {}
+
+
+def _init_worker(uri: str, database: str, collection_name: str, options: dict):
+    client = pymongo.MongoClient(uri, maxPoolSize=max(options['writers'], 1) + 1)
+    _worker.update(client=client, collection=client[database][collection_name], options=options)
+
+
+def _load_part(part: tuple) -> dict:
+    options = _worker['options']
+    return load_articles(_worker['collection'], iter_part(part), options['batch_size'], options['typed'],
+                         progress_interval=float('inf'), writers=options['writers'])
+
+
+# parallel_load splits the dump (split_dump) over `workers` processes, which decompress and parse their
+# parts and write them with `writers` concurrent bulk upsert threads each, through their own
+# MongoClient. The throughput grows with workers until the server (or the client machine) saturates,
+# see benchmarks/bench_ingest.py. Returns the same statistics as load_articles, plus workers and parts.
+def parallel_load(file_path: str, workers: int = 4, writers: int = 2,
+                  uri: str = 'mongodb://localhost:27017/', database: str = 'almayadeen',
+                  collection_name: str = 'articles', batch_size: int = 1000, typed: bool = True) -> dict:
+    client = pymongo.MongoClient(uri)
+    try:
+        ensure_indexes(client[database][collection_name])
+    finally:
+        client.close()
+    parts = split_dump(file_path, workers * 4)
+    options = {'batch_size': batch_size, 'typed': typed, 'writers': writers}
+    totals = dict.fromkeys(COUNTS + ('batches',), 0)
+    start = last_report = time.perf_counter()
+    with multiprocessing.Pool(min(workers, len(parts)), initializer=_init_worker,
+                              initargs=(uri, database, collection_name, options)) as pool:
+        for stats in pool.imap_unordered(_load_part, parts):
+            for key in totals:
+                totals[key] += stats[key]
+            now = time.perf_counter()
+            if now - last_report >= 10:
+                last_report = now
+                processed = sum(totals[key] for key in COUNTS)
+                logger.info("%d articles loaded, %.0f docs/sec", processed, processed / (now - start))
+    elapsed = time.perf_counter() - start
+    total = sum(totals[key] for key in COUNTS)
+    totals.update(total=total, seconds=round(elapsed, 3), docs_per_sec=round(total / elapsed, 1) if elapsed else 0.0,
+                  workers=workers, parts=len(parts))
+    return totals
 
-# Connect to MongoDB
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["almayadeen"]
-collection = db["articles"]
 
-file_path = 'data//all_articles_original_20K.json'
+def main(file_path: str = 'data/all_articles_original_2K.json.gz',
+         uri: str = 'mongodb://localhost:27017/',
+         database: str = 'almayadeen',
+         collection_name: str = 'articles',
+         batch_size: int = 1000,
+         typed: bool = True,
+         collection=None,
+         workers: int = 0,
+         writers: int = 1,
+         remove_duplicates: bool = False) -> dict:
+    # workers > 0 loads the dump with parallel_load (collection is then ignored, every process connects to uri)
+    if remove_duplicates:
+        client = pymongo.MongoClient(uri) if collection is None else None
+        target = collection if collection is not None else client[database][collection_name]
+        try:
+            logger.info("Removed %d duplicate articles", remove_duplicate_post_ids(target))
+        finally:
+            if client is not None:
+                client.close()
+    if workers > 0:
+        stats = parallel_load(file_path, workers, writers, uri, database, collection_name, batch_size, typed)
+    else:
+        client: Optional[pymongo.MongoClient] = None
+        if collection is None:
+            client = pymongo.MongoClient(uri)
+            collection = client[database][collection_name]
+        try:
+            ensure_indexes(collection)
+            stats = load_articles(collection, FileUtility.iter_articles(file_path), batch_size, typed,
+                                  writers=writers)
+        finally:
+            if client is not None:
+                client.close()
+    logger.info("Loaded %s: %d articles inserted, %d updated, %d skipped (not newer), %d failed, in %d batches, "
+                "%.1fs (%.0f docs/sec)", file_path, stats['inserted'], stats['updated'], stats['skipped'],
+                stats['failed'], stats['batches'], stats['seconds'], stats['docs_per_sec'])
+    return stats
 
-# Load and insert JSON data
-with open(file_path, 'rt', encoding='utf-8') as f:
-    data = json.load(f)
-    collection.insert_many(data)
 
-print("Data inserted successfully!")
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load an article dump into MongoDB")
+    parser.add_argument('file', nargs='?', default='data/all_articles_original_2K.json.gz',
+                        help="JSON array or JSON lines dump (gzip or plain), or a corpus_shards.py directory")
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--mongo-database', default='almayadeen')
+    parser.add_argument('--mongo-collection', default='articles')
+    parser.add_argument('--batch-size', type=int, default=1000, help="Articles per bulk upsert")
+    parser.add_argument('--raw-articles', action='store_true',
+                        help="Store the scraped strings instead of typed articles (the app.py endpoints need typed ones)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Processes reading shards or byte ranges of the dump in parallel (0 = this process)")
+    parser.add_argument('--writers', type=int, default=1, help="Concurrent bulk upserts per process")
+    parser.add_argument('--remove-duplicates', action='store_true',
+                        help="First delete all but the newest copy of every post_id (needed by the unique index "
+                             "on a collection loaded by older versions)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s')
+    main(args.file, args.mongo_uri, args.mongo_database, args.mongo_collection, args.batch_size,
+         not args.raw_articles, workers=args.workers, writers=args.writers, remove_duplicates=args.remove_duplicates)
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, NamedTuple, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+
+# The HttpArchive class is a compact, WARC-like record of HTTP responses, so crawls can be
+# benchmarked and regression-tested without touching almayadeen.net:
+#
+#   RecordingTransport wraps the live transport and appends every response it returns to the archive
+#   ReplayTransport serves the archived responses back, with a fixed latency per request and an
+#   optional bandwidth limit, so a full web_scraper.main() run can be reproduced offline and timed
+#
+# The archive is one file of concatenated gzip members, one member per response:
+#   {"url": ..., "status": ..., "headers": {...}, "length": ..., "recorded_at": ...}\n<body bytes>
+# Like a .warc.gz file it is append-only, stays readable with zcat, and an interrupted recording
+# only loses its incomplete last member. When a URL was recorded more than once the last one wins.
+
+# Response headers kept in the archive, so a replayed response looks like the original one
+ARCHIVED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After')
+
+_READ_CHUNK = 64 * 1024
+
+
+def _gzip_member(data: bytes) -> bytes:
+    # One gzip member (same format as gzip.compress, without the timestamp so archives are reproducible)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ArchivedResponse(NamedTuple):
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class HttpArchive:
+    def __init__(self, path: str = os.path.join('data', 'http_archive.warc.gz')):
+        self.path = path
+        self._lock = threading.Lock()
+        # url -> (offset, length) of the gzip member holding its latest response
+        self._index = {}
+        self._append = None
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if os.path.exists(path):
+            self._load_index()
+
+    def _load_index(self):
+        end = 0
+        with open(self.path, 'rb') as f:
+            for offset, length, header, _ in self._iter_members(f):
+                self._index[header['url']] = (offset, length)
+                end = offset + length
+        size = os.path.getsize(self.path)
+        if end < size:
+            logger.warning('Removing %d bytes of an incomplete record from %s', size - end, self.path)
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+
+    @staticmethod
+    def _iter_members(f) -> Iterator[tuple]:
+        # Yields (offset, compressed length, header, body) of every complete member
+        offset = 0
+        pending = b''
+        while True:
+            decompressor = zlib.decompressobj(wbits=31)
+            output = []
+            consumed = 0
+            while not decompressor.eof:
+                chunk = pending or f.read(_READ_CHUNK)
+                pending = b''
+                if not chunk:
+                    return
+                try:
+                    output.append(decompressor.decompress(chunk))
+                except zlib.error:
+                    return
+                consumed += len(chunk)
+            pending = decompressor.unused_data
+            length = consumed - len(pending)
+            header_line, _, body = b''.join(output).partition(b'\n')
+            yield offset, length, json.loads(header_line), body
+            offset += length
+
+    @staticmethod
+    def _encode(response: ArchivedResponse) -> bytes:
+        header = {
+            'url': response.url,
+            'status': response.status,
+            'headers': response.headers,
+            'length': len(response.body),
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+        }
+        return _gzip_member(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n' + response.body)
+
+    def record(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        member = self._encode(ArchivedResponse(url, status, headers, body))
+        with self._lock:
+            if self._append is None:
+                self._append = open(self.path, 'ab')
+            offset = self._append.tell()
+            self._append.write(member)
+            self._append.flush()
+            self._index[url] = (offset, len(member))
+
+    def get(self, url: str) -> Optional[ArchivedResponse]:
+        with self._lock:
+            location = self._index.get(url)
+            if location is None:
+                return None
+            offset, length = location
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                member = f.read(length)
+        header_line, _, body = zlib.decompress(member, wbits=31).partition(b'\n')
+        header = json.loads(header_line)
+        return ArchivedResponse(header['url'], header['status'], header['headers'], body)
+
+    def urls(self):
+        return list(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, url: str):
+        return url in self._index
+
+    def close(self):
+        with self._lock:
+            if self._append is not None:
+                self._append.close()
+                self._append = None
+
+
+class RecordingTransport:
+    def __init__(self, transport, archive: HttpArchive):
+        self.transport = transport
+        self.archive = archive
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        response = self.transport.get(url, **kwargs)
+        # A 304 only makes sense next to the cache that asked for it, the archive keeps full responses
+        if response.status_code != 304:
+            headers = {name: response.headers[name] for name in ARCHIVED_HEADERS if name in response.headers}
+            self.archive.record(url, response.status_code, headers, response.content)
+        return response
+
+    def connection_stats(self) -> Dict[str, int]:
+        return self.transport.connection_stats()
+
+    def close(self):
+        self.transport.close()
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ReplayTransport:
+    # latency: seconds added to every request; bandwidth: bytes/sec the body is "downloaded" at (None = unlimited)
+    # URLs missing from the archive are answered with 404, like a page that does not exist
+    def __init__(self, archive: HttpArchive, latency: float = 0.0, bandwidth: Optional[float] = None):
+        self.archive = archive
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.misses = 0
+
+    @staticmethod
+    def _not_modified(request_headers: Dict[str, str], headers: Dict[str, str]) -> bool:
+        # Answers conditional requests like the live site, so a CachingTransport on top behaves the same
+        request_headers = CaseInsensitiveDict(request_headers or {})
+        if 'If-None-Match' in request_headers and 'ETag' in headers:
+            return request_headers['If-None-Match'] == headers['ETag']
+        if 'If-Modified-Since' in request_headers and 'Last-Modified' in headers:
+            try:
+                return parsedate_to_datetime(headers['Last-Modified']) <= \
+                    parsedate_to_datetime(request_headers['If-Modified-Since'])
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        archived = self.archive.get(url)
+        with self._lock:
+            self.requests += 1
+            if archived is None:
+                self.misses += 1
+
+        response = requests.Response()
+        response.url = url
+        response._content_consumed = True
+        if archived is None:
+            response.status_code = 404
+            response._content = b''
+        elif self._not_modified(kwargs.get('headers'), archived.headers):
+            response.status_code = 304
+            response.headers = CaseInsensitiveDict(archived.headers)
+            response._content = b''
+        else:
+            response.status_code = archived.status
+            response.headers = CaseInsensitiveDict(archived.headers)
+            response._content = archived.body
+
+        delay = self.latency
+        if self.bandwidth:
+            delay += len(response._content) / self.bandwidth
+        if delay:
+            time.sleep(delay)
+        return response
+
+    def replay_stats(self) -> Dict[str, int]:
+        return {'requests': self.requests, 'misses': self.misses, 'archived_urls': len(self.archive)}
+
+    # Replayed requests never open a connection
+    def connection_stats(self) -> Dict[str, int]:
+        return {'requests': self.requests, 'new_connections': 0, 'reused_connections': 0}
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
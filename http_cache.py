@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+# The HttpCache class keeps response bodies on disk together with their ETag/Last-Modified validators.
+# The CachingTransport wraps an HttpTransport: it sends If-None-Match/If-Modified-Since for URLs that
+# are in the cache and, when the server answers 304 Not Modified, serves the stored body instead of
+# downloading it again. Monthly sitemaps of past months and unchanged article pages then cost one
+# small conditional request each.
+#
+# Bodies live in <directory>/bodies/<sha256 of url>, the index in <directory>/index.sqlite3.
+# When the stored bodies exceed max_bytes the least recently used entries are evicted.
+#
+# Streamed requests (stream=True, the sitemaps) stay streamed: a new body is written to the cache chunk by
+# chunk as the caller consumes it, and a cached one is read from its file, so neither is held in memory.
+
+# Response headers kept with the body, so a cached response looks like the original one
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class HttpCache:
+    def __init__(self, directory: str = os.path.join('data', 'http_cache'), max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.bodies_directory = os.path.join(directory, 'bodies')
+        if not os.path.exists(self.bodies_directory):
+            os.makedirs(self.bodies_directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.sqlite3'), isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                headers TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        # Running total of the stored bodies, kept up to date on every insert and delete
+        self._total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _body_path(self, url: str) -> str:
+        return os.path.join(self.bodies_directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    # Returns (headers, body) for a cached URL, or None
+    def get(self, url: str):
+        with self._lock:
+            row = self.conn.execute("SELECT headers FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self._body_path(url), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                # The body was removed behind our back, forget the entry
+                self._forget(url)
+                return None
+            self.conn.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+        return json.loads(row[0]), body
+
+    # Returns (headers, open body file) for a cached URL, or None
+    def open(self, url: str):
+        with self._lock:
+            row = self.conn.execute("SELECT headers FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            try:
+                body = open(self._body_path(url), 'rb')
+            except OSError:
+                self._forget(url)
+                return None
+            self.conn.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+        return json.loads(row[0]), body
+
+    # Returns the conditional request headers for a cached URL
+    def validators(self, url: str) -> Dict[str, str]:
+        with self._lock:
+            row = self.conn.execute("SELECT headers FROM entries WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return {}
+        headers = json.loads(row[0])
+        conditional = {}
+        if headers.get('ETag'):
+            conditional['If-None-Match'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            conditional['If-Modified-Since'] = headers['Last-Modified']
+        return conditional
+
+    def store(self, url: str, headers: Dict[str, str], body: bytes):
+        temporary_path = self._temporary_path(url)
+        with open(temporary_path, 'wb') as f:
+            f.write(body)
+        self._commit(url, headers, temporary_path, len(body))
+
+    # Stores a body written chunk by chunk: returns a BodyWriter whose commit() adds the entry
+    def writer(self, url: str, headers: Dict[str, str]) -> 'BodyWriter':
+        return BodyWriter(self, url, headers)
+
+    def _temporary_path(self, url: str) -> str:
+        return f'{self._body_path(url)}.{threading.get_ident()}.tmp'
+
+    def _commit(self, url: str, headers: Dict[str, str], temporary_path: str, size: int):
+        path = self._body_path(url)
+        with self._lock:
+            # Replace the body atomically so readers never see a half written file
+            os.replace(temporary_path, path)
+            previous = self.conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (url, headers, size, last_access) VALUES (?, ?, ?, ?)",
+                (url, json.dumps(headers), size, time.time()))
+            self._total += size - (previous[0] if previous else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    # Deletes the entry of url (called with the lock held)
+    def _forget(self, url: str):
+        row = self.conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self._total -= row[0]
+
+    def _evict(self):
+        # The least recently used entries, a few at a time, until the total fits again
+        while self._total > self.max_bytes:
+            rows = self.conn.execute("SELECT url FROM entries ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                break
+            for url, in rows:
+                if self._total <= self.max_bytes:
+                    break
+                self._forget(url)
+                try:
+                    os.remove(self._body_path(url))
+                except OSError:
+                    pass
+
+    def size(self) -> int:
+        with self._lock:
+            return self._total
+
+    def close(self):
+        self.conn.close()
+
+
+class BodyWriter:
+    def __init__(self, cache: HttpCache, url: str, headers: Dict[str, str]):
+        self.cache = cache
+        self.url = url
+        self.headers = headers
+        self.size = 0
+        self.temporary_path = cache._temporary_path(url)
+        self.file = open(self.temporary_path, 'wb')
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        self.file.close()
+        self.cache._commit(self.url, self.headers, self.temporary_path, self.size)
+
+    # A body that was not read to the end is not stored
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.temporary_path)
+        except OSError:
+            pass
+
+
+class CachingTransport:
+    def __init__(self, transport, cache: HttpCache):
+        self.transport = transport
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _cached_response(url: str, headers: Dict[str, str], body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response._content_consumed = True
+        response.from_cache = True
+        return response
+
+    # A cached body for a streamed request, read from its file as the caller iterates over it
+    @staticmethod
+    def _streamed_response(url: str, headers: Dict[str, str], body) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(headers)
+        response.raw = body
+        response.from_cache = True
+        return response
+
+    # Stores the body of a streamed response while the caller consumes it (iter_content, or content which
+    # reads through iter_content); it is only stored when it was read to the end
+    def _tee(self, url: str, headers: Dict[str, str], response: requests.Response):
+        iter_content = response.iter_content
+
+        def tee(chunk_size=1, decode_unicode=False):
+            if decode_unicode:
+                yield from iter_content(chunk_size, decode_unicode)
+                return
+            writer = self.cache.writer(url, headers)
+            try:
+                for chunk in iter_content(chunk_size):
+                    writer.write(chunk)
+                    yield chunk
+            except BaseException:
+                writer.discard()
+                raise
+            writer.commit()
+        response.iter_content = tee
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        request_headers = dict(kwargs.pop('headers', None) or {})
+        request_headers.update(self.cache.validators(url))
+        response = self.transport.get(url, headers=request_headers, **kwargs)
+        stream = kwargs.get('stream', False)
+
+        if response.status_code == 304:
+            cached = self.cache.open(url) if stream else self.cache.get(url)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                response.close()
+                return self._streamed_response(url, *cached) if stream else self._cached_response(url, *cached)
+            # Evicted between the validators lookup and the answer, ask again without validators
+            for name in ('If-None-Match', 'If-Modified-Since'):
+                request_headers.pop(name, None)
+            response = self.transport.get(url, headers=request_headers, **kwargs)
+
+        with self._lock:
+            self.misses += 1
+        # Only responses with a validator can be revalidated later, so only those are stored
+        if response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+            headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+            if stream:
+                self._tee(url, headers, response)
+            else:
+                self.cache.store(url, headers, response.content)
+        response.from_cache = False
+        return response
+
+    def cache_stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size_bytes': self.cache.size(),
+        }
+
+    def connection_stats(self) -> Dict[str, int]:
+        return self.transport.connection_stats()
+
+    def close(self):
+        self.transport.close()
+        self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
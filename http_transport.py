@@ -0,0 +1,92 @@
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# The HttpTransport class is the single place where the scraper talks HTTP.
+# It keeps one requests.Session with a pool of keep-alive connections per host, so
+# SitemapParser and ArticleScraper reuse open TCP/TLS connections instead of paying
+# a new handshake for every page.
+
+class _CountingAdapter(HTTPAdapter):
+    # HTTPAdapter that counts the requests it sends and the connections its pools open.
+    # Every request that did not need a new connection went over a reused keep-alive one.
+
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.new_connection_count = 0
+        super().__init__(*args, **kwargs)
+
+    def _count_new_connection(self):
+        with self._lock:
+            self.new_connection_count += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                adapter._count_new_connection()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                adapter._count_new_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.request_count += 1
+        return super().send(request, **kwargs)
+
+
+class HttpTransport:
+    # pool_connections: number of hosts whose pools are kept open
+    # pool_maxsize: keep-alive connections kept per host, should be >= the crawl concurrency
+    # connect_timeout / read_timeout: seconds, passed to every request unless overridden
+    def __init__(self,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 10,
+                 connect_timeout: float = 10.0,
+                 read_timeout: float = 30.0,
+                 headers: Optional[Dict[str, str]] = None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.adapter = _CountingAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    # Returns the number of requests sent, connections opened and connections reused so far
+    def connection_stats(self) -> Dict[str, int]:
+        requests_sent = self.adapter.request_count
+        new_connections = self.adapter.new_connection_count
+        return {
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused_connections': max(requests_sent - new_connections, 0),
+        }
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,65 @@
+import threading
+import time
+from typing import Optional
+
+
+# The ByteBudget class caps the memory held by pages in flight: response bodies waiting to be parsed and
+# the parse trees built from them. A fetch first reserves the expected cost of a page (a running average
+# of the pages seen so far) and blocks while the budget is used up, so a slow parser throttles the
+# fetchers instead of letting bodies pile up. Once the body is in, the reservation is adjusted to its
+# real cost (without blocking, so a page never waits while holding memory) and released when the page
+# is done.
+#
+# One page is always let through, even when it alone is larger than the budget.
+
+class ByteBudget:
+    def __init__(self, capacity: int, initial_estimate: int = 256 * 1024):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.estimate = initial_estimate
+        self._condition = threading.Condition()
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    # Blocks until nbytes (default: the expected cost of a page) fit; returns the amount reserved,
+    # or None when stop was set while waiting
+    def reserve(self, nbytes: Optional[int] = None, stop: Optional[threading.Event] = None) -> Optional[int]:
+        with self._condition:
+            nbytes = int(self.estimate) if nbytes is None else nbytes
+            if self.in_use and self.in_use + nbytes > self.capacity:
+                self.waits += 1
+                start = time.perf_counter()
+                while self.in_use and self.in_use + nbytes > self.capacity:
+                    if stop is not None and stop.is_set():
+                        self.wait_seconds += time.perf_counter() - start
+                        return None
+                    self._condition.wait(0.1)
+                self.wait_seconds += time.perf_counter() - start
+            self._take(nbytes)
+            return nbytes
+
+    # Turns a reservation into the real cost of the page (never blocks); returns the new amount held
+    def adjust(self, reserved: int, actual: int) -> int:
+        with self._condition:
+            self.estimate = 0.9 * self.estimate + 0.1 * actual
+            self._take(actual - reserved)
+            if actual < reserved:
+                self._condition.notify_all()
+            return actual
+
+    def release(self, nbytes: int):
+        with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+    def _take(self, nbytes: int):
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    def budget_stats(self) -> dict:
+        with self._condition:
+            return {'capacity': self.capacity, 'in_use': self.in_use, 'peak': self.peak, 'waits': self.waits,
+                    'wait_seconds': round(self.wait_seconds, 3), 'page_estimate': int(self.estimate)}
@@ -0,0 +1,242 @@
+import argparse
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import quote
+
+import pymongo
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from article_model import SITE_TIMEZONE, class_value, parse_date, parse_keywords
+
+logger = logging.getLogger(__name__)
+
+POST_ID_INDEX = 'post_id_1'
+
+# The indexes of the articles collection, one per field the app.py endpoints filter, sort or group on.
+# ensure_indexes() applies them at every app.py start, data_storage.py load and MongoArticleSink start:
+# a missing index is created and one whose keys or options changed is dropped and built again, the others
+# are left alone, so applying the manifest twice does nothing.
+#
+#   post_id_1                unique: one document per article (articles without a post_id are not indexed)
+#   publication_date_1       date ranges, the most recent articles, and the per-day counts read from the index
+#   author_1                 the author search, and top_authors read from the index alone
+#   keywords_1               the keyword search, one entry per keyword of the lists
+#   category_1, coverage_1   the category and coverage counts and lookups
+#   video_duration_1         articles with a video, longest first
+#   word_count_1             the longest article
+
+INDEXES: List[dict] = [
+    {'name': POST_ID_INDEX, 'keys': [('post_id', 1)], 'unique': True,
+     'partialFilterExpression': {'post_id': {'$type': 'string'}}},
+    {'name': 'publication_date_1', 'keys': [('publication_date', 1)]},
+    {'name': 'author_1', 'keys': [('author', 1)]},
+    {'name': 'keywords_1', 'keys': [('keywords', 1)]},
+    {'name': 'category_1', 'keys': [('category', 1)]},
+    {'name': 'coverage_1', 'keys': [('coverage', 1)]},
+    {'name': 'video_duration_1', 'keys': [('video_duration', 1)]},
+    {'name': 'word_count_1', 'keys': [('word_count', 1)]},
+]
+
+# Indexes of earlier manifests that no endpoint uses any more, dropped by ensure_indexes()
+RETIRED_INDEXES = ['classes_mapping_value']
+
+# The endpoints check_endpoints() calls, with values taken from an article of the collection. Each must be
+# answered without a COLLSCAN. The other endpoints aggregate over every article by design (top keywords,
+# languages, title lengths, word count buckets, ...) and read the whole collection whatever the indexes.
+CHECKED_ENDPOINTS = [
+    '/api/article_details/{post_id}',
+    '/article_details/{post_id}',
+    '/api/articles_by_year/{year}',
+    '/api/articles_by_month/{year}/{month}',
+    '/articles_by_specific_date/{date}',
+    '/articles_last_X_hours/24',
+    '/api/popular_keywords_last_X_days/7',
+    '/api/articles_by_date',
+    '/api/recent_articles',
+    '/api/top_authors',
+    '/api/articles_by_author/{author}',
+    '/api/articles_by_keyword/{keyword}',
+    '/api/articles_by_classes',
+    '/api/articles_by_coverage/{coverage}',
+    '/articles_grouped_by_coverage',
+    '/api/articles_with_video',
+    '/api/articles_by_word_count',
+    '/api/longest_articles',
+    '/shortest_articles',
+    '/api/articles_by_word_count_range/100/500',
+    '/articles_with_more_than/1000',
+    '/api/longest_article_word_count',
+    '/api/total_articles_count',
+]
+
+_SPEC_FIELDS = ('name', 'keys')
+
+
+def _options(spec: dict) -> dict:
+    return {key: value for key, value in spec.items() if key not in _SPEC_FIELDS}
+
+
+def _matches(existing: dict, spec: dict) -> bool:
+    if [(field, int(direction)) for field, direction in existing['key']] != list(spec['keys']):
+        return False
+    options = _options(spec)
+    # unique=False is not stored, the other options are compared as given
+    return all(existing.get(key) == value for key, value in options.items()) and \
+        bool(existing.get('unique')) == bool(options.get('unique'))
+
+
+# Applies the manifest (or the given specs) to collection; returns the names of the indexes it built and,
+# per index that could not be built, the error. Every index is tried, one that fails doesn't stop the others.
+# The RETIRED_INDEXES are dropped.
+# Building the unique post_id index fails while the collection holds several copies of an article (a dump
+# loaded twice by an older data_storage.py); the duplicate post_ids are logged and
+# data_storage.py --remove-duplicates removes them.
+def ensure_indexes(collection, indexes: Iterable[dict] = INDEXES) -> Dict[str, object]:
+    existing = collection.index_information()
+    for name in RETIRED_INDEXES:
+        if name in existing:
+            logger.info("Dropping the retired index %s of %s", name, collection.name)
+            collection.drop_index(name)
+    built, failed = [], {}
+    for spec in indexes:
+        current = existing.get(spec['name'])
+        if current is not None:
+            if _matches(current, spec):
+                continue
+            logger.info("Index %s of %s changed, building it again", spec['name'], collection.name)
+            collection.drop_index(spec['name'])
+        try:
+            collection.create_index(spec['keys'], name=spec['name'], **_options(spec))
+        except DuplicateKeyError as e:
+            duplicates = duplicate_post_ids(collection) if spec['name'] == POST_ID_INDEX else []
+            logger.error("Could not build the unique index %s of %s, %s (run data_storage.py "
+                         "--remove-duplicates): %s", spec['name'], collection.name,
+                         f"duplicate post_ids {', '.join(duplicates)}" if duplicates else "duplicate keys", e)
+            failed[spec['name']] = str(e)
+            continue
+        except OperationFailure as e:
+            # 85/86: the same keys are already indexed under another name or with other options
+            if e.code in (85, 86):
+                logger.warning("Skipping index %s of %s: %s", spec['name'], collection.name, e)
+            else:
+                logger.error("Could not build index %s of %s: %s", spec['name'], collection.name, e)
+                failed[spec['name']] = str(e)
+            continue
+        built.append(spec['name'])
+    if built:
+        logger.info("Built indexes %s on %s", ', '.join(built), collection.name)
+    return {'built': built, 'failed': failed}
+
+
+# The post_ids stored more than once (at most limit of them), which keep the unique index from being built
+def duplicate_post_ids(collection, limit: int = 10) -> List[str]:
+    groups = collection.aggregate([
+        {'$match': {'post_id': {'$type': 'string'}}},
+        {'$group': {'_id': '$post_id', 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$limit': limit},
+    ], allowDiskUse=True)
+    return [group['_id'] for group in groups]
+
+
+# The stage names of the plans the server chose, anywhere in an explain or profiler document
+def plan_stages(document) -> Iterator[str]:
+    if isinstance(document, dict):
+        for key, value in document.items():
+            if key == 'stage' and isinstance(value, str):
+                yield value
+            elif key != 'rejectedPlans':
+                yield from plan_stages(value)
+    elif isinstance(document, list):
+        for item in document:
+            yield from plan_stages(item)
+
+
+def _endpoint_values(collection) -> Dict[str, str]:
+    article = collection.find_one({'post_id': {'$type': 'string'}, 'publication_date': {'$type': 'date'}}) or {}
+    # The day, month and year the app.py endpoints count the article in
+    published = (parse_date(article.get('publication_date')) or datetime.now(timezone.utc)).astimezone(SITE_TIMEZONE)
+    keywords = parse_keywords(article.get('keywords'))
+    return {
+        'post_id': article.get('post_id', '0'),
+        'year': str(published.year),
+        'month': str(published.month),
+        'date': published.strftime('%Y-%m-%d'),
+        'author': article.get('author') or 'unknown',
+        'keyword': keywords[0] if keywords else 'news',
+        'coverage': article.get('coverage') or class_value(article.get('classes'), 'coverage') or 'none',
+    }
+
+
+# check_endpoints calls every endpoint of CHECKED_ENDPOINTS through the Flask test client with the database
+# profiler on, and returns, per endpoint, the plan summaries of the queries it ran ("IXSCAN { author: 1 }",
+# "COLLSCAN", ...). The profiler level of the database is put back afterwards.
+# It needs a server that allows profiling (a self-hosted mongod, not a shared Atlas tier).
+def check_endpoints(flask_app, collection, endpoints: Iterable[str] = CHECKED_ENDPOINTS) -> Dict[str, List[str]]:
+    database = collection.database
+    values = {name: quote(value, safe='') for name, value in _endpoint_values(collection).items()}
+    previous = database.command('profile', -1)
+    database.command('profile', 2)
+    plans = {}
+    try:
+        client = flask_app.test_client()
+        profile = database['system.profile']
+        for endpoint in endpoints:
+            # Entries are told apart by the server's clock: only those after the last one before the call
+            last = next(profile.find({}, {'ts': 1}).sort('$natural', -1).limit(1), None)
+            since = {'ts': {'$gt': last['ts']}} if last else {}
+            url = endpoint.format(**values)
+            response = client.get(url)
+            if response.status_code >= 500:
+                logger.warning("%s returned %d", url, response.status_code)
+            entries = profile.find(dict(since, ns=collection.full_name))
+            plans[endpoint] = [entry.get('planSummary') or ','.join(plan_stages(entry.get('execStats', {})))
+                               for entry in entries if entry.get('op') in ('query', 'command')]
+    finally:
+        database.command('profile', previous['was'], slowms=previous.get('slowms', 100))
+    return plans
+
+
+def collection_scans(plans: Dict[str, List[str]]) -> List[str]:
+    return [endpoint for endpoint, summaries in plans.items()
+            if any('COLLSCAN' in summary for summary in summaries)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the indexes of the articles collection and check that "
+                                                 "the app.py endpoints use them")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    apply = subparsers.add_parser('apply', help="Create the missing or changed indexes of the manifest")
+    apply.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    apply.add_argument('--mongo-database', default='almayadeen')
+    apply.add_argument('--mongo-collection', default='articles')
+    subparsers.add_parser('check', help="Call the endpoints of app.py with the profiler on and exit with "
+                                        "status 1 when one of them scans the collection")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.command == 'apply':
+        client = pymongo.MongoClient(args.mongo_uri)
+        try:
+            result = ensure_indexes(client[args.mongo_database][args.mongo_collection])
+        finally:
+            client.close()
+        return 1 if result['failed'] else 0
+
+    # Lazy import: app connects to its database (and applies the manifest) when it is imported
+    import app
+    plans = check_endpoints(app.app, app.collection)
+    for endpoint, summaries in plans.items():
+        print(f"{endpoint:45} {'; '.join(summaries) or '-'}")
+    scans = collection_scans(plans)
+    if scans:
+        print(f"{len(scans)} endpoints scan the collection: {', '.join(scans)}")
+        return 1
+    print(f"{len(plans)} endpoints checked, no collection scan")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from article_model import TypedArticle
+from mongo_indexes import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+
+# The MongoArticleSink class writes scraped articles straight into the MongoDB collection the Flask
+# API (app.py) reads, so they can be queried while the crawl is still running instead of after a
+# separate data_storage.py load.
+#
+# Articles are buffered and sent as one unordered bulk_write of upserts keyed on post_id (url for pages
+# without one): a batch goes out when it holds batch_size articles, or at the latest flush_interval
+# seconds after its first article, so a new article reaches the API within a few seconds.
+# Scraping the same article again updates its document instead of adding a duplicate.
+#
+# The documents are article_model.TypedArticle documents (keyword list, int word count, real dates,
+# category/coverage), normalized here once instead of in every aggregation pipeline; typed=False writes
+# the scraped strings, which the app.py endpoints can't query.
+#
+# write() only queues the article: the batches are sent by a background flusher thread, so the crawl never
+# waits for MongoDB. When MongoDB cannot be reached the batch is kept and the flusher tries again after
+# 1, 2, 4, ... up to max_backoff seconds. While max_buffered articles are waiting write() blocks until the
+# flusher made room, and raises SinkUnavailableError (stopping the crawl) when MongoDB is unreachable;
+# the gzip files written by ArticleStreamWriter stay the durable copy.
+
+class SinkUnavailableError(RuntimeError):
+    pass
+
+
+class MongoArticleSink:
+    def __init__(self,
+                 collection=None,
+                 uri: str = 'mongodb://localhost:27017/',
+                 database: str = 'almayadeen',
+                 collection_name: str = 'articles',
+                 batch_size: int = 500,
+                 flush_interval: float = 2.0,
+                 max_buffered: int = 50000,
+                 typed: bool = True,
+                 max_backoff: float = 30.0):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.client = None
+        if collection is None:
+            self.client = pymongo.MongoClient(uri)
+            collection = self.client[database][collection_name]
+        self.collection = collection
+        # Upserts look documents up by the unique post_id index, the API needs the others. An index that
+        # can't be built (duplicate post_ids, MongoDB unreachable) is logged and the crawl goes on
+        try:
+            ensure_indexes(self.collection)
+        except PyMongoError as e:
+            logger.warning("Could not apply the index manifest to %s: %s", self.collection.name, e)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.typed = typed
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._pending: List[UpdateOne] = []
+        self._oldest = None
+        self._unreachable = False  # the last flush could not reach MongoDB
+        self._wake = threading.Event()
+        self.counts = {'written': 0, 'upserted': 0, 'modified': 0, 'batches': 0, 'errors': 0, 'dropped': 0}
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _upsert(self, article) -> UpdateOne:
+        document = TypedArticle.from_article(article).to_document() if self.typed else dict(article.__dict__)
+        key = {'post_id': document['post_id']} if document.get('post_id') else {'url': document['url']}
+        return UpdateOne(key, {'$set': document}, upsert=True)
+
+    # Same signature as the on_result callbacks of the crawlers: pages that are not articles are ignored
+    def write(self, article, url: Optional[str] = None):
+        if article is None:
+            return
+        upsert = self._upsert(article)
+        with self._room:
+            while len(self._pending) >= self.max_buffered:
+                if self._unreachable:
+                    raise SinkUnavailableError(f"MongoDB has been unreachable until {len(self._pending)} articles "
+                                               f"were waiting, stopping the crawl")
+                self._room.wait(1.0)
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(upsert)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _flush_loop(self):
+        backoff = 0.0
+        retry_at = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(min(self.flush_interval, 0.5))
+            self._wake.clear()
+            now = time.monotonic()
+            if self._stop.is_set() or now < retry_at:
+                continue
+            with self._lock:
+                due = self._pending and (len(self._pending) >= self.batch_size
+                                         or now - self._oldest >= self.flush_interval)
+            if not due:
+                continue
+            if self.flush():
+                backoff = 0.0
+            else:
+                backoff = min(max(backoff * 2, 1.0), self.max_backoff)
+                retry_at = time.monotonic() + backoff
+
+    # Sends the buffered articles; returns False when MongoDB could not be reached (they are kept)
+    def flush(self) -> bool:
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                    if not batch:
+                        return True
+                try:
+                    result = self.collection.bulk_write(batch, ordered=False)
+                    details = result.bulk_api_result
+                except BulkWriteError as e:
+                    # Unordered: every operation without an error was applied
+                    details = e.details
+                    logger.error("%d of %d article upserts failed: %s", len(details['writeErrors']), len(batch),
+                                 details['writeErrors'][0].get('errmsg'))
+                    self.counts['errors'] += len(details['writeErrors'])
+                except PyMongoError as e:
+                    logger.warning("Could not write %d articles to MongoDB, keeping them for the next flush: %s",
+                                   len(batch), e)
+                    self.counts['errors'] += 1
+                    with self._room:
+                        self._unreachable = True
+                        self._room.notify_all()
+                    return False
+                with self._room:
+                    del self._pending[:len(batch)]
+                    self._oldest = time.monotonic()
+                    self._unreachable = False
+                    self._room.notify_all()
+                self.counts['written'] += len(batch)
+                self.counts['upserted'] += details.get('nUpserted', 0)
+                self.counts['modified'] += details.get('nModified', 0)
+                self.counts['batches'] += 1
+
+    def sink_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts, buffered=len(self._pending))
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._flusher.join()
+        if not self.flush():
+            with self._lock:
+                logger.error("%d articles could not be written to MongoDB, they are only in the output files",
+                             len(self._pending))
+                self.counts['dropped'] += len(self._pending)
+                self._pending = []
+        if self.client is not None:
+            self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
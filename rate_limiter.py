@@ -0,0 +1,224 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+
+# The RateLimitedTransport class wraps an HttpTransport so the crawler finds the fastest request rate
+# a host accepts and stays there, instead of hammering it or losing articles to 429/503 errors.
+#
+#   - every host gets a token bucket; a request waits for a token before it is sent
+#   - until a host first pushes back, every successful response adds one request/sec (the rate
+#     doubles every second, like TCP slow start)
+#   - after that the bucket rate is driven by AIMD: fast successful responses raise the rate by about
+#     increase_step requests/sec every second (increase_step / rate per response); a throttling status
+#     (429/503), a connection error or a response slower than latency_target multiplies the rate by
+#     decrease_factor (at most once per cooldown)
+#   - throttled or failed requests are retried with jittered exponential backoff, and a
+#     Retry-After header pauses the whole host for at least that long
+
+# Statuses that mean "slow down" or a temporary failure worth retrying
+RETRY_STATUSES = (429, 502, 503, 504)
+# Statuses that mean the host is throttling us
+THROTTLE_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class AdaptiveHostLimiter:
+    # initial_rate, min_rate, max_rate: requests/sec per host
+    # latency_target: responses slower than this (seconds) count as a sign of overload
+    def __init__(self,
+                 initial_rate: float = 5.0,
+                 min_rate: float = 0.5,
+                 max_rate: float = 100.0,
+                 increase_step: float = 2.0,
+                 decrease_factor: float = 0.5,
+                 latency_target: float = 2.0,
+                 cooldown: float = 1.0):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_decrease: Dict[str, float] = {}
+        self._slow_start: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.initial_rate, burst=max(1.0, self.initial_rate))
+            return self._buckets[host]
+
+    def acquire(self, host: str):
+        self.bucket(host).acquire()
+
+    def on_success(self, host: str, latency: float):
+        if latency > self.latency_target:
+            self.on_overload(host)
+            return
+        bucket = self.bucket(host)
+        # Slow start, then additive increase; the burst follows so a faster rate can actually be used
+        if self._slow_start.get(host, True):
+            rate = min(self.max_rate, bucket.rate + 1.0)
+        else:
+            rate = min(self.max_rate, bucket.rate + self.increase_step / max(bucket.rate, 1.0))
+        bucket.set_rate(rate)
+        bucket.burst = max(1.0, rate)
+
+    def on_overload(self, host: str, retry_after: Optional[float] = None):
+        bucket = self.bucket(host)
+        now = time.monotonic()
+        with self._lock:
+            self._slow_start[host] = False
+            decrease = now - self._last_decrease.get(host, 0.0) >= self.cooldown
+            if decrease:
+                self._last_decrease[host] = now
+        if decrease:
+            rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+            bucket.set_rate(rate)
+            bucket.burst = max(1.0, rate)
+        if retry_after:
+            bucket.pause(retry_after)
+
+    def rates(self) -> Dict[str, float]:
+        with self._lock:
+            return {host: round(bucket.rate, 2) for host, bucket in self._buckets.items()}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimitedTransport:
+    def __init__(self, transport,
+                 limiter: Optional[AdaptiveHostLimiter] = None,
+                 max_retries: int = 5,
+                 backoff_base: float = 0.5,
+                 backoff_cap: float = 30.0):
+        self.transport = transport
+        self.limiter = limiter or AdaptiveHostLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": a random wait up to the exponential bound spreads retries of parallel workers
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.limiter.acquire(host)
+            start = time.monotonic()
+            try:
+                response = self.transport.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._count('errors')
+                self.limiter.on_overload(host)
+                if last_attempt:
+                    raise
+                self._count('retries')
+                time.sleep(self._backoff(attempt))
+                continue
+            latency = time.monotonic() - start
+
+            if response.status_code not in RETRY_STATUSES:
+                self.limiter.on_success(host, latency)
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code in THROTTLE_STATUSES:
+                self._count('throttled')
+            self.limiter.on_overload(host, retry_after)
+            if last_attempt:
+                return response
+            self._count('retries')
+            response.close()
+            time.sleep(max(retry_after or 0.0, self._backoff(attempt)))
+
+    def rate_limit_stats(self) -> Dict[str, object]:
+        return {
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'errors': self.errors,
+            'rates': self.limiter.rates(),
+        }
+
+    def connection_stats(self) -> Dict[str, int]:
+        return self.transport.connection_stats()
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
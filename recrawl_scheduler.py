@@ -0,0 +1,184 @@
+import heapq
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from article_model import parse_date
+
+
+# The RecrawlScheduler class decides which pages a run spends its crawl budget (max_articles fetches) on,
+# instead of walking the sitemaps in index order until the budget is gone. It keeps, per article URL:
+# the sitemap listing it, its sitemap <lastmod>, the publication and last_updated dates of the saved
+# article, when it was last fetched, and how often a re-fetch found it changed.
+#
+# Pages are planned in three tiers:
+#   new        never fetched, newest <lastmod> first
+#   lastmod    the sitemap <lastmod> is later than our last fetch, newest first
+#   predicted  the probability that the page changed since the last fetch, highest first, above
+#              min_probability. Changes are modelled as a Poisson process whose rate is estimated as
+#              (updates seen + 0.5) / (age of the article in days when it was fetched), so a page
+#              updated often or published recently is fetched again soon and an old, never-updated one
+#              rarely: p = 1 - exp(-rate * days since the fetch)
+#
+# Monthly sitemaps are only listed again when their <lastmod> in the sitemap index changed (or is missing),
+# newest first. Fetched pages are recorded with record_many(), the on_flush callback of ArticleStreamWriter.
+
+# Changes per article lifetime assumed before any was seen
+PRIOR_CHANGES = 0.5
+# Lifetime in days assumed for pages without a publication date
+DEFAULT_AGE_DAYS = 30.0
+
+
+def _iso(value) -> Optional[str]:
+    parsed = parse_date(value)
+    return parsed.astimezone(timezone.utc).isoformat() if parsed else None
+
+
+def _timestamp(value: Optional[str]) -> float:
+    parsed = parse_date(value)
+    return parsed.timestamp() if parsed else 0.0
+
+
+def change_probability(published: Optional[str], last_updated: Optional[str], fetched_at: str, changes: int,
+                       now: datetime) -> float:
+    fetched = parse_date(fetched_at)
+    published_date = parse_date(published)
+    updated_date = parse_date(last_updated)
+    if published_date:
+        age_days = max(1.0, (fetched - published_date).total_seconds() / 86400)
+    else:
+        age_days = DEFAULT_AGE_DAYS
+    # An article already updated after its publication counts as one change seen
+    updates = changes + (1 if published_date and updated_date and updated_date > published_date else 0)
+    rate = (updates + PRIOR_CHANGES) / age_days
+    elapsed_days = max(0.0, (now - fetched).total_seconds() / 86400)
+    return 1 - math.exp(-rate * elapsed_days)
+
+
+class RecrawlScheduler:
+    TIERS = ('new', 'lastmod', 'predicted')
+
+    def __init__(self, path: str = os.path.join('data', 'recrawl_schedule.sqlite3'), min_probability: float = 0.05):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.min_probability = min_probability
+        self._lock = threading.Lock()
+        # isolation_level=None: autocommit, batches are grouped in explicit transactions
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sitemaps (
+                url TEXT PRIMARY KEY,
+                lastmod TEXT,
+                listed_at TEXT NOT NULL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                sitemap TEXT NOT NULL,
+                lastmod TEXT,
+                published TEXT,
+                last_updated TEXT,
+                fetched_at TEXT,
+                fetches INTEGER NOT NULL DEFAULT 0,
+                changes INTEGER NOT NULL DEFAULT 0
+            )""")
+        self.planned = {tier: 0 for tier in self.TIERS}
+        self.changes_seen = 0
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    # Monthly sitemaps, newest <lastmod> first (the index order, which is by month, breaks ties)
+    @staticmethod
+    def order_sitemaps(entries: Iterable[Tuple[str, Optional[str]]]) -> List[Tuple[str, Optional[str]]]:
+        entries = list(entries)
+        return sorted(entries, key=lambda entry: _timestamp(entry[1]), reverse=True)
+
+    # True when the sitemap has to be listed again: never listed, no <lastmod>, or a different <lastmod>
+    def sitemap_changed(self, sitemap_url: str, lastmod: Optional[str]) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT lastmod FROM sitemaps WHERE url = ?", (sitemap_url,)).fetchone()
+        return row is None or lastmod is None or row[0] != _iso(lastmod)
+
+    # entries: the (url, lastmod) pairs of a monthly sitemap; returns how many there were.
+    # fetched (url -> time, e.g. CrawlCheckpoint.scraped_times) gives the last fetch of pages crawled
+    # before the scheduler knew them, so they are not planned as new pages
+    def add_entries(self, sitemap_url: str, entries: Iterable[Tuple[str, Optional[str]]],
+                    sitemap_lastmod: Optional[str] = None, fetched: Optional[Dict[str, str]] = None) -> int:
+        fetched = fetched or {}
+        rows = [(url, sitemap_url, _iso(lastmod), fetched.get(url)) for url, lastmod in entries]
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT INTO pages (url, sitemap, lastmod, fetched_at) VALUES (?, ?, ?, ?) "
+                                  "ON CONFLICT (url) DO UPDATE SET sitemap = excluded.sitemap, "
+                                  "lastmod = COALESCE(excluded.lastmod, lastmod), "
+                                  "fetched_at = COALESCE(fetched_at, excluded.fetched_at)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO sitemaps (url, lastmod, listed_at) VALUES (?, ?, ?)",
+                              (sitemap_url, _iso(sitemap_lastmod), self._now()))
+            self.conn.execute("COMMIT")
+        return len(rows)
+
+    # Returns up to budget (url, sitemap) pairs, the most urgent first
+    def plan(self, budget: int, now: Optional[datetime] = None) -> List[Tuple[str, str]]:
+        now = now or datetime.now(timezone.utc)
+        candidates = []
+        with self._lock:
+            rows = self.conn.execute("SELECT url, sitemap, lastmod, published, last_updated, fetched_at, changes "
+                                     "FROM pages").fetchall()
+        for url, sitemap, lastmod, published, last_updated, fetched_at, changes in rows:
+            if fetched_at is None:
+                candidates.append(((2, _timestamp(lastmod)), url, sitemap, 'new'))
+            elif lastmod and _timestamp(lastmod) > _timestamp(fetched_at):
+                candidates.append(((1, _timestamp(lastmod)), url, sitemap, 'lastmod'))
+            else:
+                probability = change_probability(published, last_updated, fetched_at, changes, now)
+                if probability >= self.min_probability:
+                    candidates.append(((0, probability), url, sitemap, 'predicted'))
+        planned = heapq.nlargest(budget, candidates, key=lambda candidate: candidate[0])
+        for _, _, _, tier in planned:
+            self.planned[tier] += 1
+        return [(url, sitemap) for _, url, sitemap, _ in planned]
+
+    # records: (url, article) pairs of fetched pages (article None when it was not an article, or unchanged)
+    def record_many(self, records):
+        now = self._now()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            for url, article in records:
+                if article is None:
+                    self.conn.execute("UPDATE pages SET fetched_at = ?, fetches = fetches + 1 WHERE url = ?",
+                                      (now, url))
+                    continue
+                last_updated = _iso(article.last_updated_date)
+                row = self.conn.execute("SELECT fetched_at, last_updated FROM pages WHERE url = ?",
+                                        (url,)).fetchone()
+                # Pages fetched before the scheduler existed (fetched_at from the checkpoint) have no stored
+                # last_updated to compare with: their first fetch here only records it
+                changed = row is not None and row[0] is not None and row[1] is not None and row[1] != last_updated
+                self.changes_seen += changed
+                self.conn.execute("UPDATE pages SET published = ?, last_updated = ?, fetched_at = ?, "
+                                  "fetches = fetches + 1, changes = changes + ? WHERE url = ?",
+                                  (_iso(article.publication_date), last_updated, now, int(changed), url))
+            self.conn.execute("COMMIT")
+
+    def schedule_stats(self) -> dict:
+        with self._lock:
+            pages, fetched = self.conn.execute("SELECT COUNT(*), COUNT(fetched_at) FROM pages").fetchone()
+        return dict(self.planned, pages=pages, fetched=fetched, changes_seen=self.changes_seen)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,145 @@
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from article_model import TypedArticle, parse_date
+
+logger = logging.getLogger(__name__)
+
+MIGRATION = 'typed_articles'
+MIGRATIONS_COLLECTION = 'migrations'
+
+# Any of these still a string: the document was stored before the articles were typed.
+# ($type 'string' would also match the keyword arrays, through their elements)
+UNTYPED_QUERY = {'$or': [
+    {'publication_date': {'$type': 'string'}},
+    {'last_updated_date': {'$type': 'string'}},
+    {'word_count': {'$type': 'string'}},
+    {'keywords': {'$type': 'string', '$not': {'$type': 'array'}}},
+]}
+
+
+def _changed(document: dict, name: str, value) -> bool:
+    if name not in document:
+        return True
+    stored = document[name]
+    if isinstance(value, datetime):
+        # pymongo returns naive UTC datetimes unless the client is tz_aware
+        return not isinstance(stored, datetime) or parse_date(stored) != value
+    return stored != value
+
+
+# migrate_articles rewrites the articles stored with the scraped strings (data_storage.py before typed loads,
+# MongoArticleSink without typed) into article_model.TypedArticle documents: BSON dates, int word_count,
+# keyword arrays, category and coverage fields. The app.py endpoints query these fields with index ranges.
+#
+# Documents are read in _id order, batch_size at a time, and only the fields that change are $set, in one
+# unordered bulk_write per batch. The last _id done is saved in the migrations collection after every batch,
+# so an interrupted run continues where it stopped (restart=True starts over); a batch done twice changes
+# nothing, typed fields convert to themselves. Documents written by an old writer behind the saved _id are
+# found by count_untyped() and converted by running the migration with restart=True.
+# Returns the scanned, modified and failed counts and the elapsed seconds.
+
+def migrate_articles(collection, batch_size: int = 500, restart: bool = False, max_retries: int = 3) -> dict:
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    migrations = collection.database[MIGRATIONS_COLLECTION]
+    key = {'_id': f'{MIGRATION}:{collection.name}'}
+    state = None if restart else migrations.find_one(key)
+    last_id = state.get('last_id') if state else None
+    if last_id is not None:
+        logger.info("Resuming the migration of %s after _id %s", collection.name, last_id)
+    migrations.update_one(key, {'$set': {'started_at': datetime.now(timezone.utc), 'finished_at': None,
+                                         'last_id': last_id}}, upsert=True)
+    stats = {'scanned': 0, 'modified': 0, 'failed': 0}
+    start = time.perf_counter()
+
+    while True:
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        for attempt in range(max_retries + 1):
+            try:
+                documents = list(collection.find(query).sort('_id', 1).limit(batch_size))
+                break
+            except AutoReconnect as e:
+                if attempt == max_retries:
+                    raise
+                logger.warning("MongoDB connection lost (%s), retrying in %ds", e, 2 ** attempt)
+                time.sleep(2 ** attempt)
+        if not documents:
+            break
+        operations = []
+        for document in documents:
+            changes = {name: value for name, value in TypedArticle.from_document(document).to_document().items()
+                       if _changed(document, name, value)}
+            if changes:
+                operations.append(UpdateOne({'_id': document['_id']}, {'$set': changes}))
+        if operations:
+            try:
+                stats['modified'] += collection.bulk_write(operations, ordered=False).modified_count
+            except BulkWriteError as e:
+                errors = e.details['writeErrors']
+                logger.error("%d of %d article updates failed: %s", len(errors), len(operations),
+                             errors[0].get('errmsg'))
+                stats['modified'] += e.details.get('nModified', 0)
+                stats['failed'] += len(errors)
+        stats['scanned'] += len(documents)
+        last_id = documents[-1]['_id']
+        migrations.update_one(key, {'$set': {'last_id': last_id}, '$inc': {'scanned': len(documents)}})
+        logger.info("%d articles scanned, %d modified", stats['scanned'], stats['modified'])
+
+    migrations.update_one(key, {'$set': {'finished_at': datetime.now(timezone.utc)}})
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def count_untyped(collection) -> int:
+    return collection.count_documents(UNTYPED_QUERY)
+
+
+# The saved state of the migration of collection (last_id, started_at, finished_at), None if it never ran
+def migration_state(collection) -> Optional[dict]:
+    return collection.database[MIGRATIONS_COLLECTION].find_one({'_id': f'{MIGRATION}:{collection.name}'})
+
+
+def main(uri: str = 'mongodb://localhost:27017/',
+         database: str = 'almayadeen',
+         collection_name: str = 'articles',
+         batch_size: int = 500,
+         restart: bool = False,
+         check: bool = False,
+         collection=None) -> Optional[dict]:
+    client = None
+    if collection is None:
+        client = pymongo.MongoClient(uri)
+        collection = client[database][collection_name]
+    try:
+        if check:
+            logger.info("%d articles of %s are not typed yet", count_untyped(collection), collection.name)
+            return None
+        stats = migrate_articles(collection, batch_size, restart)
+        logger.info("Migrated %s: %d articles scanned, %d modified, %d failed, %.1fs", collection.name,
+                    stats['scanned'], stats['modified'], stats['failed'], stats['seconds'])
+        return stats
+    finally:
+        if client is not None:
+            client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the stored articles to typed fields (dates, int "
+                                                 "word_count, keyword arrays, category/coverage)")
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--mongo-database', default='almayadeen')
+    parser.add_argument('--mongo-collection', default='articles')
+    parser.add_argument('--batch-size', type=int, default=500, help="Articles per bulk update")
+    parser.add_argument('--restart', action='store_true', help="Start over instead of resuming the last run")
+    parser.add_argument('--check', action='store_true', help="Only count the articles that are not typed yet")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    main(args.mongo_uri, args.mongo_database, args.mongo_collection, args.batch_size, args.restart, args.check)
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+from typing import Iterable, List
+
+logger = logging.getLogger(__name__)
+
+
+# The UrlFrontier class makes sure an article URL is scraped once, even when it is listed in several
+# monthly sitemaps, across runs, and across the worker processes of a sharded crawl (crawl_queue.py).
+#
+#   exact index   a SQLite table of every URL ever claimed with its owner (the sitemap that claimed it),
+#                 shared by all processes; claiming a URL is one INSERT OR IGNORE, so two workers can
+#                 never both win the same URL
+#   Bloom filter  an in-memory summary of the index (about 1.2 MB per million URLs at a 1% false-positive
+#                 rate, against well over 100 MB for a Python set of the URLs). A URL it has never seen is
+#                 claimed without looking it up first; only its positives (known URLs, or a false positive
+#                 at error_rate) are checked against the index
+#
+# A URL stays claimable by its owner, so a sitemap that is crawled again (after a crash, or because it
+# is the current month) gets its own URLs back; the checkpoint then skips the ones already scraped.
+# The filter grows by adding layers of twice the capacity when it fills up, keeping the error rate.
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.01):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Optimal number of bits and hash functions for capacity items at error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing (Kirsch-Mitzenmacher) on one 128-bit blake2b digest, stable across processes
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.num_bits for index in range(self.num_hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+
+class ScalableBloomFilter:
+    # A list of BloomFilters, a new one of twice the capacity is started when the last one is full
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.01):
+        self.error_rate = error_rate
+        self.filters = [BloomFilter(capacity, error_rate)]
+
+    def add(self, item: str):
+        current = self.filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(current.capacity * 2, self.error_rate)
+            self.filters.append(current)
+        current.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in bloom for bloom in self.filters)
+
+    def __len__(self) -> int:
+        return sum(bloom.count for bloom in self.filters)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bloom.nbytes for bloom in self.filters)
+
+
+class UrlFrontier:
+    def __init__(self, path: str = os.path.join('data', 'url_frontier.sqlite3'), capacity: int = 1000000,
+                 error_rate: float = 0.01):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        # isolation_level=None: autocommit, claims are grouped in explicit transactions
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                owner TEXT NOT NULL
+            ) WITHOUT ROWID""")
+        self.bloom = ScalableBloomFilter(capacity, error_rate)
+        for (url,) in self.conn.execute("SELECT url FROM urls"):
+            self.bloom.add(url)
+        self.lookups = 0
+        self.false_positives = 0
+
+    # Returns the URLs owner may scrape, in order and without duplicates: URLs nobody claimed before
+    # (now claimed by owner) and URLs owner had claimed already. URLs claimed by another owner are left out.
+    def claim(self, urls: Iterable[str], owner: str) -> List[str]:
+        claimed = []
+        seen = set()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for url in urls:
+                    if url in seen:
+                        continue
+                    seen.add(url)
+                    if url in self.bloom:
+                        # Known URL or a false positive, the index has the answer
+                        self.lookups += 1
+                        row = self.conn.execute("SELECT owner FROM urls WHERE url = ?", (url,)).fetchone()
+                        if row is not None:
+                            if row[0] == owner:
+                                claimed.append(url)
+                            continue
+                        self.false_positives += 1
+                    cursor = self.conn.execute("INSERT OR IGNORE INTO urls (url, owner) VALUES (?, ?)", (url, owner))
+                    self.bloom.add(url)
+                    # Another process may have claimed it since our filter was built
+                    if cursor.rowcount or self.conn.execute("SELECT owner FROM urls WHERE url = ?",
+                                                            (url,)).fetchone()[0] == owner:
+                        claimed.append(url)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if len(claimed) < len(seen):
+            logger.info("%d of %d URLs of %s are claimed by other sitemaps", len(seen) - len(claimed), len(seen),
+                        owner)
+        return claimed
+
+    def __contains__(self, url: str) -> bool:
+        if url not in self.bloom:
+            return False
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM urls WHERE url = ?", (url,)).fetchone() is not None
+
+    def frontier_stats(self) -> dict:
+        return {
+            'urls': len(self.bloom),
+            'bloom_bytes': self.bloom.nbytes,
+            'bloom_layers': len(self.bloom.filters),
+            'index_lookups': self.lookups,
+            'false_positives': self.false_positives,
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -6,11 +6,42 @@ from bs4 import BeautifulSoup
 import json
 import os
 from dataclasses import dataclass
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Callable, Iterable, Iterator, Tuple, NamedTuple
 import csv
 import gzip
+import io
+import zlib
+import asyncio
+import argparse
+import functools
+import logging
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from urllib.parse import quote
 
+# lxml is only needed by the 'fast' extraction engine of ArticleScraper
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+from bs4.dammit import UnicodeDammit
+
+from http_transport import HttpTransport
+from crawl_checkpoint import CrawlCheckpoint
+from http_cache import HttpCache, CachingTransport
+from rate_limiter import AdaptiveHostLimiter, RateLimitedTransport
+from crawl_metrics import CrawlMetrics
+from content_fingerprints import FingerprintStore
+from article_model import TypedArticle
+from http_archive import HttpArchive, RecordingTransport, ReplayTransport
+from corpus_shards import ShardedCorpusWriter, iter_corpus
+from recrawl_scheduler import RecrawlScheduler
+from memory_budget import ByteBudget
+
+logger = logging.getLogger(__name__)
+
 
 
 @dataclass
@@ -34,192 +65,415 @@ class Article:
     classes: Optional[List[str]]
 
 
+# iter_sitemap_entries reads a sitemap (index or urlset) incrementally from chunks of bytes.
+# It yields (loc, lastmod) for every <sitemap> or <url> entry as soon as the entry is complete,
+# and drops each entry from the tree right after, so memory stays constant whatever the sitemap size.
+# lastmod is None when the entry has no <lastmod>.
+
+SITEMAP_ENTRY_TAGS = ('url', 'sitemap')
+
+
+def _local_name(tag: str) -> str:
+    # '{http://www.sitemaps.org/schemas/sitemap/0.9}loc' -> 'loc'
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_sitemap_entries(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Optional[str]]]:
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+
+    def drain():
+        nonlocal root
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            if _local_name(element.tag) not in SITEMAP_ENTRY_TAGS:
+                continue
+            loc = lastmod = None
+            for child in element:
+                name = _local_name(child.tag)
+                if name == 'loc':
+                    loc = (child.text or '').strip()
+                elif name == 'lastmod':
+                    lastmod = (child.text or '').strip() or None
+            # Free the finished entry (the parser keeps the elements that are still open)
+            element.clear()
+            root.clear()
+            if loc:
+                yield loc, lastmod
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
 # The SitemapParser class is designed to handle the parsing of sitemaps,
 # which are XML files used by websites to list their pages for search engines
 
 class SitemapParser:
 
     #Constructor
-    def __init__(self, index_url: str):
+    # transport is the shared HttpTransport (a private one is created when it is not given)
+    def __init__(self, index_url: str, transport: Optional[HttpTransport] = None):
         self.index_url = index_url
+        self.transport = transport or HttpTransport()
+
 
+    # iter_entries streams a sitemap and yields its (loc, lastmod) entries while the body is still downloading
+    def iter_entries(self, sitemap_url: str, chunk_size: int = 64 * 1024) -> Iterator[Tuple[str, Optional[str]]]:
+        response = self.transport.get(sitemap_url, stream=True)
+        try:
+            yield from iter_sitemap_entries(response.iter_content(chunk_size))
+        finally:
+            response.close()
 
     #This method returns a list of strings, where each string is a URL to a monthly sitemap
     def get_monthly_sitemap_urls(self) -> List[str]:
-        # The method sends an HTTP GET request to the URL stored in self.index_url using the requests.get() function.
+        # The method streams the sitemap index at self.index_url through the shared transport.
         # This URL is expected to point to a sitemap index file, which is an XML document listing other sitemaps (usually organized by month).
-        response = requests.get(self.index_url) # it is a url of a website
-        # Parsing the XML Content
-        soup = BeautifulSoup(response.content, 'xml')
-        # The method soup.find_all('loc') searches the parse tree for all <loc> elements.
-        # In a sitemap, these elements usually contain URLs to other sitemaps
-        # urls is a list comprehension is used to extract the text content of each <loc> element and store it in a list called urls
-        urls = [loc.text for loc in soup.find_all('loc')]
-        print("Monthly sitemap URLs:", urls)  # Debug output
+        # In a sitemap index, the <loc> of every <sitemap> entry is the URL of another sitemap
+        urls = [loc for loc, lastmod in self.get_monthly_sitemap_entries()]
+        logger.debug("Monthly sitemap URLs: %s", urls)
         return urls
 
+    # get_monthly_sitemap_entries returns the (monthly sitemap URL, lastmod) entries of the sitemap index
+    def get_monthly_sitemap_entries(self) -> List[Tuple[str, Optional[str]]]:
+        return list(self.iter_entries(self.index_url))
+
+    # iter_article_entries yields (encoded article URL, lastmod) from a monthly sitemap as it streams in
+    def iter_article_entries(self, monthly_sitemap_url: str) -> Iterator[Tuple[str, Optional[str]]]:
+        for url, lastmod in self.iter_entries(monthly_sitemap_url):
+            yield quote(url, safe=':/'), lastmod  # Encode the URL, keep ':' and '/' as is
+
     #get_article_urls is used to extract article URLs from a given monthly sitemap URL
 
     # input is : the URL of the monthly sitemap, which is expected to be an XML file containing URLs of individual articles.
     # Returns a list of strings, where each string is a URL to an article.
 
     def get_article_urls(self, monthly_sitemap_url: str) -> List[str]:
+        # Streams the monthly_sitemap_url through the shared transport and collects the encoded <loc> URLs
+        urls = [url for url, lastmod in self.get_article_entries(monthly_sitemap_url)]
+
+        logger.debug("Article URLs from %s: %s", monthly_sitemap_url, urls)
+        return urls
+
+    # get_article_entries returns the (encoded article URL, lastmod) entries of a monthly sitemap,
+    # or an empty list when the sitemap can't be fetched or parsed
+    def get_article_entries(self, monthly_sitemap_url: str) -> List[Tuple[str, Optional[str]]]:
         try:
-            # Sends HTTP GET request to the monthly_sitemap_url using requests.get(), which fetches the content of the sitemap.
-            response = requests.get(monthly_sitemap_url)
-            # Parsing the XML Content
-            soup = BeautifulSoup(response.content, 'xml')
-            # Extract and encode URLs from <loc> tags
-            urls = []
-            for loc in soup.find_all('loc'):
-                url = loc.text
-                encoded_url = quote(url, safe=':/')  # Encode the URL, keep ':' and '/' as is
-                urls.append(encoded_url)
-
-            print(f"Article URLs from {monthly_sitemap_url}:", urls)  # Debug output
-            return urls
+            return list(self.iter_article_entries(monthly_sitemap_url))
         except requests.RequestException as e:
-            print(f"Error fetching the sitemap: {e}")
+            logger.error("Error fetching the sitemap %s: %s", monthly_sitemap_url, e)
             return []
         except Exception as e:
-            print(f"Error parsing the sitemap: {e}")
+            logger.error("Error parsing the sitemap %s: %s", monthly_sitemap_url, e)
             return []
 
+# Elements removed from an article page before the text is extracted
+UNWANTED_SELECTORS = [
+    '.lg_para.summary',
+    '.footer-bottom-text',
+    '.footer_top_menu',
+    '.footer_middle_menu',
+    '.footer_btm_row',
+    '.col-4',
+    '.post-type.post-metas.type-wrap.article-details-metas',
+    '.post_disclaimer'
+]
+
+
+# The two regions of an article page the scraper needs, as found by an extraction engine:
+#   script_found:  whether a <script type="text/tawsiyat"> tag exists
+#   metadata_text: the text of that tag (None when it has no single text child)
+#   section_found: whether a <section class="read-section"> exists
+#   paragraphs:    the text of every <p> in its <div class="p-content">, None when the div is missing
+
+class ArticleParts(NamedTuple):
+    script_found: bool
+    metadata_text: Optional[str]
+    section_found: bool
+    paragraphs: Optional[List[str]]
+
+
+# '.a.b' -> XPath predicate matching elements whose class attribute has both tokens
+def _class_selector_xpath(selector: str) -> str:
+    tokens = [token for token in selector.split('.') if token]
+    conditions = ' and '.join(f"contains(concat(' ', normalize-space(@class), ' '), ' {token} ')" for token in tokens)
+    return f'//*[{conditions}]'
+
+
+UNWANTED_XPATH = ' | '.join(_class_selector_xpath(selector) for selector in UNWANTED_SELECTORS)
+SECTION_XPATH = _class_selector_xpath('.read-section').replace('//*[', '//section[', 1)
+P_CONTENT_XPATH = _class_selector_xpath('.p-content').replace('//*[', './/div[', 1)
+# Text nodes BeautifulSoup's get_text() keeps: no comments, no script/style/template contents
+P_TEXT_XPATH = ('.//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::template)]')
+
+
+# Adds the time since start to timings[stage] (when timings is given) and returns the current time,
+# so the extraction steps can be profiled stage by stage (see benchmarks/bench_parser.py)
+def _record_stage(timings: Optional[Dict[str, float]], stage: str, start: float) -> float:
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+
 #The ArticleScraper class is designed to
 #scrape articles from web pages, extracting both metadata (from a JSON script tag) and the full article text.
 # and then encapsulate the information into an Article object.
+#
+# engine selects how the page is parsed:
+#   'soup' builds the full html.parser tree with BeautifulSoup (the reference behaviour)
+#   'fast' parses with lxml and only walks the metadata script and the read-section paragraphs,
+#          returning the same Article (checked by benchmarks/bench_fast_extractor.py)
+# metrics (a CrawlMetrics) receives the fetch and parse timings and the outcome of every page
+# fingerprints (a FingerprintStore) skips the parsing of pages that did not change since they were saved
+# budget (a memory_budget.ByteBudget) is reserved for each page from before its fetch until it is parsed,
+# at its body size plus the estimated size of its parse tree
 
 class ArticleScraper:
+    ENGINES = ('soup', 'fast')
+    # Parse tree size per body byte: about 10 for the html.parser tree of BeautifulSoup, less for lxml
+    TREE_FACTORS = {'soup': 10, 'fast': 3}
+
     # constructor
-    def __init__(self):
-        #The pass statement means that no specific attributes or actions are taken when an instance of ArticleScraper is created.
-        pass
+    # transport is the shared HttpTransport, so one scraper (and its keep-alive connections) serves every article URL
+    def __init__(self, transport: Optional[HttpTransport] = None, engine: str = 'soup',
+                 metrics: Optional[CrawlMetrics] = None, fingerprints: Optional[FingerprintStore] = None,
+                 budget: Optional[ByteBudget] = None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown extraction engine {engine!r}, expected one of {self.ENGINES}")
+        if engine == 'fast' and lxml is None:
+            raise ValueError("The 'fast' extraction engine needs lxml (pip install lxml)")
+        self.transport = transport or HttpTransport()
+        self.engine = engine
+        self.metrics = metrics
+        self.fingerprints = fingerprints
+        self.budget = budget
+        # URLs whose fetch failed (timeouts, HTTP errors after the retries): None was returned for them, but
+        # they must not be checkpointed as done (crawl_article_urls takes them out again)
+        self.failed_fetches = set()
 
     # input : article_url(str) A string representing the URL of the article to be scraped.
     # Return : Article or non
 
     def scrape_article(self, article_url: str) -> Article:
+        held = self.budget.reserve() if self.budget else 0
+        try:
+            try:
+                # 1. Fetching the web page
+                start = time.perf_counter()
+                response = self.transport.get(article_url)
+                response.raise_for_status()  # Raise an exception for HTTP errors
+                content = response.content
+                if self.metrics:
+                    self.metrics.record_fetch(time.perf_counter() - start, len(content))
+            except requests.RequestException as e:
+                logger.warning("Failed to fetch %s: %s", article_url, e)
+                if self.metrics:
+                    self.metrics.record_outcome('fetch_error')
+                self.failed_fetches.add(article_url)
+                return None
+            if self.budget:
+                # The body and the tree about to be built from it
+                held = self.budget.adjust(held, len(content) * (1 + self.TREE_FACTORS[self.engine]))
+
+            # Nothing to do when the page is the one already saved
+            if self.fingerprints and self.fingerprints.check(article_url, content):
+                if self.metrics:
+                    self.metrics.record_outcome('unchanged')
+                return None
+
+            # 2. Parsing the page and building the Article
+            return self.parse_article(article_url, content)
+        finally:
+            if self.budget:
+                self.budget.release(held)
+
+    # Builds the Article from the raw bytes of a page that was already downloaded
+    def parse_article(self, article_url: str, content: bytes) -> Optional[Article]:
+        start = time.perf_counter()
+        article, outcome = self.parse_page(self.engine, article_url, content)
+        if self.metrics:
+            self.metrics.record_parse(time.perf_counter() - start)
+            self.metrics.record_outcome(outcome)
+        return article
+
+    # Parses a page with the given engine; returns the Article (or None) and the outcome (see crawl_metrics.OUTCOMES)
+    # timings, when given, receives the seconds spent in each stage (parse, decompose, select, metadata_json, paragraph_join)
+    @staticmethod
+    def parse_page(engine: str, article_url: str, content: bytes,
+                   timings: Optional[Dict[str, float]] = None) -> Tuple[Optional[Article], str]:
         try:
-            # 1. Fetching the web page
-            response = requests.get(article_url)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-
-            # 2. Parsing the web page content
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # 3. Removing unwanted elements
-            unwanted_selectors = [
-                '.lg_para.summary',
-                '.footer-bottom-text',
-                '.footer_top_menu',
-                '.footer_middle_menu',
-                '.footer_btm_row',
-                '.col-4',
-                '.post-type.post-metas.type-wrap.article-details-metas',
-                '.post_disclaimer'
-            ]
+            if engine == 'fast':
+                parts = ArticleScraper.extract_parts_fast(content, timings)
+            else:
+                parts = ArticleScraper.extract_parts_with_soup(content, timings)
+            return ArticleScraper.build_article_with_outcome(article_url, parts, timings)
+        except Exception as e:
+            logger.error("An error occurred while scraping %s: %s", article_url, e)
+            return None, 'parse_error'
 
+    @staticmethod
+    def extract_parts_with_soup(content: bytes, timings: Optional[Dict[str, float]] = None) -> ArticleParts:
+        # Parsing the web page content
+        mark = time.perf_counter()
+        soup = BeautifulSoup(content, 'html.parser')
+        mark = _record_stage(timings, 'parse', mark)
+        try:
             # Remove each unwanted element from the soup
-            for selector in unwanted_selectors:
+            for selector in UNWANTED_SELECTORS:
                 for element in soup.select(selector):
                     element.decompose()
+            mark = _record_stage(timings, 'decompose', mark)
 
-            # 4. extracting metadata
-                #Search the HTML for a <script> tag with the attribute type="text/tawsiyat".
+            #Search the HTML for a <script> tag with the attribute type="text/tawsiyat".
             script_tag = soup.find('script', {'type': 'text/tawsiyat'}) #script_tag is a BeautifulSoup Object
+            #In BeautifulSoup, the .string attribute is used to access the content of a tag
+            # if that tag contains only a single string of text
+            # (copied to a plain str: a NavigableString keeps its whole tree alive through .parent)
+            metadata_text = script_tag.string if script_tag else None
+            metadata_text = str(metadata_text) if metadata_text is not None else None
+
+            # Find the specific section by class, then the specific div inside it
+            section = soup.find('section', {'class': 'read-section'})
+            paragraphs = None
+            if section:
+                div_content = section.find('div', {'class': 'p-content'})
+                if div_content:
+                    paragraphs = [p.get_text() for p in div_content.find_all('p')]
+            _record_stage(timings, 'select', mark)
+
+            return ArticleParts(script_tag is not None, metadata_text, section is not None, paragraphs)
+        finally:
+            # The tree is full of parent/sibling reference cycles that only the cyclic garbage collector
+            # would free, long after the page is done; decompose() breaks them now
+            soup.decompose()
 
-            metadata = {}
-                #check if the script tag is found
-            if script_tag:
-                #Extract the content of the script tag
-                #In BeautifulSoup, the .string attribute is used to access the content of a tag
-                # if that tag contains only a single string of text
-                metadata_contact = script_tag.string #This line assigns the extracted text (the JSON string) from the <script> tag to the variable metadata_content.
-
+    @staticmethod
+    def extract_parts_fast(content: bytes, timings: Optional[Dict[str, float]] = None) -> ArticleParts:
+        # Decode the same way BeautifulSoup does, then let lxml build the tree in C
+        mark = time.perf_counter()
+        markup = UnicodeDammit(content, is_html=True).unicode_markup
+        document = lxml.html.document_fromstring(markup.encode('utf-8'),
+                                                 parser=lxml.html.HTMLParser(encoding='utf-8'))
+        mark = _record_stage(timings, 'parse', mark)
+
+        # Unwanted elements are dropped (their tail text stays, like decompose())
+        for element in document.xpath(UNWANTED_XPATH):
+            if element.getparent() is not None:
+                element.drop_tree()
+        mark = _record_stage(timings, 'decompose', mark)
+
+        script_tags = document.xpath('//script[@type="text/tawsiyat"]')
+        metadata_text = None
+        if script_tags:
+            script_tag = script_tags[0]
+            # .string in BeautifulSoup: the text of a tag whose only child is one string
+            if len(script_tag) == 0 and script_tag.text:
+                metadata_text = script_tag.text
+
+        sections = document.xpath(SECTION_XPATH)
+        paragraphs = None
+        if sections:
+            divs = sections[0].xpath(P_CONTENT_XPATH)
+            if divs:
+                paragraphs = [''.join(p.xpath(P_TEXT_XPATH)) for p in divs[0].iter('p')]
+        _record_stage(timings, 'select', mark)
+
+        return ArticleParts(bool(script_tags), metadata_text, bool(sections), paragraphs)
 
-                # Parse the contact as Json
-                try:
-                    #Attempts to parse the text content of the <script> tag as JSON
-                    metadata = json.loads(script_tag.string)
-                    # check if the type is 'article'
-                    is_article = metadata.get('type') == 'article'
-                except json.JSONDecodeError:
-                    print(f"Failed to parse JSON in script tag for {article_url}")
-                    is_article = False
-                except Exception as e:
-                    print(f"Error parsing script tag: {e}")
+    @staticmethod
+    def build_article(article_url: str, parts: ArticleParts) -> Optional[Article]:
+        return ArticleScraper.build_article_with_outcome(article_url, parts)[0]
 
-            else:
-                print("The <script type='text/tawsiyat'> tag was not found")
+    @staticmethod
+    def build_article_with_outcome(article_url: str, parts: ArticleParts,
+                                   timings: Optional[Dict[str, float]] = None) -> Tuple[Optional[Article], str]:
+        # extracting metadata
+        mark = time.perf_counter()
+        metadata = {}
+            #check if the script tag is found
+        if parts.script_found:
+            # Parse the contact as Json
+            try:
+                #Attempts to parse the text content of the <script> tag as JSON
+                metadata = json.loads(parts.metadata_text)
+                # check if the type is 'article'
+                is_article = metadata.get('type') == 'article'
+                outcome = 'not_article'
+            except json.JSONDecodeError:
+                logger.warning("Failed to parse JSON in script tag for %s", article_url)
+                is_article = False
+                outcome = 'json_decode_error'
+            except Exception as e:
+                logger.warning("Error parsing script tag of %s: %s", article_url, e)
                 is_article = False
+                outcome = 'metadata_error'
 
-            # Only proceed if the page type is 'article'
-            # 5. extracting the full article text
+        else:
+            logger.info("The <script type='text/tawsiyat'> tag was not found in %s", article_url)
+            is_article = False
+            outcome = 'no_metadata'
+        mark = _record_stage(timings, 'metadata_json', mark)
 
-            if is_article:
-                # Find the specific section by class
-                section = soup.find('section',{'class':'read-section'})
+        # Only proceed if the page type is 'article'
+        # extracting the full article text
 
-                # If the section exists, find the specific div inside it
-                if section:
-                    div_content = section.find('div', {'class':'p-content'})
+        if is_article:
+            # If the section exists, find the specific div inside it
+            if parts.section_found:
 
-                    #If the div exists, extract the text from all <p> tags within it
-                    if div_content:
-                        # Extract and print the paragraphs to debug the order
-                        paragraphs = [p.get_text() for p in div_content.find_all('p')]
+                #If the div exists, extract the text from all <p> tags within it
+                if parts.paragraphs is not None:
+                    # Extract and print the paragraphs to debug the order
+                    paragraphs = list(parts.paragraphs)
 
-                        print("Extracted paragraphs (before any modification):")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Extracted paragraphs of %s (before any modification):", article_url)
                         for idx, para in enumerate(paragraphs):
-                            print(f"Paragraph {idx + 1}: {para}")
-
-                        if metadata.get('lang') == 'ar':
-                            paragraphs.reverse()  # Reverse the order if the issue is persistent for Arabic
-
-                        full_article_text = ' '.join(paragraphs)
-
-
-                        # soup.find_all('p'): Finds all <p> (paragraph) tags in the HTML.
-                        # p.get_text(): Extracts the text from each paragraph.
-                        # .join(...): Joins all the extracted paragraph texts into a single string,
-                        # separated by spaces, to form the full text of the article.
-                        #full_article_text = ' '.join(p.get_text() for p in soup.find_all('p'))
-
-
-                        # 5. Creating an Article Object
-                        article = Article(
-                            url=article_url,
-                            post_id=metadata.get('postid'),
-                            title=metadata.get('title'),
-                            keywords=metadata.get('keywords', []),
-                            thumbnail=metadata.get('thumbnail'),
-                            publication_date=metadata.get('published_time'),
-                            last_updated_date=metadata.get('last_updated'),
-                            author=metadata.get('author'),
-                            full_article_text=full_article_text,
-                            video_duration=metadata.get('video_duration'),
-                            word_count=metadata.get('word_count'),
-                            lang=metadata.get('lang'),
-                            description=metadata.get('description'),
-                            classes = metadata.get('classes', []),
-                        )
-                        print(f"Scraped article {article_url}: {article}")
-                        return article
-                    else:
-                        print("The <div class = 'p-content'> was not found within the specified section, so there is no article.")
-                        return None
+                            logger.debug("Paragraph %d: %s", idx + 1, para)
+
+                    if metadata.get('lang') == 'ar':
+                        paragraphs.reverse()  # Reverse the order if the issue is persistent for Arabic
+
+                    # .join(...): Joins all the extracted paragraph texts into a single string,
+                    # separated by spaces, to form the full text of the article.
+                    full_article_text = ' '.join(paragraphs)
+
+                    # Creating an Article Object
+                    article = Article(
+                        url=article_url,
+                        post_id=metadata.get('postid'),
+                        title=metadata.get('title'),
+                        keywords=metadata.get('keywords', []),
+                        thumbnail=metadata.get('thumbnail'),
+                        publication_date=metadata.get('published_time'),
+                        last_updated_date=metadata.get('last_updated'),
+                        author=metadata.get('author'),
+                        full_article_text=full_article_text,
+                        video_duration=metadata.get('video_duration'),
+                        word_count=metadata.get('word_count'),
+                        lang=metadata.get('lang'),
+                        description=metadata.get('description'),
+                        classes = metadata.get('classes', []),
+                    )
+                    _record_stage(timings, 'paragraph_join', mark)
+                    logger.debug("Scraped article %s: %s", article_url, article)
+                    return article, 'article'
                 else:
-                    print("The <section> with the specified classes was not found, so not article, error in metadata")
-                    return None
+                    logger.info("The <div class = 'p-content'> was not found within the section of %s, so there is no article.", article_url)
+                    return None, 'missing_p_content'
             else:
-                print("The page is not recognized as an article. No text extracted.")
-                return None
-
-        except requests.RequestException as e:
-            print(f"Failed to fetch {article_url}: {e}")
-        except Exception as e:
-            print(f"An error occurred while scraping {article_url}: {e}")
-        return None
+                logger.info("The <section> with the specified classes was not found in %s, so not article, error in metadata", article_url)
+                return None, 'missing_section'
+        else:
+            logger.info("%s is not recognized as an article. No text extracted.", article_url)
+            return None, outcome
 
 
 
@@ -235,7 +489,7 @@ class FileUtility:
                 int_month = int(month)
                 filename = f'articles_{year}_{int_month:02d}.json.gz' if compressed else f'articles_{year}_{int_month:02d}.json'
             except ValueError:
-                print(f"Invalid month value: {month}. Defaulting to 'articles.json'")
+                logger.warning("Invalid month value: %s. Defaulting to 'articles.json'", month)
                 filename = 'articles.json.gz' if compressed else 'articles.json'
 
         # Create a directory to save the files if it doesn't exist
@@ -252,67 +506,772 @@ class FileUtility:
             with open_function(filepath, 'wt', encoding='utf-8') as f:
                 json.dump([article.__dict__ for article in articles], f, ensure_ascii=False, indent=4)
 
-            print(f'Successfully saved to {filepath}')
+            logger.info('Successfully saved to %s', filepath)
         except Exception as e:
-            print(f'Error saving file {filepath}: {e}')
+            logger.error('Error saving file %s: %s', filepath, e)
+
+    # save_articles_sharded writes the articles as a sharded corpus (corpus_shards.py): compact JSON lines
+    # in shards of shard_size uncompressed bytes, compressed with gzip, zstd or brotli, plus a manifest
+    @staticmethod
+    def save_articles_sharded(directory, articles, codec='gzip', shard_size=32 * 2 ** 20, level=None):
+        with ShardedCorpusWriter(directory, codec=codec, shard_size=shard_size, level=level) as writer:
+            count = writer.write_many(articles)
+        logger.info('Saved %d articles in %d %s shards to %s', count, len(writer.manifest['shards']), codec,
+                    directory)
+        return count
+
+    # iter_articles reads an article dump one record at a time, so memory does not grow with the file.
+    # It accepts JSON Lines (one article per line, as written by ArticleStreamWriter) and the older
+    # JSON array dumps, gzip-compressed (detected from the content) or plain, and sharded corpus
+    # directories (corpus_shards.py), whose shards are decompressed by `workers` threads.
+    @staticmethod
+    def iter_articles(filepath, chunk_size=1024 * 1024, workers=4):
+        if os.path.isdir(filepath):
+            yield from iter_corpus(filepath, workers=workers)
+            return
+        with open(filepath, 'rb') as raw:
+            compressed = raw.read(2) == b'\x1f\x8b'
+        if compressed:
+            reader = _TolerantGzipReader(filepath)
+            # errors='replace' only matters for a character cut in half by a killed writer
+            f = io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8', errors='replace')
+        else:
+            reader = None
+            f = open(filepath, 'rt', encoding='utf-8')
+        with f:
+            head = f.read(chunk_size)
+            stripped = head.lstrip()
+            if stripped.startswith('['):
+                yield from FileUtility._iter_json_array(f, stripped[1:], chunk_size)
+            else:
+                yield from FileUtility._iter_json_lines(f, head)
+        if reader is not None and reader.truncated:
+            logger.warning('%s ends with an incomplete gzip member, stopped there', filepath)
+
+    @staticmethod
+    def _iter_json_lines(f, head):
+        pending = ''
+        chunk = head
+        while chunk:
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            chunk = f.read(len(head) or 1)
+        if pending.strip():
+            try:
+                yield json.loads(pending)
+            except json.JSONDecodeError:
+                # The last line was being written when the crawl stopped
+                logger.warning('Skipping an incomplete last line')
+
+    @staticmethod
+    def _iter_json_array(f, buffer, chunk_size):
+        # Decodes one array element at a time with raw_decode, reading more text when an element is cut
+        decoder = json.JSONDecoder()
+        position = 0
+        exhausted = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                if position >= len(buffer):
+                    raise ValueError
+                record, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if exhausted:
+                    if buffer[position:].strip():
+                        raise ValueError('Truncated JSON array')
+                    return
+                chunk = f.read(chunk_size)
+                exhausted = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield record
+            position = end
+
+
+# Binary gzip stream that ends quietly (setting truncated) where a gzip member was cut short,
+# instead of raising EOFError and losing the data decompressed in the same read
+class _TolerantGzipReader(io.RawIOBase):
+    def __init__(self, filepath):
+        self._gzip = gzip.open(filepath, 'rb')
+        self.truncated = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            data = self._gzip.read1(len(buffer))
+        except EOFError:
+            self.truncated = True
+            return 0
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._gzip.close()
+        super().close()
+
+
+# The ArticleStreamWriter class appends every scraped Article as one compact JSON line to a gzip
+# file per month (articles_YYYY_MM.jsonl.gz) and to the combined all_articles_original.jsonl.gz,
+# as soon as it is scraped, so the crawl never keeps the corpus in memory.
+#
+# Lines are buffered and written in batches of batch_size, each batch as a complete gzip member
+# (a file of several members is still one valid gzip stream). Files are only ever appended to;
+# if a previous run was killed in the middle of a write, the torn last member is cut off when the
+# file is opened again. on_flush(records) is called with the (url, article) pairs of every batch
+# once it is on disk, e.g. to mark them as done in the crawl checkpoint.
+# With typed=True the lines hold the normalized article_model.TypedArticle (keyword list, int word
+# count, ISO dates, category/coverage) instead of the raw scraped strings.
+
+class ArticleStreamWriter:
+    def __init__(self, directory='data', combined_filename='all_articles_original.jsonl.gz', batch_size=50,
+                 on_flush: Optional[Callable[[List[Tuple[Optional[str], Article]]], None]] = None,
+                 typed: bool = False):
+        self.directory = directory
+        self.typed = typed
+        self.combined_filename = combined_filename
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.written = 0
+        self._pending = []  # (filename, url, article, line)
+        self._checked = set()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def month_filename(year, month) -> str:
+        try:
+            return f'articles_{year}_{int(month):02d}.jsonl.gz'
+        except ValueError:
+            logger.warning("Invalid month value: %s. Defaulting to 'articles.jsonl.gz'", month)
+            return 'articles.jsonl.gz'
+
+    def write(self, article: Article, year, month, url: Optional[str] = None):
+        if self.typed:
+            line = TypedArticle.from_article(article).to_json() + '\n'
+        else:
+            line = json.dumps(article.__dict__, ensure_ascii=False, separators=(',', ':')) + '\n'
+        self._pending.append((self.month_filename(year, month), url, article, line.encode('utf-8')))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        by_file = {}
+        for filename, url, article, line in self._pending:
+            by_file.setdefault(filename, []).append(line)
+        by_file.setdefault(self.combined_filename, []).extend(line for _, _, _, line in self._pending)
+        for filename, lines in by_file.items():
+            self._append_member(os.path.join(self.directory, filename), b''.join(lines))
+        records = [(url, article) for _, url, article, _ in self._pending]
+        self.written += len(records)
+        self._pending = []
+        if self.on_flush:
+            self.on_flush(records)
+
+    def _append_member(self, filepath, data: bytes):
+        if filepath not in self._checked:
+            self._truncate_torn_member(filepath)
+            self._checked.add(filepath)
+        member = gzip.compress(data)
+        with open(filepath, 'ab') as f:
+            f.write(member)
+            f.flush()
 
+    @staticmethod
+    def _truncate_torn_member(filepath, chunk_size: int = 64 * 1024):
+        # Walks the gzip members chunk by chunk (memory stays at one chunk and its output whatever the size of
+        # the file) and cuts the file after the last complete one
+        if not os.path.exists(filepath):
+            return
+        size = os.path.getsize(filepath)
+        offset = 0  # end of the last complete member
+        start = 0  # file offset of data
+        with open(filepath, 'rb') as f:
+            decompressor = zlib.decompressobj(wbits=31)
+            data = f.read(chunk_size)
+            while data:
+                try:
+                    decompressor.decompress(data)
+                except zlib.error:
+                    break
+                if decompressor.eof:
+                    # The member ends in this chunk, the next one starts with the unused bytes
+                    offset = start + len(data) - len(decompressor.unused_data)
+                    start, data = offset, decompressor.unused_data
+                    decompressor = zlib.decompressobj(wbits=31)
+                    if data:
+                        continue
+                else:
+                    start += len(data)
+                data = f.read(chunk_size)
+        if offset < size:
+            logger.warning('Removing %d bytes of an incomplete write from %s', size - offset, filepath)
+            with open(filepath, 'r+b') as f:
+                f.truncate(offset)
 
+    def close(self):
+        self.flush()
 
-def main():
-    sitemap_index_url = 'https://www.almayadeen.net/sitemaps/all.xml'
-    sitemap_parser = SitemapParser(sitemap_index_url)
+    def __enter__(self):
+        return self
 
-    monthly_sitemap_urls = sitemap_parser.get_monthly_sitemap_urls()
-    all_articles_original = []
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
-    scraped_count = 0
-    max_articles = 20000  # Maximum number of articles to scrape
 
-    for monthly_url in monthly_sitemap_urls:
-        try:
-            year_month = monthly_url.split('-')[-3:-1]
-            year, month = year_month[0], year_month[1]
-        except IndexError as e:
-            print(f"Could not extract year and month from URL: {monthly_url}. Error: {e}")
-            continue
 
-        article_urls = sitemap_parser.get_article_urls(monthly_url)
-        monthly_articles = []
+# The AsyncCrawler class scrapes a list of article URLs concurrently.
+# An asyncio event loop schedules the work and a semaphore caps how many pages are in flight,
+# while the blocking ArticleScraper.scrape_article call itself runs on a thread pool,
+# so the Article objects it returns are exactly the same as in the sequential crawl.
 
-        for article_url in article_urls:
+class AsyncCrawler:
+    def __init__(self, concurrency: int = 16, scraper: Optional[ArticleScraper] = None):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.scraper = scraper or ArticleScraper(HttpTransport(pool_maxsize=concurrency))
+
+    @property
+    def failed_fetches(self) -> set:
+        return self.scraper.failed_fetches
+
+    async def _scrape(self, article_url: str, semaphore: asyncio.Semaphore, executor) -> Optional[Article]:
+        async with semaphore:
+            loop = asyncio.get_running_loop()
             try:
-                if scraped_count >= max_articles:
-                    print(f"Reached the limit of {max_articles} articles. Stopping.")
-                    break
+                return await loop.run_in_executor(executor, self.scraper.scrape_article, article_url)
+            except Exception as e:
+                logger.error("Failed to scrape article %s: %s", article_url, e)
+                return None
 
-                article = ArticleScraper().scrape_article(article_url)
-                if article:
-                    monthly_articles.append(article)
-                    scraped_count += 1
-                    print(f"articles scrapped till now: {scraped_count}")
+    async def crawl(self, article_urls: List[str],
+                    on_result: Optional[Callable[[str, Optional[Article]], None]] = None,
+                    keep_articles: bool = True) -> List[Optional[Article]]:
+        # One result per URL, in the same order as article_urls (None when the page is not an article)
+        # on_result(url, article) is called on the event loop as soon as each page is done
+        # keep_articles=False returns True/False (article or not) instead, so a long batch handed to
+        # on_result doesn't keep every Article in memory until the end
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def scrape_and_report(url, executor):
+            article = await self._scrape(url, semaphore, executor)
+            if on_result:
+                on_result(url, article)
+            return article if keep_articles else article is not None
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            tasks = [scrape_and_report(url, executor) for url in article_urls]
+            return await asyncio.gather(*tasks)
+
+    def scrape_articles(self, article_urls: List[str], max_articles: Optional[int] = None,
+                        on_result: Optional[Callable[[str, Optional[Article]], None]] = None,
+                        keep_articles: bool = True) -> List[Article]:
+        # Scrape URLs in batches until max_articles articles were found or the URLs run out.
+        # Pages that are not articles don't count, so a batch is only as large as the remaining budget.
+        # keep_articles=False returns an empty list: the articles only go to on_result
+        articles = []
+        found = 0
+        position = 0
+        while position < len(article_urls):
+            remaining = len(article_urls) - position if max_articles is None else max_articles - found
+            if remaining <= 0:
+                break
+            batch = article_urls[position:position + remaining]
+            position += len(batch)
+            results = [result for result in asyncio.run(self.crawl(batch, on_result, keep_articles)) if result]
+            found += len(results)
+            if keep_articles:
+                articles.extend(results)
+        return articles
+
+
+# A monthly sitemap can only be marked as completed once its month is over,
+# otherwise the nightly run would never see the articles published later in the month
+def _is_past_month(year: str, month: str) -> bool:
+    try:
+        now = datetime.now(timezone.utc)
+        return (int(year), int(month)) < (now.year, now.month)
+    except ValueError:
+        return False
+
+
+# Transports wrap each other (cache -> rate limiter -> pooled HTTP); yields every layer, outermost first
+def _transport_layers(transport):
+    while transport is not None:
+        yield transport
+        transport = getattr(transport, 'transport', None)
+
+
+# The article crawler for the given settings: a CrawlPipeline when parser_processes > 0 (with concurrency
+# fetch threads), an AsyncCrawler when concurrency > 1, None for the sequential loop over article_scraper
+def make_crawler(transport, article_scraper: ArticleScraper, concurrency: int = 1, parser_processes: int = 0,
+                 engine: str = 'soup', metrics: Optional[CrawlMetrics] = None):
+    if parser_processes > 0:
+        from crawl_pipeline import CrawlPipeline
+        return CrawlPipeline(transport, fetch_workers=concurrency, parser_processes=parser_processes,
+                             engine=engine, metrics=metrics, fingerprints=article_scraper.fingerprints,
+                             budget=article_scraper.budget)
+    if concurrency > 1:
+        return AsyncCrawler(concurrency, article_scraper)
+    return None
+
+
+# Year and month of a monthly sitemap URL (.../sitemap-2024-05-1.xml)
+def sitemap_year_month(monthly_url: str) -> Tuple[str, str]:
+    year_month = monthly_url.split('-')[-3:-1]
+    return year_month[0], year_month[1]
+
+
+# The on_flush callback of the ArticleStreamWriter: records the saved pages in the checkpoint and
+# stores their fingerprints (None when neither is used)
+def saved_pages_callback(checkpoint: Optional[CrawlCheckpoint] = None,
+                         fingerprints: Optional[FingerprintStore] = None,
+                         scheduler: Optional[RecrawlScheduler] = None):
+    callbacks = [callback for callback in (checkpoint and checkpoint.record_many,
+                                           fingerprints and fingerprints.commit,
+                                           scheduler and scheduler.record_many) if callback]
+    if not callbacks:
+        return None
 
+    def on_saved(records):
+        for callback in callbacks:
+            callback(records)
+    return on_saved
+
+
+# Scrapes the article URLs of one monthly sitemap into writer and returns the number of articles.
+# Pages that are not articles (or did not change) are passed to the writer's on_flush stores (checkpoint,
+# fingerprints, scheduler) right away, articles once the writer flushed them. Pages that could not be
+# fetched are not: they stay pending and the next run tries them again.
+# sink (e.g. a mongo_sink.MongoArticleSink) also receives every article as soon as it is scraped.
+# on_complete (e.g. marking the sitemap completed in the checkpoint) is called once every URL was handled and
+# the articles are in the output files; not when a page failed or max_articles cut the list short.
+def crawl_article_urls(article_urls: List[str], year: str, month: str, writer: ArticleStreamWriter,
+                       crawler=None, article_scraper: Optional[ArticleScraper] = None,
+                       max_articles: Optional[int] = None, scraped_before: int = 0, sink=None,
+                       on_complete: Optional[Callable[[], None]] = None) -> int:
+    monthly_count = 0
+    failed = 0
+    failed_fetches = (crawler or article_scraper).failed_fetches
+
+    def save(url, article):
+        nonlocal monthly_count, failed
+        if article:
+            writer.write(article, year, month, url)
+            if sink:
+                sink.write(article, url)
+            monthly_count += 1
+        elif url in failed_fetches:
+            failed_fetches.discard(url)
+            failed += 1
+        elif writer.on_flush:
+            writer.on_flush([(url, None)])
+
+    if crawler:
+        # The articles are only counted, the writer has them
+        crawler.scrape_articles(article_urls, max_articles, on_result=save, keep_articles=False)
+        logger.info("articles scrapped till now: %d", scraped_before + monthly_count)
+    else:
+        for article_url in article_urls:
+            if max_articles is not None and monthly_count >= max_articles:
+                break
+            try:
+                article = article_scraper.scrape_article(article_url)
             except Exception as e:
-                print(f"Failed to scrape article {article_url}: {e}")
+                logger.error("Failed to scrape article %s: %s", article_url, e)
+                failed += 1
+                if article_scraper.metrics:
+                    article_scraper.metrics.record_outcome('parse_error')
+                continue
+            # Outside the try: an error of the writer or the sink (SinkUnavailableError) stops the crawl
+            save(article_url, article)
+            if article:
+                logger.debug("articles scrapped till now: %d", scraped_before + monthly_count)
+
+    # Everything of this month is on disk before moving on
+    writer.flush()
+    if article_scraper and article_scraper.fingerprints:
+        article_scraper.fingerprints.discard(article_urls)
+    if monthly_count:
+        logger.info("Saved %d articles for %s-%s to %s", monthly_count, year, month,
+                    os.path.join(writer.directory, writer.month_filename(year, month)))
+    if failed:
+        logger.info("%d pages of %s-%s failed, they are tried again by the next run", failed, year, month)
+    elif on_complete and (max_articles is None or monthly_count < max_articles):
+        on_complete()
+    return monthly_count
+
+
+# Logs the connection, pipeline, cache, rate-limit, replay and page statistics of a finished crawl,
+# writes the metrics summary to metrics_path and returns the statistics
+def report_crawl(transport, crawler, metrics: CrawlMetrics, metrics_path: Optional[str] = None, sink=None,
+                 frontier=None, fingerprints: Optional[FingerprintStore] = None,
+                 scheduler: Optional[RecrawlScheduler] = None, budget: Optional[ByteBudget] = None) -> dict:
+    extra = {'connections': transport.connection_stats()}
+    logger.info("HTTP requests: %d, new connections: %d, reused connections: %d",
+                extra['connections']['requests'], extra['connections']['new_connections'],
+                extra['connections']['reused_connections'])
+    if hasattr(crawler, 'stats'):
+        crawler.close()
+        extra['pipeline'] = crawler.stats()
+        for stage in ('fetch', 'parse', 'write'):
+            logger.info("Pipeline %s: %d items, %s items/sec", stage, extra['pipeline'][stage]['items'],
+                        extra['pipeline'][stage]['items_per_sec'])
+        for name, depth in extra['pipeline']['queues'].items():
+            logger.info("Pipeline %s queue: max depth %d/%d, mean depth %s", name, depth['max_depth'],
+                        depth['capacity'], depth['mean_depth'])
+    for layer in _transport_layers(transport):
+        if hasattr(layer, 'cache_stats'):
+            extra['http_cache'] = cache_stats = layer.cache_stats()
+            logger.info("HTTP cache: %d hits, %d misses, hit rate %.1f%%, %d bytes stored", cache_stats['hits'],
+                        cache_stats['misses'], cache_stats['hit_rate'] * 100, cache_stats['size_bytes'])
+        if hasattr(layer, 'rate_limit_stats'):
+            extra['rate_limit'] = rate_stats = layer.rate_limit_stats()
+            logger.info("Rate limiter: %d throttled responses, %d errors, %d retries, current rates %s requests/sec",
+                        rate_stats['throttled'], rate_stats['errors'], rate_stats['retries'], rate_stats['rates'])
+        if hasattr(layer, 'replay_stats'):
+            extra['replay'] = replay_stats = layer.replay_stats()
+            logger.info("Replay: %d requests, %d not in the archive of %d URLs", replay_stats['requests'],
+                        replay_stats['misses'], replay_stats['archived_urls'])
+    if hasattr(sink, 'sink_stats'):
+        extra['sink'] = sink_stats = sink.sink_stats()
+        logger.info("Sink: %d articles written in %d batches (%d new, %d updated), %d errors, %d buffered",
+                    sink_stats['written'], sink_stats['batches'], sink_stats['upserted'], sink_stats['modified'],
+                    sink_stats['errors'], sink_stats['buffered'])
+    if frontier is not None:
+        extra['frontier'] = frontier_stats = frontier.frontier_stats()
+        logger.info("URL frontier: %d URLs, Bloom filter %d bytes in %d layers, %d index lookups, %d false positives",
+                    frontier_stats['urls'], frontier_stats['bloom_bytes'], frontier_stats['bloom_layers'],
+                    frontier_stats['index_lookups'], frontier_stats['false_positives'])
+    if fingerprints is not None:
+        extra['fingerprints'] = fingerprint_stats = fingerprints.fingerprint_stats()
+        logger.info("Content fingerprints: %d unchanged pages skipped, %d changed, %d stored",
+                    fingerprint_stats['unchanged'], fingerprint_stats['changed'], fingerprint_stats['stored'])
+    if scheduler is not None:
+        extra['schedule'] = schedule_stats = scheduler.schedule_stats()
+        logger.info("Recrawl schedule: planned %d new, %d with a newer lastmod, %d predicted changes; "
+                    "%d changed articles found, %d of %d known pages fetched", schedule_stats['new'],
+                    schedule_stats['lastmod'], schedule_stats['predicted'], schedule_stats['changes_seen'],
+                    schedule_stats['fetched'], schedule_stats['pages'])
+    if budget is not None:
+        extra['memory_budget'] = budget_stats = budget.budget_stats()
+        logger.info("In-flight page memory: peak %d of %d bytes, fetches waited %d times (%.1fs)",
+                    budget_stats['peak'], budget_stats['capacity'], budget_stats['waits'],
+                    budget_stats['wait_seconds'])
+    summary = metrics.summary()
+    logger.info("Pages: %d (%.1f/sec), %d bytes downloaded, outcomes: %s", summary['pages'],
+                summary['pages_per_sec'], summary['bytes_downloaded'],
+                {outcome: count for outcome, count in summary['outcomes'].items() if count})
+    if metrics_path:
+        metrics.write_summary(metrics_path, extra)
+    return extra
+
+
+# Crawl of a main() run with a RecrawlScheduler: lists the monthly sitemaps whose lastmod changed (newest
+# first) into the scheduler, then fetches the max_articles most urgent pages it plans, grouped by sitemap so
+# they go to their monthly files. The checkpoint no longer filters URLs out (the scheduler decides what is
+# fetched again) but still records every fetched page. Returns the number of articles scraped.
+def crawl_scheduled(sitemap_parser: SitemapParser, scheduler: RecrawlScheduler, writer: ArticleStreamWriter,
+                    crawler, article_scraper: ArticleScraper, max_articles: int,
+                    checkpoint: Optional[CrawlCheckpoint] = None, sink=None, frontier=None) -> int:
+    for monthly_url, lastmod in scheduler.order_sitemaps(sitemap_parser.get_monthly_sitemap_entries()):
+        if not scheduler.sitemap_changed(monthly_url, lastmod):
+            logger.debug("Sitemap %s did not change since it was listed", monthly_url)
+            continue
+        entries = sitemap_parser.get_article_entries(monthly_url)
+        if frontier:
+            claimed = set(frontier.claim([url for url, _ in entries], monthly_url))
+            entries = [entry for entry in entries if entry[0] in claimed]
+        fetched = checkpoint.scraped_times([url for url, _ in entries]) if checkpoint else None
+        scheduler.add_entries(monthly_url, entries, lastmod, fetched)
+        logger.info("Listed %d article URLs of %s", len(entries), monthly_url)
+
+    by_sitemap = {}
+    for url, monthly_url in scheduler.plan(max_articles):
+        by_sitemap.setdefault(monthly_url, []).append(url)
+    logger.info("Scheduled %d pages of %d sitemaps", sum(map(len, by_sitemap.values())), len(by_sitemap))
+
+    scraped_count = 0
+    for monthly_url, article_urls in by_sitemap.items():
+        if scraped_count >= max_articles:
+            logger.info("Reached the limit of %d articles. Stopping.", max_articles)
+            break
+        try:
+            year, month = sitemap_year_month(monthly_url)
+        except IndexError as e:
+            logger.error("Could not extract year and month from URL: %s. Error: %s", monthly_url, e)
+            continue
+        scraped_count += crawl_article_urls(article_urls, year, month, writer, crawler, article_scraper,
+                                            max_articles - scraped_count, scraped_count, sink)
+    return scraped_count
+
+
+# The transport chain of the command line: pooled HTTP (or an archive replay) -> rate limiter -> cache -> recorder
+def build_transport(concurrency: int = 1,
+                    pool_size: Optional[int] = None,
+                    connect_timeout: float = 10.0,
+                    read_timeout: float = 30.0,
+                    rate_limit: bool = True,
+                    initial_rate: float = 5.0,
+                    max_rate: float = 100.0,
+                    max_retries: int = 5,
+                    http_cache: Optional[str] = os.path.join('data', 'http_cache'),
+                    http_cache_size: int = 512,
+                    record_archive: Optional[str] = None,
+                    replay_archive: Optional[str] = None,
+                    replay_latency: float = 0.0,
+                    replay_bandwidth: Optional[float] = None):
+    if replay_archive:
+        transport = ReplayTransport(HttpArchive(replay_archive), replay_latency, replay_bandwidth)
+    else:
+        transport = HttpTransport(pool_maxsize=pool_size or max(10, concurrency),
+                                  connect_timeout=connect_timeout,
+                                  read_timeout=read_timeout)
+    # A replayed archive has no server to protect
+    if rate_limit and not replay_archive:
+        transport = RateLimitedTransport(transport,
+                                         AdaptiveHostLimiter(initial_rate=initial_rate, max_rate=max_rate),
+                                         max_retries=max_retries)
+    if http_cache:
+        transport = CachingTransport(transport, HttpCache(http_cache, max_bytes=http_cache_size * 1024 * 1024))
+    if record_archive:
+        transport = RecordingTransport(transport, HttpArchive(record_archive))
+    return transport
+
+
+def main(sitemap_index_url: str = 'https://www.almayadeen.net/sitemaps/all.xml',
+         max_articles: int = 20000,
+         concurrency: int = 1,
+         transport: Optional[HttpTransport] = None,
+         checkpoint: Optional[CrawlCheckpoint] = None,
+         engine: str = 'soup',
+         parser_processes: int = 0,
+         output_directory: str = 'data',
+         metrics: Optional[CrawlMetrics] = None,
+         metrics_path: Optional[str] = None,
+         sink=None,
+         frontier=None,
+         fingerprints: Optional[FingerprintStore] = None,
+         typed_articles: bool = False,
+         scheduler: Optional[RecrawlScheduler] = None,
+         memory_budget: Optional[int] = None) -> int:
+    # concurrency > 1 switches to the AsyncCrawler for the article pages of each monthly sitemap
+    # With a checkpoint, completed sitemaps and already fetched URLs are skipped and every
+    # scraped page is recorded once it is saved, so an interrupted crawl resumes where it stopped
+    # One transport is shared by the sitemap parser and the article scraper for the whole run
+    # engine is the ArticleScraper extraction engine ('soup' or 'fast')
+    # parser_processes > 0 runs the crawl as a fetch -> parse (process pool) -> write pipeline,
+    # with concurrency fetch threads
+    # Articles are streamed to output_directory as they are scraped; returns the number scraped
+    # metrics collects page outcomes and latencies; the summary is written to metrics_path at the end
+    # sink receives every article as it is scraped (e.g. MongoArticleSink, so the API sees it right away)
+    # frontier (a UrlFrontier) drops URLs already claimed by another monthly sitemap, in this run or before
+    # fingerprints skips the parsing and writing of re-fetched pages that did not change
+    # typed_articles writes the normalized TypedArticle lines (article_model.py) instead of the raw fields
+    # scheduler (a RecrawlScheduler) spends max_articles on new and likely changed pages of all sitemaps,
+    # most urgent first, instead of walking the sitemaps in index order
+    # memory_budget caps the bytes of page bodies and parse trees in flight (memory_budget.ByteBudget)
+    transport = transport or HttpTransport(pool_maxsize=max(10, concurrency))
+    sitemap_parser = SitemapParser(sitemap_index_url, transport)
+    metrics = metrics or CrawlMetrics()
+    budget = ByteBudget(memory_budget) if memory_budget else None
+    article_scraper = ArticleScraper(transport, engine, metrics, fingerprints, budget)
+
+    # A URL goes into the checkpoint (and its fingerprint is stored) only once its article is in the output files
+    writer = ArticleStreamWriter(output_directory, on_flush=saved_pages_callback(checkpoint, fingerprints, scheduler),
+                                 typed=typed_articles)
 
-        all_articles_original.extend(monthly_articles)
+    scraped_count = 0
+    crawler = make_crawler(transport, article_scraper, concurrency, parser_processes, engine, metrics)
 
-        # Optionally save articles for the current month if you want to save incrementally
-        if monthly_articles:
-            FileUtility.save_articles_to_json(year, month, monthly_articles, compressed=True)
-            print(f"Saved {len(monthly_articles)} articles for {year}-{month}")
+    if scheduler:
+        scraped_count = crawl_scheduled(sitemap_parser, scheduler, writer, crawler, article_scraper, max_articles,
+                                        checkpoint, sink, frontier)
+        monthly_sitemap_urls = []
+    else:
+        monthly_sitemap_urls = sitemap_parser.get_monthly_sitemap_urls()
+
+    for monthly_url in monthly_sitemap_urls:
+        try:
+            year, month = sitemap_year_month(monthly_url)
+        except IndexError as e:
+            logger.error("Could not extract year and month from URL: %s. Error: %s", monthly_url, e)
+            continue
+
+        if checkpoint and checkpoint.is_sitemap_completed(monthly_url):
+            logger.info("Skipping completed sitemap %s", monthly_url)
+            continue
+
+        article_urls = sitemap_parser.get_article_urls(monthly_url)
+        if frontier:
+            article_urls = frontier.claim(article_urls, monthly_url)
+        if checkpoint:
+            article_urls = checkpoint.pending_urls(article_urls)
+            logger.info("%d new article URLs in %s", len(article_urls), monthly_url)
+
+        # A whole sitemap of a past month is finished for good once its articles are on disk
+        on_complete = None
+        if checkpoint and _is_past_month(year, month):
+            on_complete = functools.partial(checkpoint.mark_sitemap_completed, monthly_url)
+        scraped_count += crawl_article_urls(article_urls, year, month, writer, crawler, article_scraper,
+                                            max_articles - scraped_count, scraped_count, sink, on_complete)
 
         # Break the outer loop if the limit is reached
         if scraped_count >= max_articles:
-            print(f"Reached the limit of {max_articles} articles. Stopping.")
+            logger.info("Reached the limit of %d articles. Stopping.", max_articles)
             break
 
-    print(f"Total articles scraped: {scraped_count}")
+    writer.close()
+    logger.info("Total articles scraped: %d", scraped_count)
+    logger.info("Saved a total of %d articles to %s", writer.written,
+                os.path.join(output_directory, writer.combined_filename))
+    if sink:
+        sink.flush()
+    report_crawl(transport, crawler, metrics, metrics_path, sink, frontier, fingerprints, scheduler, budget)
 
-    # Optionally save all scraped articles
-    if all_articles_original:
-        FileUtility.save_articles_to_json("all_years", "all_months", all_articles_original, compressed=True)
-        print(f"Saved a total of {len(all_articles_original)} articles.")
+    return scraped_count
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape almayadeen.net articles from its sitemaps")
+    parser.add_argument('--sitemap-index', default='https://www.almayadeen.net/sitemaps/all.xml',
+                        help="URL of the sitemap index")
+    parser.add_argument('--max-articles', type=int, default=20000, help="Maximum number of articles to scrape")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="Number of article pages fetched at the same time (1 = sequential crawl)")
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help="Keep-alive connections kept per host (default: max(10, concurrency))")
+    parser.add_argument('--connect-timeout', type=float, default=10.0, help="Connect timeout in seconds")
+    parser.add_argument('--read-timeout', type=float, default=30.0, help="Read timeout in seconds")
+    parser.add_argument('--checkpoint', default=os.path.join('data', 'crawl_checkpoint.sqlite3'),
+                        help="SQLite file recording crawl progress, so a restarted crawl resumes")
+    parser.add_argument('--no-checkpoint', action='store_true', help="Crawl everything from scratch")
+    parser.add_argument('--http-cache', default=os.path.join('data', 'http_cache'),
+                        help="Directory of the conditional-GET cache for sitemaps and article pages")
+    parser.add_argument('--http-cache-size', type=int, default=512, help="Maximum size of the HTTP cache in MB")
+    parser.add_argument('--no-http-cache', action='store_true', help="Always download full responses")
+    parser.add_argument('--engine', choices=ArticleScraper.ENGINES, default='soup',
+                        help="Article extraction engine: full BeautifulSoup tree or the lxml fast path")
+    parser.add_argument('--parser-processes', type=int, default=0,
+                        help="Parse pages in this many processes, fed by --concurrency fetch threads (0 = off)")
+    parser.add_argument('--initial-rate', type=float, default=5.0, help="Starting request rate per host (req/sec)")
+    parser.add_argument('--max-rate', type=float, default=100.0, help="Highest request rate per host (req/sec)")
+    parser.add_argument('--max-retries', type=int, default=5, help="Retries of throttled or failed requests")
+    parser.add_argument('--no-rate-limit', action='store_true', help="Send requests as fast as the workers can")
+    parser.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="DEBUG also logs every extracted paragraph and article")
+    parser.add_argument('--metrics-file', default=os.path.join('data', 'crawl_metrics.json'),
+                        help="JSON file receiving the crawl metrics summary at the end of the run")
+    parser.add_argument('--metrics-snapshots', default=None,
+                        help="JSONL file receiving a metrics snapshot every --snapshot-interval seconds")
+    parser.add_argument('--snapshot-interval', type=float, default=30.0, help="Seconds between metrics snapshots")
+    parser.add_argument('--record-archive', default=None,
+                        help="Append every response to this HTTP archive (e.g. data/http_archive.warc.gz)")
+    parser.add_argument('--replay-archive', default=None,
+                        help="Serve responses from this HTTP archive instead of the network (no rate limiting)")
+    parser.add_argument('--replay-latency', type=float, default=0.0, help="Seconds added to every replayed request")
+    parser.add_argument('--replay-bandwidth', type=float, default=None,
+                        help="Bytes/sec replayed bodies are served at (default: unlimited)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Shard the crawl over this many worker processes through a lease queue (0 = off)")
+    parser.add_argument('--queue', default=os.path.join('data', 'crawl_queue.sqlite3'),
+                        help="SQLite lease queue of the --workers crawl")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="With --workers, queue batches of this many article URLs instead of monthly sitemaps")
+    parser.add_argument('--mongo-uri', default=None,
+                        help="Also upsert every article into MongoDB as it is scraped (e.g. mongodb://localhost:27017/)")
+    parser.add_argument('--mongo-database', default='almayadeen', help="MongoDB database of --mongo-uri")
+    parser.add_argument('--mongo-collection', default='articles', help="MongoDB collection of --mongo-uri")
+    parser.add_argument('--mongo-batch-size', type=int, default=500, help="Articles per MongoDB bulk write")
+    parser.add_argument('--mongo-flush-interval', type=float, default=2.0,
+                        help="Seconds an article waits at most before being written to MongoDB")
+    parser.add_argument('--frontier', default=os.path.join('data', 'url_frontier.sqlite3'),
+                        help="SQLite index of claimed URLs, so a URL listed in several sitemaps is scraped once")
+    parser.add_argument('--no-frontier', action='store_true', help="Scrape every URL of every sitemap")
+    parser.add_argument('--frontier-capacity', type=int, default=1000000,
+                        help="URLs the in-memory Bloom filter is sized for (it grows beyond that)")
+    parser.add_argument('--frontier-error-rate', type=float, default=0.01,
+                        help="False-positive rate of the Bloom filter (positives are checked in the index)")
+    parser.add_argument('--fingerprints', default=os.path.join('data', 'content_fingerprints.sqlite3'),
+                        help="Body hashes of saved pages, so re-fetched pages that did not change are not parsed again")
+    parser.add_argument('--no-fingerprints', action='store_true', help="Parse and save every fetched page")
+    parser.add_argument('--typed-articles', action='store_true',
+                        help="Save normalized articles in the .jsonl.gz files too: keyword list, int word_count, "
+                             "real dates, category/coverage (MongoDB always gets them)")
+    parser.add_argument('--memory-budget', type=int, default=256,
+                        help="MB of page bodies and parse trees held at once; fetching waits beyond it (0 = no limit)")
+    parser.add_argument('--schedule', action='store_true',
+                        help="Spend --max-articles on new and likely changed pages first (sitemap lastmod, update history)")
+    parser.add_argument('--schedule-file', default=os.path.join('data', 'recrawl_schedule.sqlite3'),
+                        help="SQLite file of the --schedule page history")
+    parser.add_argument('--min-change-probability', type=float, default=0.05,
+                        help="With --schedule, pages less likely than this to have changed are not fetched again")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    transport_options = dict(pool_size=args.pool_size, connect_timeout=args.connect_timeout,
+                             read_timeout=args.read_timeout, rate_limit=not args.no_rate_limit,
+                             initial_rate=args.initial_rate, max_rate=args.max_rate, max_retries=args.max_retries,
+                             http_cache=None if args.no_http_cache else args.http_cache,
+                             http_cache_size=args.http_cache_size, record_archive=args.record_archive,
+                             replay_archive=args.replay_archive, replay_latency=args.replay_latency,
+                             replay_bandwidth=args.replay_bandwidth)
+    http_transport = build_transport(args.concurrency, **transport_options)
+    crawl_checkpoint = None if args.no_checkpoint else CrawlCheckpoint(args.checkpoint)
+    sink_options = None
+    if args.mongo_uri:
+        sink_options = dict(uri=args.mongo_uri, database=args.mongo_database, collection_name=args.mongo_collection,
+                            batch_size=args.mongo_batch_size, flush_interval=args.mongo_flush_interval)
+    frontier_options = None
+    if not args.no_frontier:
+        frontier_options = dict(path=args.frontier, capacity=args.frontier_capacity,
+                                error_rate=args.frontier_error_rate)
+    if args.workers > 0 and args.schedule:
+        parser.error("--schedule plans a single-process crawl, it can't be combined with --workers")
+    if args.workers > 0:
+        from crawl_queue import LeaseQueue, enqueue_sitemaps, run_workers
+        with LeaseQueue(args.queue) as crawl_queue:
+            enqueue_sitemaps(crawl_queue, args.sitemap_index, http_transport, crawl_checkpoint, args.batch_size)
+        run_workers(args.queue, args.workers,
+                    {'checkpoint': None if args.no_checkpoint else args.checkpoint, 'engine': args.engine,
+                     'concurrency': args.concurrency, 'parser_processes': args.parser_processes,
+                     'max_articles': args.max_articles, 'metrics_path': args.metrics_file,
+                     'log_level': args.log_level, 'transport': transport_options, 'sink': sink_options,
+                     'frontier': frontier_options,
+                     'fingerprints': None if args.no_fingerprints else args.fingerprints,
+                     'typed_articles': args.typed_articles, 'memory_budget': args.memory_budget * 2 ** 20})
+        raise SystemExit(0)
+    article_sink = None
+    if sink_options:
+        from mongo_sink import MongoArticleSink
+        article_sink = MongoArticleSink(**sink_options)
+    url_frontier = None
+    if frontier_options:
+        from url_frontier import UrlFrontier
+        url_frontier = UrlFrontier(**frontier_options)
+    content_fingerprints = None if args.no_fingerprints else FingerprintStore(args.fingerprints)
+    recrawl_scheduler = None
+    if args.schedule:
+        recrawl_scheduler = RecrawlScheduler(args.schedule_file, args.min_change_probability)
+    crawl_metrics = CrawlMetrics()
+    if args.metrics_snapshots:
+        crawl_metrics.start_snapshots(args.metrics_snapshots, args.snapshot_interval)
+    try:
+        main(args.sitemap_index, args.max_articles, args.concurrency, http_transport, crawl_checkpoint, args.engine,
+             args.parser_processes, metrics=crawl_metrics, metrics_path=args.metrics_file, sink=article_sink,
+             frontier=url_frontier, fingerprints=content_fingerprints, typed_articles=args.typed_articles,
+             scheduler=recrawl_scheduler, memory_budget=args.memory_budget * 2 ** 20)
+    finally:
+        crawl_metrics.stop_snapshots()
+        if article_sink:
+            article_sink.close()